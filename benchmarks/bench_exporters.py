@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks of the exporters of particledata and fielddata
+
+The exporters are run with the fake warp module in 'fakewarp', so WARP is
+not needed. Each case (exporter, number of particles, grid size) runs in
+its own process, and the time-step saving the data is measured;
+ - seconds: Wall time of the time-step including writing the files.
+ - bytes: Total size of the saved files.
+ - particles_per_s, nodes_per_s, bytes_per_s: Throughput.
+ - peak_mb: Peak memory allocated while saving the same data again at the
+            next time-step (tracemalloc, which slows down the time-step,
+            so it is not used for 'seconds').
+ - maxrss_mb: Maximum resident memory of the process.
+The results are saved as JSON so they can be compared between versions.
+< e.g. python bench_exporters.py --particles 10000,100000 --grids 16,32
+                                 --output bench.json >
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.join(os.path.dirname(BENCH_DIR), "scripts_v_0.0.1")
+FAKEWARP_DIR = os.path.join(BENCH_DIR, "fakewarp")
+
+# Exporter cases; (dimension of saved grid or 0 for particles,
+#                  function registering the exporter for the time-steps)
+CASES = {
+    "ts_data": (0, lambda pd, fd, part, ts:
+                pd.ts_data(part=part, ts=ts)),
+    "ts_data_npy": (0, lambda pd, fd, part, ts:
+                    pd.ts_data(part=part, ts=ts, fileType="npy")),
+    "zcross_data": (0, lambda pd, fd, part, ts:
+                    pd.zcross_data(zPos=[0.25, 0.5, 0.75], ts=ts[0])),
+    "vtk_data": (0, lambda pd, fd, part, ts:
+                 pd.vtk_data(part=part, tsstart=ts[0], tsend=ts[-1])),
+    "phi_1d_xyz": (1, lambda pd, fd, part, ts:
+                   fd.phi_1d_xyz(direction="z", ts=ts)),
+    "phi_2d_xyz": (2, lambda pd, fd, part, ts:
+                   fd.phi_2d_xyz(plane="zx", ts=ts)),
+    "phi_3d_xyz": (3, lambda pd, fd, part, ts:
+                   fd.phi_3d_xyz(ts=ts)),
+    "phi_3d_vtk": (3, lambda pd, fd, part, ts:
+                   fd.phi_3d_vtk(ts=ts)),
+}
+
+# Time-steps before the time-step saving the data
+WARMUP_STEPS = 20
+
+
+# -------------------------------------------------------------------------- #
+
+def run_case(name, npart, ngrid):
+    """
+This function runs one case in this process and returns the result.
+    """
+    sys.path[:0] = [FAKEWARP_DIR, SCRIPTS_DIR]
+    import warp
+    warp.setup(nx=ngrid, ny=ngrid, nz=ngrid)
+    import asyncwriter
+    import fielddata
+    import particledata
+    part = warp.Species(npart=npart)
+    dim, register = CASES[name]
+    workDir = tempfile.mkdtemp(prefix="bench_")
+    cwd = os.getcwd()
+    os.chdir(workDir)
+    try:
+        register(particledata, fielddata, part,
+                 [WARMUP_STEPS + 1, WARMUP_STEPS + 2])
+        warp.step(WARMUP_STEPS)
+        t0 = time.time()
+        warp.step(1)
+        asyncwriter.flush()
+        seconds = time.time() - t0
+        nbytes = _dir_size(workDir)
+        tracemalloc.start()
+        warp.step(1)
+        asyncwriter.flush()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workDir, ignore_errors=True)
+    result = {"exporter": name, "particles": npart, "grid": ngrid,
+              "seconds": seconds, "bytes": nbytes,
+              "bytes_per_s": nbytes / seconds,
+              "peak_mb": peak / 1024.**2,
+              "maxrss_mb": resource.getrusage(
+                      resource.RUSAGE_SELF).ru_maxrss / 1024.}
+    if dim == 0:
+        result["particles_per_s"] = npart / seconds
+    else:
+        result["nodes_per_s"] = (ngrid + 1)**dim / seconds
+    return result
+
+
+def _dir_size(workDir):
+    nbytes = 0
+    for root, dirs, files in os.walk(workDir):
+        for fn in files:
+            nbytes += os.path.getsize(os.path.join(root, fn))
+    return nbytes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--particles", default="10000,100000",
+                        help="numbers of particles separated by comma")
+    parser.add_argument("--grids", default="16,32",
+                        help="grid sizes (nx=ny=nz) separated by comma")
+    parser.add_argument("--exporters", default=",".join(sorted(CASES)),
+                        help="exporters separated by comma")
+    parser.add_argument("--output", default=None,
+                        help="JSON file of the results {Default: stdout}")
+    parser.add_argument("--case", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.case is not None:
+        name, npart, ngrid = args.case.split(":")
+        json.dump(run_case(name, int(npart), int(ngrid)), sys.stdout)
+        return
+    particles = [int(float(nn)) for nn in args.particles.split(",")]
+    grids = [int(nn) for nn in args.grids.split(",")]
+    results = []
+    for name in args.exporters.split(","):
+        assert name in CASES, ValueError(
+                'Exporter must be one of {names}'.format(
+                        names=", ".join(sorted(CASES))))
+        # Particle exporters depend on the particles, field exporters on
+        # the grid
+        if CASES[name][0] == 0:
+            sizes = [(npart, grids[0]) for npart in particles]
+        else:
+            sizes = [(particles[0], ngrid) for ngrid in grids]
+        for npart, ngrid in sizes:
+            out = subprocess.check_output(
+                    [sys.executable, os.path.abspath(__file__), "--case",
+                     "{n}:{p}:{g}".format(n=name, p=npart, g=ngrid)])
+            result = json.loads(out.decode())
+            sys.stderr.write("{exporter:12s} particles={particles:<9d} "
+                             "grid={grid:<4d} {seconds:9.4f} s "
+                             "{bytes:>12d} B\n".format(**result))
+            results.append(result)
+    report = {"python": sys.version.split()[0], "results": results}
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=1)
+        sys.stdout.write("\n")
+    else:
+        outFile = open(args.output, "w")
+        json.dump(report, outFile, indent=1)
+        outFile.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+"""
+Fake warp module for the benchmarks
+
+This is NOT WARP. It has only the names used by particledata and fielddata
+('top', 'w3d', 'getphi', 'getrho', 'getselfe', 'callfromafterstep',
+species and constants), so the cost of the exporters can be measured
+without WARP.
+The grid and the species are made by 'setup', and 'step' moves the
+particles and calls the functions registered by 'callfromafterstep'.
+"""
+
+import numpy as np
+
+
+class _Package(object):
+    pass
+
+
+top = _Package()
+w3d = _Package()
+
+clight = 2.99792458e8
+echarge = 1.602176634e-19
+
+_afterstep = []
+_species = []
+_phi = None
+_rho = None
+
+
+# -------------------------------------------------------------------------- #
+
+def setup(nx=32, ny=32, nz=32, seed=0):
+    """
+This function makes the grid of (nx+1, ny+1, nz+1) points with a
+synthetic potential, and resets the time-step and the species.
+    """
+    global _phi, _rho
+    w3d.nx, w3d.ny, w3d.nz = nx, ny, nz
+    w3d.xmmin, w3d.xmmax = -0.01, 0.01
+    w3d.ymmin, w3d.ymmax = -0.01, 0.01
+    w3d.zmmin, w3d.zmmax = 0., 1.
+    w3d.dx = (w3d.xmmax - w3d.xmmin) / nx
+    w3d.dy = (w3d.ymmax - w3d.ymmin) / ny
+    w3d.dz = (w3d.zmmax - w3d.zmmin) / nz
+    w3d.nxlocal, w3d.nylocal, w3d.nzlocal = nx, ny, nz
+    top.it = 0
+    top.time = 0.
+    top.dt = 1e-10
+    top.fsdecomp = _Package()
+    for ax, nn in (("x", nx), ("y", ny), ("z", nz)):
+        setattr(top.fsdecomp, "i" + ax, np.array([0]))
+        setattr(top.fsdecomp, "n" + ax, np.array([nn]))
+        setattr(top.fsdecomp, "i" + ax + "proc", 0)
+    rand = np.random.RandomState(seed)
+    xx = np.linspace(w3d.xmmin, w3d.xmmax, nx + 1)[:, None, None]
+    yy = np.linspace(w3d.ymmin, w3d.ymmax, ny + 1)[None, :, None]
+    zz = np.linspace(w3d.zmmin, w3d.zmmax, nz + 1)[None, None, :]
+    _phi = 1e3 * np.exp(-(xx**2 + yy**2) / 1e-5) * np.cos(np.pi * zz) + \
+        rand.rand(nx + 1, ny + 1, nz + 1)
+    _rho = 1e-6 * np.exp(-(xx**2 + yy**2) / 1e-5) * np.ones_like(zz)
+    del _afterstep[:]
+    del _species[:]
+
+
+def callfromafterstep(func):
+    _afterstep.append(func)
+    return func
+
+
+def step(nn=1):
+    """
+This function advances 'nn' time-steps.
+    """
+    for i in range(nn):
+        for sp in _species:
+            sp._push()
+        _phi[...] += 1e-6 * np.sin(top.it * 0.01)
+        top.it += 1
+        top.time += top.dt
+        for func in list(_afterstep):
+            func()
+
+
+def getphi(ix=None, iy=None, iz=None, bcast=0, local=0, **kw):
+    return _phi[_index(ix, iy, iz)]
+
+
+def getrho(ix=None, iy=None, iz=None, bcast=0, local=0, **kw):
+    return _rho[_index(ix, iy, iz)]
+
+
+def getselfe(comp=None, ix=None, iy=None, iz=None, bcast=0, local=0, **kw):
+    axis = "xyz".index(comp)
+    dd = (w3d.dx, w3d.dy, w3d.dz)[axis]
+    return -np.gradient(_phi, dd, axis=axis)[_index(ix, iy, iz)]
+
+
+def _index(ix, iy, iz):
+    return tuple(slice(None) if ii is None else ii for ii in (ix, iy, iz))
+
+# -------------------------------------------------------------------------- #
+
+
+# -------------------------------------------------------------------------- #
+
+class Species(object):
+    """
+Fake species of 'npart' particles uniformly distributed in the grid.
+    """
+
+    def __init__(self, npart=10000, mass=1.6726e-27, charge=1.602e-19,
+                 weight=1., seed=1):
+        rand = np.random.RandomState(seed)
+        self.mass = mass
+        self.charge = charge
+        self.sw = weight
+        self.x = rand.uniform(w3d.xmmin, w3d.xmmax, npart) * 0.5
+        self.y = rand.uniform(w3d.ymmin, w3d.ymmax, npart) * 0.5
+        self.z = rand.uniform(w3d.zmmin, w3d.zmmax, npart)
+        self.vx = rand.normal(0., 1e4, npart)
+        self.vy = rand.normal(0., 1e4, npart)
+        self.vz = rand.normal(1e7, 1e4, npart)
+        self.pid = np.arange(1, npart + 1, dtype=np.float64)
+        self.w = np.ones(npart)
+        self.zold = self.z.copy()
+        _species.append(self)
+
+    def _push(self):
+        self.zold = self.z.copy()
+        self.x += self.vx * top.dt
+        self.y += self.vy * top.dt
+        self.z += self.vz * top.dt
+        # Particles leaving the grid are injected again (DC beam)
+        lost = self.z > w3d.zmmax
+        self.z[lost] -= (w3d.zmmax - w3d.zmmin)
+        self.zold[lost] -= (w3d.zmmax - w3d.zmmin)
+
+    def getn(self, gather=1, **kw):
+        return len(self.x)
+
+    def getx(self, gather=1, **kw):
+        return self.x.copy()
+
+    def gety(self, gather=1, **kw):
+        return self.y.copy()
+
+    def getz(self, gather=1, **kw):
+        return self.z.copy()
+
+    def getvx(self, gather=1, **kw):
+        return self.vx.copy()
+
+    def getvy(self, gather=1, **kw):
+        return self.vy.copy()
+
+    def getvz(self, gather=1, **kw):
+        return self.vz.copy()
+
+    def getpid(self, gather=1, **kw):
+        return self.pid.copy()
+
+    def getw(self, gather=1, **kw):
+        return self.w.copy()
+
+# -------------------------------------------------------------------------- #
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+"""
+Fake 'ZCrossingParticles' for the benchmarks
+
+It collects the particles of all fake species crossing 'zz' during each
+time-step, same as 'ZCrossingParticles(zz=..., laccumulate=1)' of WARP.
+"""
+
+import numpy as np
+
+import warp
+
+
+_NAMES = ("x", "y", "vx", "vy", "vz", "pid")
+
+
+class ZCrossingParticles(object):
+
+    def __init__(self, zz=0., laccumulate=1, **kw):
+        self.zz = zz
+        self.laccumulate = laccumulate
+        self.clear()
+        # Crossings are collected before the exporters are called
+        warp._afterstep.insert(0, self._collect)
+
+    def _collect(self):
+        if not self.laccumulate:
+            self.clear()
+        for sp in warp._species:
+            crossed = np.flatnonzero((sp.zold < self.zz) & (sp.z >= self.zz))
+            if len(crossed) == 0:
+                continue
+            for name in _NAMES:
+                self.data[name].append(getattr(sp, name)[crossed])
+            self.data["t"].append(np.full(len(crossed), warp.top.time))
+
+    def clear(self):
+        self.data = dict((name, []) for name in _NAMES + ("t",))
+
+    def _get(self, name):
+        if len(self.data[name]) == 0:
+            return np.zeros(0)
+        return np.concatenate(self.data[name])
+
+    def getn(self, **kw):
+        return sum(len(arr) for arr in self.data["x"])
+
+    def getx(self, **kw):
+        return self._get("x")
+
+    def gety(self, **kw):
+        return self._get("y")
+
+    def gett(self, **kw):
+        return self._get("t")
+
+    def getvx(self, **kw):
+        return self._get("vx")
+
+    def getvy(self, **kw):
+        return self._get("vy")
+
+    def getvz(self, **kw):
+        return self._get("vz")
+
+    def getpid(self, **kw):
+        return self._get("pid")
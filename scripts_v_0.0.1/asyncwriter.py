@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+
+"""
+asyncwriter module test version
+
+Created on Thu May 17 2018
+
+@author: K. Yoo, 
+Intense Beam and Accelerator Laboratory(IBAL), 
+Ulsan National Institute of Science and Technology(UNIST),
+Republic of Korea
+"""
+
+# ========================================================================== #
+#                    Module for Writing Data in Background                   #
+# -------------------------------------------------------------------------- #
+#                                                                            #
+# 1. Background writer threads with a bounded memory budget                  #
+# 2. Order of the data appended to the same file                             #
+#                                                                            #
+# ========================================================================== #
+
+"""
+The functions registered with 'callfromafterstep' in particledata and
+fielddata only copy the data of WARP and pass the writing of the file
+to 'submit' of this module.
+Without 'enable', 'submit' writes the file immediately, same as before.
+After 'enable', the files are written by the background threads while
+WARP continues the next time-steps.
+< e.g. import asyncwriter
+       asyncwriter.enable(nWorkers=2, maxBytes=1024*1024**2) >
+All remaining data is written when the script exits, or by 'flush'.
+With more than one thread, the data appended to the same file is kept in 
+the order of submitting by 'WriteSequence' of the file.
+< e.g. sequence = asyncwriter.WriteSequence()
+       sequence.submit(append_data, fileName, data) >
+"""
+
+import atexit
+import collections
+import threading
+
+import numpy as np
+
+
+# -------------------------------------------------------------------------- #
+
+class AsyncWriter(object):
+    """
+This class writes the data with the background threads.
+Arguments are following;
+ - nWorkers: Number of the background threads.
+             {Default=1}
+ - maxBytes: Memory budget of the data waiting to be written in bytes.
+             When the data exceeds this, 'submit' waits until the
+             background threads write some of them.
+             {Default=512*1024**2  (512 MB)}
+    """
+
+    def __init__(self, nWorkers=1, maxBytes=512*1024**2):
+        assert nWorkers >= 1, ValueError(
+                'Number of workers must be larger than 0')
+        assert maxBytes > 0, ValueError(
+                'Memory budget must be larger than 0')
+        self.maxBytes = maxBytes
+        self.jobs = collections.deque()
+        self.pendingBytes = 0
+        self.nActive = 0
+        self.error = None
+        self.closed = False
+        self.cond = threading.Condition()
+        self.workers = []
+        for i in range(nWorkers):
+            worker = threading.Thread(target=self._work,
+                                      name="asyncwriter-{i}".format(i=i))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, func, *args):
+        """
+This function queues 'func(*args)'.
+The arrays in 'args' must not be changed after submitting them, so
+the caller passes the copies of WARP arrays.
+        """
+        nbytes = _nbytes(args)
+        with self.cond:
+            self._raise_error()
+            assert not self.closed, ValueError(
+                    'Writer is already closed')
+            while (self.pendingBytes > 0 and
+                   self.pendingBytes + nbytes > self.maxBytes):
+                self.cond.wait()
+                self._raise_error()
+            self.jobs.append((func, args, nbytes))
+            self.pendingBytes += nbytes
+            self.cond.notify_all()
+
+    def flush(self):
+        """
+This function waits until all queued data is written.
+        """
+        with self.cond:
+            while self.jobs or self.nActive > 0:
+                self.cond.wait()
+            self._raise_error()
+
+    def close(self):
+        """
+This function writes all queued data and stops the background threads.
+        """
+        with self.cond:
+            if self.closed:
+                return
+            while self.jobs or self.nActive > 0:
+                self.cond.wait()
+            self.closed = True
+            self.cond.notify_all()
+        for worker in self.workers:
+            worker.join()
+        with self.cond:
+            self._raise_error()
+
+    def _work(self):
+        while True:
+            with self.cond:
+                while not self.jobs and not self.closed:
+                    self.cond.wait()
+                if not self.jobs:
+                    return
+                func, args, nbytes = self.jobs.popleft()
+                self.nActive += 1
+            try:
+                func(*args)
+            except Exception as err:
+                with self.cond:
+                    if self.error is None:
+                        self.error = err
+            finally:
+                with self.cond:
+                    self.nActive -= 1
+                    self.pendingBytes -= nbytes
+                    self.cond.notify_all()
+
+    def _raise_error(self):
+        # Errors of the background threads are raised in the WARP script
+        if self.error is not None:
+            err, self.error = self.error, None
+            raise err
+
+# -------------------------------------------------------------------------- #
+
+
+# -------------------------------------------------------------------------- #
+
+_writer = None
+
+
+def enable(nWorkers=1, maxBytes=512*1024**2):
+    """
+This function starts the background writing for all exporters.
+Arguments are same with 'AsyncWriter'.
+    """
+    global _writer
+    if _writer is not None:
+        _writer.close()
+    _writer = AsyncWriter(nWorkers=nWorkers, maxBytes=maxBytes)
+    return _writer
+
+
+def disable():
+    """
+This function writes all queued data and returns to the writing
+in the time-step loop.
+    """
+    global _writer
+    if _writer is not None:
+        writer, _writer = _writer, None
+        writer.close()
+
+
+def submit(func, *args):
+    """
+This function writes 'func(*args)' in the background after 'enable',
+or immediately otherwise.
+    """
+    if _writer is None:
+        func(*args)
+    else:
+        _writer.submit(func, *args)
+
+
+def flush():
+    """
+This function waits until all queued data is written.
+    """
+    if _writer is not None:
+        _writer.flush()
+
+
+def _nbytes(args):
+    nbytes = 0
+    for arg in args:
+        if isinstance(arg, np.ndarray):
+            nbytes += arg.nbytes
+        elif isinstance(arg, (list, tuple)):
+            nbytes += _nbytes(arg)
+        elif isinstance(arg, dict):
+            nbytes += _nbytes(list(arg.values()))
+    return nbytes
+
+
+atexit.register(disable)
+
+# -------------------------------------------------------------------------- #
+
+
+# -------------------------------------------------------------------------- #
+
+class WriteSequence(object):
+    """
+This class keeps the order of the data appended to one file.
+Each data takes its order by 'next_seq' when it is submitted, and 'run' 
+writes it only after all data submitted before it.
+Since the background threads take the data in the order of submitting, 
+the data waiting for its turn never blocks the data before it.
+Arguments are following;
+ - submitFunc: The function submitting the data, same with 'submit' of 
+               this module (e.g. 'submit' of 'iobudget.OutputControl').
+               {Default=None  ('submit' of this module)}
+    """
+
+    def __init__(self, submitFunc=None):
+        self.submitFunc = submit if submitFunc is None else submitFunc
+        self.nSeq = 0
+        self.nWritten = 0
+        # Orders released without being written
+        self.skipped = set()
+        self.cond = threading.Condition()
+
+    def submit(self, func, *args):
+        """
+This function submits 'func(*args)' with the order of the next data.
+If submitting fails (e.g. by an error of the background threads), the 
+order is released, so the data submitted later is not blocked.
+        """
+        seq = self.next_seq()
+        try:
+            self.submitFunc(self.run, seq, func, *args)
+        except BaseException:
+            self._release(seq)
+            raise
+
+    def next_seq(self):
+        """
+This function returns the order of the next data to be submitted.
+        """
+        with self.cond:
+            seq = self.nSeq
+            self.nSeq += 1
+        return seq
+
+    def run(self, seq, func, *args):
+        """
+This function calls 'func(*args)' after the data of the orders before 
+'seq' are written, and returns its result.
+        """
+        with self.cond:
+            while self.nWritten != seq:
+                self.cond.wait()
+        try:
+            return func(*args)
+        finally:
+            with self.cond:
+                self.nWritten += 1
+                self._skip()
+                self.cond.notify_all()
+
+    def _release(self, seq):
+        # The order not submitted is passed when its turn comes; it is 
+        # already passed if 'run' was called without the background threads
+        with self.cond:
+            if seq >= self.nWritten:
+                self.skipped.add(seq)
+                self._skip()
+                self.cond.notify_all()
+
+    def _skip(self):
+        while self.nWritten in self.skipped:
+            self.skipped.remove(self.nWritten)
+            self.nWritten += 1
+
+# -------------------------------------------------------------------------- #
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+
+"""
+binarydata module test version
+
+Created on Thu May 17 2018
+
+@author: K. Yoo, 
+Intense Beam and Accelerator Laboratory(IBAL), 
+Ulsan National Institute of Science and Technology(UNIST),
+Republic of Korea
+"""
+
+# ========================================================================== #
+#                    Module for Binary Columnar Data Files                   #
+# -------------------------------------------------------------------------- #
+#                                                                            #
+# 1. Columnar snapshot in .npy format (memory-mappable)                      #
+# 2. Appendable stream of columnar blocks (.npys)                            #
+# 3. Records of arrays of any shape (e.g. trajectories of particles)         #
+#                                                                            #
+# ========================================================================== #
+
+"""
+This module is used by particledata and fielddata when 'fileType="npy"'.
+A snapshot is saved as one .npy file holding a single record, and each
+field of the record is one column (e.g. x, y, z, vx, vy, vz) stored as
+a contiguous array. The column names and data types are in the .npy header.
+The file can be opened without reading all columns;
+< e.g. data = np.load("time_particle_data_100_ts.npy", mmap_mode="r")
+       xx = data["x"] >
+A stream (.npys) is the sequence of such records appended to one file, 
+which is used to save data by parts during the simulation.
+< e.g. blocks = load_stream("z_particle_data_0.5m.npys")
+       xx = stream_column(blocks, "x") >
+The records of 'append_arrays' have the arrays of any shape, which are 
+joined along their last axis by 'stream_array'.
+"""
+
+import os
+
+import numpy as np
+
+
+# Columns which are always saved with "float64"
+FULL_PRECISION_COLUMNS = ("pid",)
+
+
+# -------------------------------------------------------------------------- #
+
+def column_dtype(names=None, nn=0, dtype="float64"):
+    """
+This function returns the record data type of a columnar snapshot.
+Arguments are following;
+ - names: This is the list of column names.
+          < e.g. names=["x", "y", "z"] >
+ - nn: This is the number of rows in each column.
+ - dtype: Data type of the columns.
+          < "float32", "float64" >
+          {Default="float64"}
+          Particle id ("pid") is always saved with "float64" so that
+          it is not rounded.
+    """
+    assert names is not None, ValueError(
+            'Column names are not defined for data')
+    assert dtype=="float32" or dtype=="float64", ValueError(
+            'Data type must be one of "float32" and "float64"')
+    colType = "<f4" if dtype == "float32" else "<f8"
+    fields = []
+    for name in names:
+        if name in FULL_PRECISION_COLUMNS:
+            fields.append((name, "<f8", (nn,)))
+        else:
+            fields.append((name, colType, (nn,)))
+    return np.dtype(fields)
+
+
+def save_columns(fileName=None, names=None, columns=None, dtype="float64"):
+    """
+This function saves the columns in the file 'fileName' with .npy format.
+Arguments are following;
+ - fileName: Name of the file including the path and ".npy".
+ - names: This is the list of column names.
+ - columns: This is the list of arrays having the same length as 'names'.
+ - dtype: Data type of the columns.
+          < "float32", "float64" >
+          {Default="float64"}
+    """
+    assert fileName is not None, ValueError(
+            'File name is not defined for data')
+    assert columns is not None, ValueError(
+            'Columns are not defined for data')
+    record = _make_record(names, columns, dtype)
+    np.save(fileName, record)
+
+
+def _make_record(names, columns, dtype):
+    assert len(names) == len(columns), ValueError(
+            'Number of column names must be same with number of columns')
+    nn = len(columns[0]) if len(columns) > 0 else 0
+    record = np.zeros((), dtype=column_dtype(names, nn, dtype))
+    for name, col in zip(names, columns):
+        record[name] = col
+    return record
+
+
+def load_columns(fileName=None, mmap=True):
+    """
+This function opens the file saved by 'save_columns'.
+The columns are accessed by their names,
+< e.g. load_columns("z_particle_data_0.5m.npy")["vz"] >
+and with 'mmap=True' only the columns accessed are read from the disk.
+    """
+    assert fileName is not None, ValueError(
+            'File name is not defined for data')
+    if mmap:
+        return np.load(fileName, mmap_mode="r")
+    return np.load(fileName)
+
+# -------------------------------------------------------------------------- #
+
+
+# -------------------------------------------------------------------------- #
+
+def append_columns(fileName=None, names=None, columns=None, dtype="float64"):
+    """
+This function appends the columns to the stream file 'fileName' (.npys).
+The file is made if it does not exist.
+Arguments are same with 'save_columns'.
+    """
+    assert fileName is not None, ValueError(
+            'File name is not defined for data')
+    assert columns is not None, ValueError(
+            'Columns are not defined for data')
+    record = _make_record(names, columns, dtype)
+    streamFile = open(fileName, "ab")
+    np.save(streamFile, record)
+    streamFile.close()
+
+
+def load_stream(fileName=None, mmap=True):
+    """
+This function opens the stream file saved by 'append_columns'.
+It returns the list of the records appended to the file.
+With 'mmap=True' only the headers are read here, and the columns are 
+read from the disk when they are accessed.
+    """
+    assert fileName is not None, ValueError(
+            'File name is not defined for data')
+    blocks = []
+    fileSize = os.path.getsize(fileName)
+    offset = 0
+    while offset < fileSize:
+        record, offset = load_record(fileName, offset, mmap)
+        blocks.append(record)
+    return blocks
+
+
+def load_record(fileName=None, offset=0, mmap=True):
+    """
+This function opens one record saved in .npy format at the byte 'offset' 
+of the file 'fileName'.
+It returns the record and the byte offset of the next record.
+With 'mmap=True' only the header is read here.
+    """
+    assert fileName is not None, ValueError(
+            'File name is not defined for data')
+    streamFile = open(fileName, "rb")
+    streamFile.seek(offset)
+    version = np.lib.format.read_magic(streamFile)
+    if version == (1, 0):
+        shape, fortran, recType = \
+            np.lib.format.read_array_header_1_0(streamFile)
+    else:
+        shape, fortran, recType = \
+            np.lib.format.read_array_header_2_0(streamFile)
+    offset = streamFile.tell()
+    if mmap:
+        record = np.memmap(fileName, dtype=recType, mode="r", 
+                           offset=offset, shape=shape)
+    else:
+        record = np.fromfile(streamFile, dtype=recType, 
+                             count=1).reshape(shape)
+    streamFile.close()
+    return record, offset + recType.itemsize
+
+
+def stream_column(blocks=None, name=None):
+    """
+This function joins the column 'name' of all records of a stream.
+Only this column is read from the disk.
+    """
+    assert blocks is not None, ValueError(
+            'Records are not defined for data')
+    if len(blocks) == 0:
+        return np.zeros(0)
+    return np.concatenate([np.ravel(block[name]) for block in blocks])
+
+# -------------------------------------------------------------------------- #
+
+
+# -------------------------------------------------------------------------- #
+
+def array_record(names=None, arrays=None, dtype=None):
+    """
+This function returns one record having a field of each array, which 
+keeps the shape of the array.
+Arguments are following;
+ - names: This is the list of the names of the arrays.
+ - arrays: This is the list of the arrays.
+ - dtype: Data type of the arrays except 'pid'.
+          < "float32", "float64" >
+          {Default=None  (data types of the arrays)}
+    """
+    assert names is not None and arrays is not None, ValueError(
+            'Arrays are not defined for data')
+    assert len(names) == len(arrays), ValueError(
+            'Number of names must be same with number of arrays')
+    arrays = [np.asarray(arr) for arr in arrays]
+    fields = []
+    for name, arr in zip(names, arrays):
+        if dtype is None or name in FULL_PRECISION_COLUMNS:
+            fields.append((name, arr.dtype.str, arr.shape))
+        else:
+            fields.append((name, "<f4" if dtype == "float32" else "<f8", 
+                           arr.shape))
+    record = np.zeros((), dtype=fields)
+    for name, arr in zip(names, arrays):
+        record[name] = arr
+    return record
+
+
+def append_arrays(fileName=None, names=None, arrays=None, dtype=None):
+    """
+This function appends the arrays as one record of 'array_record' to the 
+stream file 'fileName' (.npys).
+The file is made if it does not exist.
+    """
+    assert fileName is not None, ValueError(
+            'File name is not defined for data')
+    record = array_record(names, arrays, dtype)
+    streamFile = open(fileName, "ab")
+    np.save(streamFile, record)
+    streamFile.close()
+
+
+def stream_array(blocks=None, name=None):
+    """
+This function joins the array 'name' of all records of a stream along 
+its last axis.
+< e.g. xx = stream_array(load_stream("trajectory_particle_data.npys"), "x")
+       xx[i, j]          (i-th particle at j-th time-step) >
+    """
+    assert blocks is not None, ValueError(
+            'Records are not defined for data')
+    if len(blocks) == 0:
+        return np.zeros(0)
+    return np.concatenate([block[name] for block in blocks], axis=-1)
+
+# -------------------------------------------------------------------------- #
@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+
+"""
+dataset module test version
+
+Created on Thu May 17 2018
+
+@author: K. Yoo, 
+Intense Beam and Accelerator Laboratory(IBAL), 
+Ulsan National Institute of Science and Technology(UNIST),
+Republic of Korea
+"""
+
+# ========================================================================== #
+#                    Module for Reading Saved Data of a Run                  #
+# -------------------------------------------------------------------------- #
+#                                                                            #
+# 1. Finding the data saved by particledata and fielddata in a run           #
+# 2. Reading the columns of one time-step or z-position when they are used   #
+#                                                                            #
+# ========================================================================== #
+
+"""
+This module does not need WARP, so it is used in the analysis scripts.
+'Run' finds all data in the directory where the WARP script was run,
+by the names of the files saved by the exporters;
+ - 'fileName_time-step_ts.txt', '.npy' and '.json' (parallel) of ts_data,
+   phi_1d_xyz, phi_2d_xyz, phi_3d_xyz and efield_1d_xyz, ...
+ - 'fileName_z-position m.txt', '.npy' and '.npys' of zcross_data
+Each series of files is indexed by the time-step or the z-position.
+< e.g. import dataset as ds
+       run = ds.Run("./")
+       run.particles.keys            (all saved time-steps)
+       xx = run.particles[500].x
+       vz = run.zcross[0.5].vz
+       pp = run["E_potential_2d_data/E_potential_data"][100].phi >
+The columns are read only when they are used. The .npy files are
+memory-mapped, so only the accessed columns are read from the disk.
+The .txt files are parsed once and saved as .npy in the directory
+'.npycache' beside them, which is memory-mapped from the next time.
+"""
+
+import json
+import os
+import re
+
+import numpy as np
+
+import binarydata
+
+
+# Directory of the .npy files made from the .txt files
+CACHE_DIR = ".npycache"
+
+_TS_PATTERN = re.compile(
+        r"^(?P<base>.+)_(?P<key>\d+)_ts(?P<rank>_r\d+)?\."
+        r"(?P<ext>txt|npy|json)$")
+_Z_PATTERN = re.compile(
+        r"^(?P<base>.+)_(?P<key>[-+0-9.eE]+)m\.(?P<ext>txt|npy|npys)$")
+
+
+# -------------------------------------------------------------------------- #
+
+class Run(object):
+    """
+This class finds the series of the data saved in the directory of a run.
+Arguments are following;
+ - runDir: Directory where the WARP script was run.
+           {Default="./"}
+ - cache: If this is True, the .txt files are saved as .npy in the
+          directory '.npycache' after they are parsed.
+          {Default=True}
+Each series is named as 'dirName/fileName' of the exporter, and has the
+kind of data; "particles" (ts_data), "zcross" (zcross_data), "phi"
+(phi_1d_xyz, phi_2d_xyz, phi_3d_xyz) or "efield" (efield_1d_xyz, ...).
+< e.g. run.names                         (names of all series)
+       run["timestep_particle_data/time_particle_data"]
+       run.particles                     (the only series of "particles") >
+    """
+
+    def __init__(self, runDir="./", cache=True):
+        assert os.path.isdir(runDir), ValueError(
+                'Directory {runDir} does not exist'.format(runDir=runDir))
+        self.runDir = runDir
+        self.cache = cache
+        self.series = {}
+        for dirName in sorted(os.listdir(runDir)):
+            dirPath = os.path.join(runDir, dirName)
+            if os.path.isdir(dirPath) and dirName != CACHE_DIR:
+                self._find_series(dirName, dirPath)
+
+    def _find_series(self, dirName, dirPath):
+        groups = {}
+        for fn in sorted(os.listdir(dirPath)):
+            match = _TS_PATTERN.match(fn)
+            kind = "ts"
+            if match is None:
+                match = _Z_PATTERN.match(fn)
+                kind = "zcross"
+            if match is None:
+                continue
+            if kind == "ts" and match.group("rank") is not None:
+                # Shards are read by the .json index
+                continue
+            if kind == "zcross":
+                try:
+                    key = float(match.group("key"))
+                except ValueError:
+                    continue
+            else:
+                key = int(match.group("key"))
+            name = "{dirName}/{base}".format(dirName=dirName,
+                                             base=match.group("base"))
+            files = groups.setdefault((name, kind), {})
+            fileName = os.path.join(dirPath, fn)
+            # The .npy file is preferred when both are saved
+            if key not in files or fn.endswith(".npy"):
+                files[key] = fileName
+        for (name, kind), files in groups.items():
+            self.series[name] = Series(name, kind, files, self.cache)
+
+    @property
+    def names(self):
+        return sorted(self.series)
+
+    def __getitem__(self, name):
+        assert name in self.series, ValueError(
+                'Series {name} is not found in {runDir}'.format(
+                        name=name, runDir=self.runDir))
+        return self.series[name]
+
+    def find(self, kind):
+        """
+This function returns the list of the series of the kind 'kind'.
+< "particles", "zcross", "phi", "efield" >
+        """
+        return [self.series[name] for name in self.names
+                if self.series[name].kind == kind]
+
+    def _only(self, kind):
+        found = self.find(kind)
+        assert len(found) == 1, ValueError(
+                'There are {nn} series of {kind}, use run[name] '
+                'with one of {names}'.format(
+                        nn=len(found), kind=kind,
+                        names=", ".join(sr.name for sr in found)))
+        return found[0]
+
+    @property
+    def particles(self):
+        return self._only("particles")
+
+    @property
+    def zcross(self):
+        return self._only("zcross")
+
+    @property
+    def phi(self):
+        return self._only("phi")
+
+    @property
+    def efield(self):
+        return self._only("efield")
+
+# -------------------------------------------------------------------------- #
+
+
+# -------------------------------------------------------------------------- #
+
+class Series(object):
+    """
+This class is one series of files saved by an exporter, indexed by the
+time-step or the z-position.
+The data of each file is 'Frame', made when it is used first.
+< e.g. series.keys                 (sorted time-steps or z-positions)
+       series[500]                 (Frame at time-step 500)
+       for key, frame in series.items(): ... >
+    """
+
+    def __init__(self, name, kind, files, cache=True):
+        self.name = name
+        self.files = files
+        self.cache = cache
+        self.keys = sorted(files)
+        self.frames = {}
+        self.kind = kind
+        if kind == "ts":
+            # Particle data and field data have the same file names
+            names = self[self.keys[0]].columns
+            if "Ex" in names:
+                self.kind = "efield"
+            elif "phi" in names:
+                self.kind = "phi"
+            else:
+                self.kind = "particles"
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def __contains__(self, key):
+        return self._key(key) is not None
+
+    def __getitem__(self, key):
+        fileKey = self._key(key)
+        assert fileKey is not None, ValueError(
+                '{key} is not saved in {name}'.format(key=key,
+                                                      name=self.name))
+        if fileKey not in self.frames:
+            self.frames[fileKey] = Frame(self.files[fileKey], self.cache)
+        return self.frames[fileKey]
+
+    def items(self):
+        for key in self.keys:
+            yield key, self[key]
+
+    def _key(self, key):
+        if key in self.files:
+            return key
+        # z-positions are compared with the rounding of the file names
+        if self.kind == "zcross":
+            for fileKey in self.keys:
+                if np.isclose(fileKey, key, rtol=1e-9, atol=1e-12):
+                    return fileKey
+        return None
+
+    def __repr__(self):
+        return "<Series {name} ({kind}, {nn} files)>".format(
+                name=self.name, kind=self.kind, nn=len(self.keys))
+
+# -------------------------------------------------------------------------- #
+
+
+# -------------------------------------------------------------------------- #
+
+class Frame(object):
+    """
+This class is the data of one file (or of all shards of a parallel run).
+The columns are accessed by their names without the units.
+< e.g. frame.columns                (e.g. ["x", "y", "z", "vx", ...])
+       frame.x, frame["vz"]
+       len(frame)                   (number of rows) >
+    """
+
+    def __init__(self, fileName, cache=True):
+        self.fileName = fileName
+        self.cache = cache
+        if fileName.endswith(".json"):
+            indexFile = open(fileName, "r")
+            index = json.load(indexFile)
+            indexFile.close()
+            indexDir = os.path.dirname(fileName)
+            shards = sorted(index["shards"], key=lambda sh: sh["rank"])
+            self.fileNames = [os.path.join(indexDir, sh["file"])
+                              for sh in shards]
+        else:
+            self.fileNames = [fileName]
+        # Only the header is read here, and the data when it is used
+        self.columns = _column_names(self.fileNames[0])
+        self.sources = None
+        self.data = {}
+
+    def __getitem__(self, name):
+        assert name in self.columns, ValueError(
+                'Column must be one of {names}'.format(
+                        names=", ".join(self.columns)))
+        if self.sources is None:
+            self.sources = [_open_source(fn, self.cache)
+                            for fn in self.fileNames]
+        if name not in self.data:
+            cols = [get(name) for get in self.sources]
+            if len(cols) == 1:
+                self.data[name] = cols[0]
+            else:
+                self.data[name] = np.concatenate(cols)
+        return self.data[name]
+
+    def __getattr__(self, name):
+        if name.startswith("__") or name not in self.__dict__.get(
+                "columns", ()):
+            raise AttributeError(name)
+        return self[name]
+
+    def __len__(self):
+        if len(self.columns) == 0:
+            return 0
+        return len(self[self.columns[0]])
+
+    def __repr__(self):
+        return "<Frame {fn} ({names})>".format(
+                fn=self.fileName, names=", ".join(self.columns))
+
+
+def _column_names(fileName):
+    if fileName.endswith(".npy"):
+        return list(binarydata.load_columns(fileName, mmap=True).dtype.names)
+    if fileName.endswith(".npys"):
+        blocks = binarydata.load_stream(fileName, mmap=True)
+        return list(blocks[0].dtype.names) if len(blocks) > 0 else []
+    textFile = open(fileName, "r")
+    header = textFile.readline()
+    textFile.close()
+    return _text_names(header)[0]
+
+
+def _open_source(fileName, cache):
+    # It returns the function returning a column of the file
+    if fileName.endswith(".npy"):
+        record = binarydata.load_columns(fileName, mmap=True)
+        return lambda name: record[name]
+    if fileName.endswith(".npys"):
+        blocks = binarydata.load_stream(fileName, mmap=True)
+        return lambda name: binarydata.stream_column(blocks, name)
+    cacheName = os.path.join(os.path.dirname(fileName), CACHE_DIR,
+                             os.path.basename(fileName) + ".npy")
+    if (cache and os.path.exists(cacheName) and
+            os.path.getmtime(cacheName) >= os.path.getmtime(fileName)):
+        return _open_source(cacheName, cache)
+    names, cols = read_text(fileName)
+    if cache:
+        try:
+            if not os.path.isdir(os.path.dirname(cacheName)):
+                os.makedirs(os.path.dirname(cacheName))
+            binarydata.save_columns(cacheName, names, cols)
+        except (IOError, OSError):
+            # Read-only directory; the parsed columns are kept in memory
+            pass
+    data = dict(zip(names, cols))
+    return lambda name: data[name]
+
+
+def read_text(fileName=None):
+    """
+This function reads the .txt file saved by the exporters.
+It returns the list of the column names without the units and the list
+of the columns.
+< e.g. names, cols = read_text("time_particle_data_100_ts.txt") >
+The delimiter is found from the header.
+    """
+    assert fileName is not None, ValueError(
+            'File name is not defined for data')
+    textFile = open(fileName, "r")
+    names, delim = _text_names(textFile.readline())
+    data = np.loadtxt(textFile, delimiter=delim, ndmin=2)
+    textFile.close()
+    if data.size == 0:
+        data = np.zeros((0, len(names)))
+    return names, [np.ascontiguousarray(data[:, i])
+                   for i in range(len(names))]
+
+
+def _text_names(header):
+    # The delimiter is between the unit of the first column and the next
+    # column name, e.g. "x(m)\ty(m)" or "pid,x(m)"
+    header = header.rstrip("\n")
+    match = re.search(r"^[A-Za-z]+(?:\([^)]*\))?([^A-Za-z(]+)[A-Za-z]",
+                      header)
+    delim = match.group(1) if match is not None else None
+    heads = header.split(delim) if delim is not None else [header]
+    names = [re.sub(r"\(.*\)$", "", head.strip()) for head in heads]
+    return names, delim
+
+# -------------------------------------------------------------------------- #
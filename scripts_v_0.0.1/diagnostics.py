@@ -0,0 +1,472 @@
+# -*- coding: utf-8 -*-
+
+"""
+diagnostics module test version
+
+Created on Thu May 17 2018
+
+@author: K. Yoo, 
+Intense Beam and Accelerator Laboratory(IBAL), 
+Ulsan National Institute of Science and Technology(UNIST),
+Republic of Korea
+"""
+
+# ========================================================================== #
+#                    Module for Beam Diagnostics during Simulation           #
+# -------------------------------------------------------------------------- #
+#                                                                            #
+# 1. Moments of the beam (centroid, rms size, rms emittance, energy spread)  #
+# 2. Histograms of the phase space and the density with fixed bins           #
+#                                                                            #
+# ========================================================================== #
+
+"""
+The diagnostics are computed from the particles during the simulation,
+and only the results are saved, so they can be saved at every time-step.
+< e.g. import diagnostics as dg
+       dg.moment_data(part=beam, tsint=1)
+       dg.histogram_data(part=beam, tsint=1, ranges={"x": [-5.*mm, 5.*mm],
+                         "xp": [-0.01, 0.01], ...}) >
+One row of the moments is added at each time-step, and the rows are
+written to the file every 'flushEvery' rows and at the end of the script.
+The histograms are saved with the size given by the number of bins,
+which does not depend on the number of particles.
+"""
+
+import atexit
+import json
+
+import numpy as np
+
+from warp import *
+
+import asyncwriter
+import binarydata
+import parallelio
+import scheduler
+import selection
+import textwriter
+
+
+MOMENT_COLUMNS = ["ts", "t", "n", "w", "xc", "yc", "zc", "vzc",
+                  "xrms", "yrms", "zrms", "xprms", "yprms",
+                  "emitx", "emity", "ke", "dke"]
+MOMENT_HEADERS = \
+    "ts{de}t(s){de}n{de}w{de}xc(m){de}yc(m){de}zc(m){de}vzc(m/s){de}" \
+    "xrms(m){de}yrms(m){de}zrms(m){de}xprms(rad){de}yprms(rad){de}" \
+    "emitx(m-rad){de}emity(m-rad){de}ke(eV){de}dke(eV)"
+# Quantities of the particles for the histograms;
+# x'=vx/vz, y'=vy/vz (rad) and kinetic energy (eV)
+HIST_NAMES = ("x", "y", "z", "vx", "vy", "vz", "xp", "yp", "ke")
+HIST_UNITS = {"x": "m", "y": "m", "z": "m", "vx": "m/s", "vy": "m/s",
+              "vz": "m/s", "xp": "rad", "yp": "rad", "ke": "eV"}
+
+
+# -------------------------------------------------------------------------- #
+
+def moment_data(part=None, tsstart=1, tsend=None, tsint=1,
+                dirName="beam_moment_data", fileName="beam_moment_data",
+                delim="\t", fileType="txt", flushEvery=100,
+                parallel=False, select=None):
+    """
+This function saves the moments of the particle species at every 'tsint'
+time-step in one file.
+Each row includes the time-step (ts), time (t), number of macro-particles
+(n), number of real particles (w), centroids (xc, yc, zc, vzc), rms sizes
+(xrms, yrms, zrms), rms divergences (xprms, yprms), rms emittances
+(emitx, emity), mean kinetic energy (ke) and rms energy spread (dke).
+The divergences are x'=vx/vz and y'=vy/vz, and all moments are weighted
+by the weights of the particles.
+Arguments are following;
+ - part: This is the particle species.
+ - tsstart: This is time-step to want to start saving the moments.
+            {Default=1}
+ - tsend: This is time-step to want to end saving the moments.
+          {Default=None  (until the end of the simulation)}
+ - tsint: This is the interval of time-step to save the moments.
+          {Default=1}
+ - dirName: The moments will be saved in the directory having this name
+            {Default="beam_moment_data"}
+ - fileName: The moments will be saved in the file having the name of
+             'fileName.txt', or 'fileName.npys' with 'fileType="npy"'.
+             {Default="beam_moment_data"}
+ - delim: Each components of the moments will be separated with
+          this delimiter in .txt file
+          {Default="\t"  (tab)}
+ - fileType: Format of the saved file.
+             "txt" is the delimited text file, and "npy" is the stream of
+             'binarydata' (.npys) whose records have the rows of each
+             writing.
+             < "txt", "npy" >
+             {Default="txt"}
+ - flushEvery: The rows are written to the file every 'flushEvery' rows.
+               {Default=100}
+ - parallel: If this is True, each process of parallel WARP uses only its
+             own particles, and the sums of all processes are used for the
+             moments.
+             {Default=False}
+ - select: Only the particles selected by this are used.
+           This is 'ParticleSelection' of the module 'selection'.
+           {Default=None  (all particles)}
+With parallel WARP, only the process of rank 0 saves the file, and it 
+returns the 'RowStream' of the file on rank 0 and None on the others.
+    """
+    assert part is not None, ValueError(
+            'Particle species is not defined for data')
+    assert isinstance(dirName, str) is True, ValueError(
+            'Directory name must be given by string type')
+    assert isinstance(fileName, str) is True, ValueError(
+            'File name must be given by string type')
+    assert fileType=="txt" or fileType=="npy", ValueError(
+            'File type must be one of "txt" and "npy"')
+    assert flushEvery >= 1, ValueError(
+            'Number of rows to flush must be larger than 0')
+    gather = 0 if parallel else 1
+    if select is None:
+        select = selection.ParticleSelection()
+    stream = None
+    if parallelio.rank() == 0:
+        scheduler.make_dir(dirName)
+        stream = RowStream("./{dirName}/{fileName}".format(
+                dirName=dirName, fileName=fileName), MOMENT_COLUMNS,
+                MOMENT_HEADERS.format(de=delim), delim, fileType,
+                flushEvery)
+    def savemomentdata():
+        cols = select.select(part, ["x", "y", "z", "vx", "vy", "vz", "w"],
+                             gather=gather)
+        row = beam_moments(part, *cols, parallel=parallel)
+        if stream is not None:
+            stream.append([top.it, top.time] + row)
+    scheduler.schedule(savemomentdata, tsstart=tsstart, tsend=tsend,
+                       tsint=tsint)
+    return stream
+
+
+def beam_moments(part, xx, yy, zz, vx, vy, vz, ww, parallel=False):
+    """
+This function returns the list of the moments of 'MOMENT_COLUMNS' after
+"ts" and "t", from the arrays of the particles.
+With 'parallel=True', the sums of all processes are used.
+    """
+    ww = ww * part.sw
+    # The angles are not defined for the particles not moving in z, so
+    # xp, yp and the emittances use only the moving particles (weight wa)
+    moving = vz != 0.
+    wa = ww * moving
+    vzm = np.where(moving, vz, 1.)
+    xp = vx / vzm
+    yp = vy / vzm
+    ke = kinetic_energy(part, vx, vy, vz)
+    qq = np.array([xx, yy, zz, vz, ke]).reshape(5, -1)
+    qa = np.array([xx, yy, xp, yp]).reshape(4, -1)
+    # The centroids first, and the central moments with them, so the
+    # small spreads around the large centroids (z, ke) keep the precision
+    sums = np.concatenate([[len(ww), np.sum(ww), np.sum(wa)],
+                           np.dot(qq, ww), np.dot(qa, wa)])
+    if parallel:
+        sums = parallelio.allreduce(sums)
+    nn, wsum, wasum = sums[:3]
+    if wsum <= 0.:
+        return [nn, wsum] + [0.] * (len(MOMENT_COLUMNS) - 4)
+    aNorm = 1. / wasum if wasum > 0. else 0.
+    mean = sums[3:8] / wsum
+    meanA = sums[8:] * aNorm
+    dq = qq - mean[:, None]
+    da = qa - meanA[:, None]
+    sums2 = np.concatenate([np.dot(dq * dq, ww), np.dot(da * da, wa),
+                            [np.dot(da[0] * da[2], wa),
+                             np.dot(da[1] * da[3], wa)]])
+    if parallel:
+        sums2 = parallelio.allreduce(sums2)
+    var = sums2[:5] / wsum
+    varA = sums2[5:9] * aNorm
+    xxp, yyp = sums2[9:] * aNorm
+    emitx = np.sqrt(max(varA[0] * varA[2] - xxp * xxp, 0.))
+    emity = np.sqrt(max(varA[1] * varA[3] - yyp * yyp, 0.))
+    rms = np.sqrt(var)
+    rmsA = np.sqrt(varA)
+    return [nn, wsum, mean[0], mean[1], mean[2], mean[3],
+            rms[0], rms[1], rms[2], rmsA[2], rmsA[3],
+            emitx, emity, mean[4], rms[4]]
+
+
+def kinetic_energy(part, vx, vy, vz):
+    """
+This function returns the kinetic energy (eV) of the particles.
+    """
+    # gamma - 1 = b2 / (s * (1 + s)), with b2 = (v/c)**2, s = sqrt(1 - b2),
+    # keeps the precision for the slow particles
+    b2 = (vx * vx + vy * vy + vz * vz) / clight**2
+    ss = np.sqrt(1. - b2)
+    return b2 / (ss * (1. + ss)) * (part.mass * clight**2 / echarge)
+
+# -------------------------------------------------------------------------- #
+
+
+# -------------------------------------------------------------------------- #
+
+def histogram_data(part=None, hists=None, ranges=None, bins=64,
+                   tsstart=1, tsend=None, tsint=1, window=1,
+                   dirName="phase_space_data", fileName="phase_space_data",
+                   weighted=True, parallel=False, select=None):
+    """
+This function saves the histograms of the particles in the phase space
+(e.g. x-x') or the density (e.g. x-y, z) at every 'tsint' time-step.
+The histograms of each pair are appended to the stream file
+'fileName_a-b.npys', whose records have the time-step (ts), the number of
+time-steps summed (n) and the histogram (counts) indexed as [a, b].
+The bins are saved in 'fileName_a-b.json'.
+< e.g. blocks = binarydata.load_stream("phase_space_data_x-xp.npys")
+       ts = binarydata.stream_column(blocks, "ts")
+       counts = blocks[10]["counts"] >
+Arguments are following;
+ - part: This is the particle species.
+ - hists: This is the list of the pairs of quantities, or one quantity
+          for 1D histogram, of HIST_NAMES.
+          "xp" and "yp" are x'=vx/vz, y'=vy/vz, and "ke" is kinetic
+          energy (eV).
+          < e.g. hists=[("x", "xp"), ("z", "ke"), ("z",)] >
+          {Default=None  ([("x", "xp"), ("y", "yp"), ("x", "y"),
+                           ("z", "ke")])}
+ - ranges: This is the dictionary of the ranges of the bins of each
+           quantity. It is fixed for all time-steps, and the particles
+           out of the ranges are not counted.
+           < e.g. ranges={"x": [-5.*mm, 5.*mm], "xp": [-0.01, 0.01]} >
+ - bins: Number of the bins for each quantity, or the dictionary of them.
+         < e.g. bins=64, bins={"x": 128, "xp": 64} >
+         {Default=64}
+ - tsstart: This is time-step to want to start saving the histograms.
+            {Default=1}
+ - tsend: This is time-step to want to end saving the histograms.
+          {Default=None  (until the end of the simulation)}
+ - tsint: This is the interval of time-step to make the histograms.
+          {Default=1}
+ - window: The histograms of 'window' time-steps are summed and saved
+           at once. The time-steps of the last window which is not
+           finished are not saved.
+           {Default=1}
+ - dirName: The histograms will be saved in the directory having this name
+            {Default="phase_space_data"}
+ - fileName: The histograms will be saved in the files having the name of
+             'fileName_a-b.npys'.
+             {Default="phase_space_data"}
+ - weighted: If this is True, the number of real particles (weight) is
+             counted, otherwise the number of macro-particles.
+             {Default=True}
+ - parallel: If this is True, each process of parallel WARP bins only its
+             own particles, and the histograms of all processes are summed
+             when they are saved.
+             {Default=False}
+ - select: Only the particles selected by this are counted.
+           This is 'ParticleSelection' of the module 'selection'.
+           {Default=None  (all particles)}
+With parallel WARP, only the process of rank 0 saves the files.
+    """
+    assert part is not None, ValueError(
+            'Particle species is not defined for data')
+    if hists is None:
+        hists = [("x", "xp"), ("y", "yp"), ("x", "y"), ("z", "ke")]
+    hists = [(hh,) if isinstance(hh, str) else tuple(hh) for hh in hists]
+    assert ranges is not None, ValueError(
+            'Ranges of bins are not defined for data')
+    for hh in hists:
+        assert 1 <= len(hh) <= 2, ValueError(
+                'Histogram must be given by one or two quantities')
+        for name in hh:
+            assert name in HIST_NAMES, ValueError(
+                    'Quantity must be one of {names}'.format(
+                            names=", ".join(HIST_NAMES)))
+            assert name in ranges, ValueError(
+                    'Range of {name} is not defined'.format(name=name))
+    assert window >= 1, ValueError(
+            'Window must be larger than 0')
+    assert isinstance(dirName, str) is True, ValueError(
+            'Directory name must be given by string type')
+    assert isinstance(fileName, str) is True, ValueError(
+            'File name must be given by string type')
+    if not isinstance(bins, dict):
+        bins = dict((name, bins) for hh in hists for name in hh)
+    gather = 0 if parallel else 1
+    if select is None:
+        select = selection.ParticleSelection()
+    writer = parallelio.rank() == 0
+    if writer:
+        scheduler.make_dir(dirName)
+    histFileNames = []
+    grids = []
+    for hh in hists:
+        histFileName = "./{dirName}/{fileName}_{names}".format(
+                dirName=dirName, fileName=fileName, names="-".join(hh))
+        histFileNames.append(histFileName)
+        grids.append(np.zeros([bins[name] for name in hh]))
+        if writer:
+            open(histFileName + ".npys", "wb").close()
+            _write_hist_info(histFileName + ".json", hh, bins, ranges,
+                             tsint, window, weighted)
+    # Arrays of the species needed for the quantities
+    needs = {"xp": ["vx", "vz"], "yp": ["vy", "vz"],
+             "ke": ["vx", "vy", "vz"]}
+    readNames = []
+    for hh in hists:
+        for name in hh:
+            for need in needs.get(name, [name]):
+                if need not in readNames:
+                    readNames.append(need)
+    if weighted:
+        readNames.append("w")
+    # Order of the frames appended to each file
+    sequences = [asyncwriter.WriteSequence() for hh in hists]
+    nSteps = [0]
+    def savehistdata():
+        cols = dict(zip(readNames, select.select(part, readNames,
+                                                 gather=gather)))
+        ww = cols["w"] * part.sw if weighted else None
+        # Index of the bin of each quantity used, computed only once
+        index = {}
+        for hh in hists:
+            for name in hh:
+                if name not in index:
+                    index[name] = _bin_index(
+                            _quantity(part, cols, name), ranges[name],
+                            bins[name])
+        for hh, grid in zip(hists, grids):
+            grid += _bin_count([index[name] for name in hh],
+                               [bins[name] for name in hh], ww)
+        nSteps[0] += 1
+        if nSteps[0] == window:
+            for i in range(len(hists)):
+                grid = grids[i]
+                if parallel:
+                    grid = parallelio.allreduce(grid)
+                if writer:
+                    sequences[i].submit(_append_hist, histFileNames[i],
+                                        top.it, nSteps[0], grid.copy())
+                grids[i][...] = 0.
+            nSteps[0] = 0
+    scheduler.schedule(savehistdata, tsstart=tsstart, tsend=tsend,
+                       tsint=tsint)
+
+
+def _quantity(part, cols, name):
+    if name == "xp":
+        return cols["vx"] / cols["vz"]
+    if name == "yp":
+        return cols["vy"] / cols["vz"]
+    if name == "ke":
+        return kinetic_energy(part, cols["vx"], cols["vy"], cols["vz"])
+    return cols[name]
+
+
+def _bin_index(qq, qRange, nBins):
+    # Bin of each particle, and -1 out of the range
+    lo, hi = qRange
+    with np.errstate(invalid="ignore"):
+        scaled = (qq - lo) * (nBins / float(hi - lo))
+        valid = (scaled >= 0.) & (scaled < nBins)
+    index = np.full(len(qq), -1, dtype=np.intp)
+    index[valid] = scaled[valid].astype(np.intp)
+    return index
+
+
+def _bin_count(indices, nBins, ww):
+    # Histogram by one 'bincount' of the flat index of the bins
+    flat = indices[0]
+    valid = flat >= 0
+    for index, nn in zip(indices[1:], nBins[1:]):
+        flat = flat * nn + index
+        valid &= index >= 0
+    weights = None if ww is None else ww[valid]
+    return np.bincount(flat[valid], weights=weights,
+                       minlength=int(np.prod(nBins))).reshape(nBins)
+
+
+def _write_hist_info(infoFileName, names, bins, ranges, tsint, window,
+                     weighted):
+    info = {"names": list(names),
+            "units": [HIST_UNITS[name] for name in names],
+            "bins": [bins[name] for name in names],
+            "ranges": [list(ranges[name]) for name in names],
+            "tsint": tsint, "window": window, "weighted": weighted}
+    infoWriteFile = open(infoFileName, "w")
+    json.dump(info, infoWriteFile, indent=1)
+    infoWriteFile.close()
+
+
+def _append_hist(histFileName, ts, nSteps, grid):
+    # Called in the order of 'WriteSequence' of the file
+    record = np.zeros((), dtype=[("ts", "<i8"), ("n", "<i8"),
+                                 ("counts", "<f8", grid.shape)])
+    record["ts"] = ts
+    record["n"] = nSteps
+    record["counts"] = grid
+    histWriteFile = open(histFileName + ".npys", "ab")
+    np.save(histWriteFile, record)
+    histWriteFile.close()
+
+# -------------------------------------------------------------------------- #
+
+
+# -------------------------------------------------------------------------- #
+
+class RowStream(object):
+    """
+This class keeps the rows of a time series and appends them to the file
+by parts.
+The rows are kept in the array of 'flushEvery' rows made once, and all of
+them are written at once when it is full.
+Arguments are following;
+ - fileName: Name of the file without ".txt" or ".npys".
+ - names: This is the list of column names.
+ - header: This is the header line of .txt file.
+ - delim: Delimiter of .txt file.
+ - fileType: < "txt", "npy" >
+ - flushEvery: The rows are written every 'flushEvery' rows.
+The remaining rows are written at the end of the script.
+    """
+
+    def __init__(self, fileName, names, header, delim="\t", fileType="txt",
+                 flushEvery=100):
+        self.names = names
+        self.delim = delim
+        self.fileType = fileType
+        self.rows = np.empty((flushEvery, len(names)))
+        self.nRows = 0
+        # Order of the blocks of rows appended to the file
+        self.sequence = asyncwriter.WriteSequence()
+        if fileType == "npy":
+            self.fileName = fileName + ".npys"
+            open(self.fileName, "wb").close()
+        else:
+            self.fileName = fileName + ".txt"
+            rowWriteFile = open(self.fileName, "w")
+            rowWriteFile.write(header)
+            rowWriteFile.close()
+        atexit.register(self.flush)
+
+    def append(self, row):
+        self.rows[self.nRows] = row
+        self.nRows += 1
+        if self.nRows == len(self.rows):
+            self.flush()
+
+    def flush(self):
+        """
+This function writes the rows kept until now.
+        """
+        if self.nRows == 0:
+            return
+        # The copy is written, so the array is filled again at once
+        rows = self.rows[:self.nRows].copy()
+        self.nRows = 0
+        self.sequence.submit(self._write, rows)
+
+    def _write(self, rows):
+        if self.fileType == "npy":
+            binarydata.append_columns(self.fileName, self.names,
+                                      list(rows.T))
+            return
+        textwriter.write_text(self.fileName, None, list(rows.T), 
+                              ["%.10g"] * len(self.names), self.delim, 
+                              mode="a")
+
+# -------------------------------------------------------------------------- #
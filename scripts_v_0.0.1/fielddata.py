@@ -16,6 +16,9 @@ Republic of Korea
 # -------------------------------------------------------------------------- #
 #                                                                            #
 # 1. Electric Potnetial data from WARP [ 1D, 2D, 3D / xyz geometry ]         #
+# 2. Electric Potential data 3D with vtk format for ParaView                 #
+# 3. Electric Potential at probe points at every time-step                   #
+# 4. Electric Field data (E = -grad phi) [ 1D, 2D, 3D / xyz geometry ]       #
 #                                                                            #
 # ========================================================================== #
 
@@ -24,20 +27,179 @@ First, to use this module, it may be convinient locating this file
 at the same directory with WARP scripts.
 And, this module must be imported in the scripts.
 < e.g. "import fielddata as fd" >
+With parallel WARP, the potential and field data of the whole grid is same 
+on all processes, and only the process of rank 0 saves the files.
 """
 
+import itertools
 import os
 import numpy as np
 
 from warp import *
 from pyevtk.hl import gridToVTK
 
+import asyncwriter
+import diagnostics
+import iobudget
+import parallelio
+import runcontainer
+import scheduler
+import textwriter
+import vtkseries
+
+
+# -------------------------------------------------------------------------- #
+
+def grid_axis(direction=None):
+    """
+This function returns the node positions of the WARP grid along one axis
+as a NumPy vector built from 'w3d.xmmin', 'w3d.dx' and 'w3d.nx' (and the
+same for y and z).
+Arguments are following;
+ - direction: The axis of the grid.
+              < "x", "y", "z" >
+    """
+    assert direction=="x" or direction=="y" or direction=="z", ValueError(
+            'Direction must be one of "x", "y", and "z"')
+    nn = getattr(w3d, "n" + direction)
+    dd = getattr(w3d, "d" + direction)
+    mmin = getattr(w3d, direction + "mmin")
+    return np.arange(nn + 1) * dd + mmin
+
+
+def phi_line(direction=None, xx=0, yy=0, zz=0):
+    """
+This function extracts a line of electric potential along 'direction' 
+with a single 'getphi' call.
+It returns the positions along the line and the potential at them.
+The potential is a copy, so it is not changed by the next time-steps.
+ - direction: < "x", "y", "z" >
+ - xx, yy, zz: Grid numbers of the line for the other two directions.
+    """
+    assert direction=="x" or direction=="y" or direction=="z", ValueError(
+            'Direction must be one of "x", "y", and "z"')
+    if direction == "x":
+        pp = getphi(iy=yy, iz=zz)
+    elif direction == "y":
+        pp = getphi(ix=xx, iz=zz)
+    else:
+        pp = getphi(ix=xx, iy=yy)
+    return grid_axis(direction), np.array(pp)
+
+
+def phi_plane(plane=None, xx=0, yy=0, zz=0):
+    """
+This function extracts a plane of electric potential with a single 
+'getphi' call.
+It returns the two axes of the plane and the potential on it, indexed as
+[first axis, second axis] of 'plane'.
+ - plane: < "xy", "yz", "zx" >
+ - xx, yy, zz: Grid number of the plane for the normal direction.
+    """
+    assert plane=="xy" or plane=="yz" or plane=="zx", ValueError(
+            'Plane must be one of "xy", "yz", and "zx"')
+    if plane == "xy":
+        pp = np.array(getphi(iz=zz))
+    elif plane == "yz":
+        pp = np.array(getphi(ix=xx))
+    else:
+        pp = np.array(getphi(iy=yy).T)
+    return grid_axis(plane[0]), grid_axis(plane[1]), pp
+
+
+def phi_volume():
+    """
+This function extracts the whole electric potential array with a single 
+'getphi' call.
+It returns the x, y, z axes and the potential indexed as [x, y, z].
+    """
+    return (grid_axis("x"), grid_axis("y"), grid_axis("z"), 
+            np.array(getphi()))
+
+
+def phi_box(box=None):
+    """
+This function extracts the electric potential in a box of grid points.
+It returns the potential indexed as [x, y, z] of the box.
+ - box: This is the list of (start, stop) grid numbers of x, y, z, 
+        where 'stop' is not included.
+        < e.g. box=[(2, 4), (0, 9), (5, 7)] >
+'getphi' of WARP takes one grid number or the whole axis for each 
+direction, so the box is read by the lines or planes of its thin 
+directions (up to a quarter of the grid), or by one 'getphi' call of the
+whole grid, and cut by NumPy.
+With parallel WARP, it must be called on all processes.
+    """
+    assert box is not None and len(box) == 3, ValueError(
+            'Box must be given for x, y, z')
+    nn = [getattr(w3d, "n" + ax) + 1 for ax in ("x", "y", "z")]
+    size = [hi - lo for lo, hi in box]
+    cut = [slice(lo, hi) for lo, hi in box]
+    # Directions read by one grid number, up to two of the thinnest
+    thin = sorted([k for k in range(3) if 4 * size[k] <= nn[k]], 
+                  key=lambda k: size[k])[:2]
+    if not thin:
+        return np.array(np.asarray(getphi())[tuple(cut)])
+    pp = None
+    for fixed in itertools.product(*[range(*box[k]) for k in thin]):
+        index = [None, None, None]
+        where = [slice(None)] * 3
+        for k, ii in zip(thin, fixed):
+            index[k] = ii
+            where[k] = ii - box[k][0]
+        part = np.asarray(getphi(ix=index[0], iy=index[1], iz=index[2]))
+        if pp is None:
+            pp = np.empty(size, dtype=part.dtype)
+        pp[tuple(where)] = part[tuple(cut[k] for k in range(3) 
+                                      if k not in thin)]
+    return pp
+
+
+def _submit_phi_file(dirName, fileName, header, axes, pp, delim, 
+                     control=None):
+    # Saved in the file of the time-step, or in 'runcontainer' with the
+    # axes of the grid which are extracted as the positions.
+    # 'control' of 'iobudget' measures the writing.
+    # The data of 'getphi' is same on all processes of parallel WARP, so 
+    # only the process of rank 0 saves it.
+    if parallelio.rank() != 0:
+        return
+    submit = asyncwriter.submit if control is None else control.submit
+    if runcontainer.active():
+        values = pp if isinstance(pp, list) else [pp]
+        names = [head.split("(")[0] for head in header.split(delim)]
+        submit(runcontainer.append, 
+               "{dirName}/{fileName}".format(dirName=dirName, 
+                                             fileName=fileName), 
+               runcontainer.layout("txt", header=header, 
+                                   formats=["%.9f"] * len(names), 
+                                   delim=delim, grid=len(axes)), 
+               top.it, names, list(axes) + values)
+        return
+    submit(_write_phi_file, 
+           "./{dirName}/{fileName}_{ts}_ts.txt".format(
+                   dirName=dirName, fileName=fileName, ts=top.it), 
+           header, axes, pp, delim)
+
+
+def _write_phi_file(tsFileName, header, axes, pp, delim):
+    # Positions of every grid node are built here, not in the time-step loop.
+    # 'pp' is one array, or the list of arrays saved as the columns.
+    pos = np.meshgrid(*axes, indexing="ij")
+    values = pp if isinstance(pp, list) else [pp]
+    columns = [np.ravel(col) for col in list(pos) + values]
+    textwriter.write_text(tsFileName, header, columns, 
+                          ["%.9f"] * len(columns), delim)
+    return os.path.getsize(tsFileName)
+
+# -------------------------------------------------------------------------- #
+
 
 # -------------------------------------------------------------------------- #
 
 def phi_1d_xyz(direction=None, ts=None, dirName="E_potential_1d_data", 
                fileName="E_potential_data", delim="\t",
-               xx=0, yy=0, zz=0):
+               xx=0, yy=0, zz=0, budget=None):
     """ 
 This function exports electric potential data 1D of XYZ geomtrey.
 Electric potential data includes position (x,y,z) and potential (phi)
@@ -67,6 +229,9 @@ Arguments are following;
        when the direction is not "z".
        This must be the grid number.
        {Default=0}
+ - budget: The output is adjusted to this 'IOBudget' of the module 
+           'iobudget' by the interval of the time-steps 'ts'.
+           {Default=None  (no adjustment)}
     """
     assert direction is not None, ValueError(
             'Dimension is not defined for data')
@@ -80,43 +245,17 @@ Arguments are following;
             'Directory name must be given by the string type')
     assert isinstance(fileName, str) is True, ValueError(
             'File name must be given by the string type')
-    @callfromafterstep
+    scheduler.make_dir(dirName)
+    control = iobudget.register(
+            budget, "{dirName}/{fileName}".format(dirName=dirName, 
+                                                  fileName=fileName))
     def save_1d_data():
-        for j in range(len(ts)):
-            if top.it == ts[j]:
-                phi_1d_dir = './{dirName}/'.format(dirName=dirName)
-                if not os.path.exists(phi_1d_dir):
-                    os.mkdir(phi_1d_dir)
-                tsWriteFile = open("./{dirName}/{fileName}_{ts}_ts.txt".
-                         format(dirName=dirName, fileName=fileName, 
-                                ts=ts[j]), "w")
-                if direction == "x":
-                    tsWriteFile.write("x(m){de}phi(V)".format(de=delim))
-                    for i in range(w3d.nx + 1):
-                        xpos = i * w3d.dx + w3d.xmmin
-                        pp = getphi(ix=i, iy=yy, iz=zz)
-                        tsWriteFile.write("\n")
-                        tsWriteFile.write("{xpos:.9f}{de}{phi:.9f}".format(
-                                xpos=xpos, de=delim, phi=pp))
-                    tsWriteFile.close()
-                elif direction == "y":
-                    tsWriteFile.write("y(m){de}phi(V)".format(de=delim))
-                    for i in range(w3d.ny + 1):
-                        ypos = i * w3d.dy + w3d.ymmin
-                        pp = getphi(ix=xx, iy=i, iz=zz)
-                        tsWriteFile.write("\n")
-                        tsWriteFile.write("{ypos:.9f}{de}{phi:.9f}".format(
-                                ypos=ypos, de=delim, phi=pp))
-                    tsWriteFile.close()
-                elif direction == "z":
-                    tsWriteFile.write("z(m){de}phi(V)".format(de=delim))
-                    for i in range(w3d.nz + 1):
-                        zpos = i * w3d.dz + w3d.zmmin
-                        pp = getphi(ix=xx, iy=yy, iz=i)
-                        tsWriteFile.write("\n")
-                        tsWriteFile.write("{zpos:.9f}{de}{phi:.9f}".format(
-                                zpos=zpos, de=delim, phi=pp))
-                    tsWriteFile.close()
+        pos, pp = phi_line(direction, xx=xx, yy=yy, zz=zz)
+        _submit_phi_file(dirName, fileName, 
+                         "{di}(m){de}phi(V)".format(di=direction, 
+                                                    de=delim), 
+                         [pos], pp, delim, control)
+    scheduler.schedule(control.wrap(save_1d_data), ts=ts)
 
 # -------------------------------------------------------------------------- #
 
@@ -125,7 +264,7 @@ Arguments are following;
 
 def phi_2d_xyz(plane=None, ts=None, dirName="E_potential_2d_data", 
                fileName="E_potential_data", delim="\t",
-               xx=0, yy=0, zz=0):
+               xx=0, yy=0, zz=0, budget=None):
     """ 
 This function exports electric potential data 2D of XYZ geomtrey.
 Electric potential data includes position (x,y,z) and potential (phi)
@@ -155,6 +294,9 @@ Arguments are following;
        when the plane is "xy".
        This must be the grid number.
        {Default=0}
+ - budget: The output is adjusted to this 'IOBudget' of the module 
+           'iobudget' by the interval of the time-steps 'ts'.
+           {Default=None  (no adjustment)}
     """
     assert plane is not None, ValueError(
             'Plane is not defined for data')
@@ -168,58 +310,18 @@ Arguments are following;
             'Directory name must be given by the string type')
     assert isinstance(fileName, str) is True, ValueError(
             'File name must be given by the string type')
-    @callfromafterstep
+    scheduler.make_dir(dirName)
+    control = iobudget.register(
+            budget, "{dirName}/{fileName}".format(dirName=dirName, 
+                                                  fileName=fileName))
     def save_2d_data():
-        for j in range(len(ts)):
-            if top.it == ts[j]:
-                phi_2d_dir = './{dirName}/'.format(dirName=dirName)
-                if not os.path.exists(phi_2d_dir):
-                    os.mkdir(phi_2d_dir)
-                tsWriteFile = open("./{dirName}/{fileName}_{ts}_ts.txt".
-                         format(dirName=dirName, fileName=fileName, 
-                                ts=ts[j]), "w")
-                if plane == "xy":
-                    tsWriteFile.write(
-                            "x(m){de}y(m){de}phi(V)".format(de=delim))
-                    for i in range(w3d.nx + 1):
-                        for k in range(w3d.ny + 1):
-                            xpos = i * w3d.dx + w3d.xmmin
-                            ypos = k * w3d.dy + w3d.ymmin
-                            pp = getphi(ix=i, iy=k, iz=zz)
-                            tsWriteFile.write("\n")
-                            tsWriteFile.write(
-                                    "{xpos:.9f}{de}{ypos:.9f}{de}{phi:.9f}".\
-                                    format(xpos=xpos, ypos=ypos, 
-                                           de=delim, phi=pp))
-                    tsWriteFile.close()
-                elif plane == "yz":
-                    tsWriteFile.write(
-                            "y(m){de}z(m){de}phi(V)".format(de=delim))
-                    for i in range(w3d.ny + 1):
-                        for k in range(w3d.nz + 1):
-                            ypos = i * w3d.dy + w3d.ymmin
-                            zpos = k * w3d.dz + w3d.zmmin
-                            pp = getphi(ix=xx, iy=i, iz=k)
-                            tsWriteFile.write("\n")
-                            tsWriteFile.write(
-                                    "{ypos:.9f}{de}{zpos:.9f}{de}{phi:.9f}".\
-                                    format(ypos=ypos, zpos=zpos, 
-                                           de=delim, phi=pp))
-                    tsWriteFile.close()
-                elif plane == "zx":
-                    tsWriteFile.write(
-                            "z(m){de}x(m){de}phi(V)".format(de=delim))
-                    for i in range(w3d.nz + 1):
-                        for k in range(w3d.nx + 1):
-                            zpos = i * w3d.dz + w3d.zmmin
-                            xpos = k * w3d.dx + w3d.xmmin
-                            pp = getphi(ix=k, iy=yy, iz=i)
-                            tsWriteFile.write("\n")
-                            tsWriteFile.write(
-                                    "{zpos:.9f}{de}{xpos:.9f}{de}{phi:.9f}".\
-                                    format(zpos=zpos, xpos=xpos, 
-                                           de=delim, phi=pp))
-                    tsWriteFile.close()
+        pos1, pos2, pp = phi_plane(plane, xx=xx, yy=yy, zz=zz)
+        _submit_phi_file(dirName, fileName, 
+                         "{p1}(m){de}{p2}(m){de}phi(V)".format(
+                                 p1=plane[0], p2=plane[1], 
+                                 de=delim), 
+                         [pos1, pos2], pp, delim, control)
+    scheduler.schedule(control.wrap(save_2d_data), ts=ts)
                             
 # -------------------------------------------------------------------------- #
 
@@ -227,7 +329,7 @@ Arguments are following;
 # -------------------------------------------------------------------------- #
 
 def phi_3d_xyz(ts=None, dirName="E_potential_3d_data", 
-               fileName="E_potential_data", delim="\t"):
+               fileName="E_potential_data", delim="\t", budget=None):
     """ 
 This function exports electric potential data 3D of XYZ geomtrey.
 Electric potential data includes position (x,y,z) and potential (phi)
@@ -243,6 +345,9 @@ Arguments are following;
  - delim: Each components of data will be separated with 
           this delimiter in .txt file.
           {Default="\t"  (tab)}
+ - budget: The output is adjusted to this 'IOBudget' of the module 
+           'iobudget' by the interval of the time-steps 'ts'.
+           {Default=None  (no adjustment)}
     """
     assert ts is not None, ValueError(
             'Time-step is not defined for data')
@@ -252,37 +357,503 @@ Arguments are following;
             'Directory name must be given by the string type')
     assert isinstance(fileName, str) is True, ValueError(
             'File name must be given by the string type')
-    @callfromafterstep
+    scheduler.make_dir(dirName)
+    control = iobudget.register(
+            budget, "{dirName}/{fileName}".format(dirName=dirName, 
+                                                  fileName=fileName))
     def save_3d_data():
-        for j in range(len(ts)):
-            if top.it == ts[j]:
-                phi_3d_dir = './{dirName}/'.format(dirName=dirName)
-                if not os.path.exists(phi_3d_dir):
-                    os.mkdir(phi_3d_dir)
-                tsWriteFile = open("./{dirName}/{fileName}_{ts}_ts.txt".
-                         format(dirName=dirName, fileName=fileName, 
-                                ts=ts[j]), "w")
-                tsWriteFile.write(
-                            "x(m){de}y(m){de}z(m){de}phi(V)".format(de=delim))
-                for i in range(w3d.nx + 1):
-                    for k in range(w3d.ny + 1):
-                        for m in range(w3d.ny + 1):
-                            xpos = i * w3d.dx + w3d.xmmin
-                            ypos = k * w3d.dy + w3d.ymmin
-                            zpos = m * w3d.dz + w3d.zmmin
-                            pp = getphi(ix=i, iy=k, iz=m)
-                            tsWriteFile.write("\n")
-                            tsWriteFile.write("{xpos:.9f}{de}{ypos:.9f}{de}".\
-                                              format(xpos=xpos, ypos=ypos, 
-                                                     de=delim, phi=pp))
-                            tsWriteFile.write("{zpos:.9f}{de}{phi:.9f}".\
-                                              format(zpos=zpos, de=delim, 
-                                                     phi=pp))
-                                    
-                tsWriteFile.close()
+        xpos, ypos, zpos, pp = phi_volume()
+        _submit_phi_file(dirName, fileName, 
+                         "x(m){de}y(m){de}z(m){de}phi(V)".format(
+                                 de=delim), 
+                         [xpos, ypos, zpos], pp, delim, control)
+    scheduler.schedule(control.wrap(save_3d_data), ts=ts)
+
+# -------------------------------------------------------------------------- #
+
+
+# -------------------------------------------------------------------------- #
+
+def phi_3d_vtk(ts=None, dirName="E_potential_3d_vtk_data", 
+               fileName="E_potential_data", rho=False, 
+               stride=1, box=None, parallel=False):
+    """ 
+This function exports electric potential data 3D of XYZ geomtrey with 
+vtk format (binary rectilinear grid, .vtr) for ParaView.
+The .pvd file of all time-steps is also saved, so all vtk files are opened 
+in ParaView as one time series.
+Arguments are following;
+ - ts: All electric potential data will be saved when the time-step is 'ts'
+         < e.g. ts=[100, 200] >
+ - dirName: Potential data will be saved in the directory having this name.
+            {Default="E_potential_3d_vtk_data"}
+ - fileName: Potential data at each time-step will be saved in the file 
+             having the name of 'fileName_time-step_ts.vtr', and the time 
+             series in the file 'fileName.pvd'.
+             {Default="E_potential_data"}
+             < e.g. E_potential_data_100_ts.vtr, at time-step=100 >
+ - rho: If this is True, charge density (rho) is also saved.
+        {Default=False}
+ - stride: Only every 'stride' grid point is saved.
+           This is one number for all directions or the list of x, y, z.
+           < e.g. stride=2, stride=[1, 1, 4] >
+           {Default=1}
+ - box: Only the grid points in this box are saved.
+        This is the list of grid number ranges of x, y, z 
+        (the end is included).
+        < e.g. box=[[0, 32], [0, 32], [100, 200]] >
+        {Default=None  (whole grid)}
+ - parallel: If this is True, each process of parallel WARP saves only its 
+             own domain in the file having the name of 
+             'fileName_time-step_ts_r(rank).vtr', and the process of rank 0 
+             saves the parallel vtk file 'fileName_time-step_ts.pvtr' 
+             which is listed in the .pvd file.
+             With 'stride', the boundaries of the domains should be on 
+             the saved grid points, or the cells between domains are not 
+             shown in ParaView.
+             {Default=False  (the whole grid is saved by the process of 
+                              rank 0)}
+    """
+    assert ts is not None, ValueError(
+            'Time-step is not defined for data')
+    assert isinstance(ts, list) is True, ValueError(
+            'Time-step must be given by the list type')
+    assert isinstance(dirName, str) is True, ValueError(
+            'Directory name must be given by the string type')
+    assert isinstance(fileName, str) is True, ValueError(
+            'File name must be given by the string type')
+    if not isinstance(stride, (list, tuple)):
+        stride = [stride, stride, stride]
+    assert len(stride) == 3 and min(stride) >= 1, ValueError(
+            'Stride must be larger than 0 for x, y, z')
+    if box is None:
+        box = [[0, w3d.nx], [0, w3d.ny], [0, w3d.nz]]
+    assert len(box) == 3, ValueError(
+            'Box must be given by the ranges of x, y, z')
+    wholeExtent = [[0, (box[i][1] - box[i][0]) // stride[i]] 
+                   for i in range(3)]
+    scheduler.make_dir(dirName)
+    pvd = vtkseries.PVDCollection("./{dirName}/{fileName}.pvd".format(
+            dirName=dirName, fileName=fileName))
+    vtkName = "{dirName}/{fileName}".format(dirName=dirName, 
+                                            fileName=fileName)
+    def save_3d_vtk():
+        vtkFileName = "./{dirName}/{fileName}_{ts}_ts".format(
+                dirName=dirName, fileName=fileName, ts=top.it)
+        if parallel:
+            extent = parallelio.local_extent()
+            pp = np.array(getphi(local=1))
+            rr = np.array(getrho(local=1)) if rho else None
+        else:
+            extent = [[0, w3d.nx], [0, w3d.ny], [0, w3d.nz]]
+            pp = np.array(getphi())
+            rr = np.array(getrho()) if rho else None
+        sub, outExtent = _vtk_sub_box(box, stride, extent)
+        piece = None
+        if sub is not None:
+            axes = [np.ascontiguousarray(
+                    grid_axis(ax)[extent[i][0]:extent[i][1] + 1][sub[i]]) 
+                    for i, ax in enumerate(("x", "y", "z"))]
+            pointData = {"phi" : np.ascontiguousarray(pp[sub])}
+            if rho:
+                pointData["rho"] = np.ascontiguousarray(rr[sub])
+            if runcontainer.active():
+                # The pieces of the processes are joined by 'start' 
+                # when they are extracted
+                names = list(pointData)
+                asyncwriter.submit(
+                        runcontainer.append, vtkName, 
+                        runcontainer.layout("vtr"), top.it, 
+                        ["x", "y", "z", "start"] + names, 
+                        axes + [np.array([ee[0] for ee in outExtent])] + 
+                        [pointData[name] for name in names], 
+                        None, None, not parallel)
+                return
+            pieceName = vtkFileName
+            if parallel:
+                pieceName = parallelio.shard_name(vtkFileName)
+            elif parallelio.rank() != 0:
+                # The whole grid is same on all processes
+                return
+            asyncwriter.submit(_write_phi_vtk, pieceName, axes, pointData, 
+                               [ee[0] for ee in outExtent], 
+                               None if parallel else pvd, top.it)
+            piece = (outExtent, pieceName + ".vtr")
+        if parallel and not runcontainer.active():
+            pieces = parallelio.gather(piece)
+            if pieces is not None:
+                pieceTypes = {"phi" : pp.dtype}
+                if rho:
+                    pieceTypes["rho"] = rr.dtype
+                asyncwriter.submit(_write_phi_pvtr, vtkFileName + ".pvtr", 
+                                   wholeExtent, 
+                                   [pc for pc in pieces if pc is not None], 
+                                   pieceTypes, pvd, top.it)
+    scheduler.schedule(save_3d_vtk, ts=ts)
+
+
+def _vtk_sub_box(box, stride, extent):
+    # Grid points of 'box' and 'stride' in the domain 'extent'.
+    # It returns the slices of the domain arrays and the extent of them
+    # in the saved grid, or None when no point is in the domain.
+    sub = []
+    outExtent = []
+    for i in range(3):
+        lo = max(box[i][0], extent[i][0])
+        hi = min(box[i][1], extent[i][1])
+        first = box[i][0] - (box[i][0] - lo) // stride[i] * stride[i]
+        if first > hi:
+            return None, None
+        last = first + (hi - first) // stride[i] * stride[i]
+        sub.append(slice(first - extent[i][0], last - extent[i][0] + 1, 
+                         stride[i]))
+        outExtent.append([(first - box[i][0]) // stride[i], 
+                          (last - box[i][0]) // stride[i]])
+    return tuple(sub), outExtent
+
+
+def _write_phi_vtk(vtkFileName, axes, pointData, start, pvd, ts):
+    vtkFile = gridToVTK(vtkFileName, axes[0], axes[1], axes[2], 
+                        pointData=pointData, start=tuple(start))
+    if pvd is not None:
+        pvd.add(ts, vtkFile)
+
+
+def _write_phi_pvtr(pvtrFileName, wholeExtent, pieces, pieceTypes, pvd, ts):
+    parallelio.write_pvtr(pvtrFileName, wholeExtent, pieces, pieceTypes)
+    pvd.add(ts, pvtrFileName)
 
 # -------------------------------------------------------------------------- #
 
 
 # -------------------------------------------------------------------------- #
 
+
+# -------------------------------------------------------------------------- #
+
+def phi_probe(points=None, tsstart=1, tsend=None, tsint=1, 
+              dirName="E_potential_probe_data", 
+              fileName="E_potential_probe", delim="\t", fileType="txt", 
+              flushEvery=1000):
+    """ 
+This function saves electric potential at the probe points at every 
+'tsint' time-step in one file.
+The potential is interpolated from the 8 grid points around each probe 
+(trilinear), and the indices and weights of them are computed once here.
+Only the box of the grid points around all probes is read by 'getphi' at 
+each time-step, so the probes close to each other read a small box.
+Each row includes the time-step (ts), time (t) and the potential of each 
+probe (phi_0, phi_1, ...), and the positions of the probes are saved in 
+the file 'fileName_points.txt'.
+Arguments are following;
+ - points: This is the list of the positions (x, y, z) of the probes.
+           < e.g. points=[[0., 0., 100.*mm], [1.*mm, 0., 100.*mm]] >
+ - tsstart: This is time-step to want to start saving the potential.
+            {Default=1}
+ - tsend: This is time-step to want to end saving the potential.
+          {Default=None  (until the end of the simulation)}
+ - tsint: This is the interval of time-step to save the potential.
+          {Default=1}
+ - dirName: Potential data will be saved in the directory having this name.
+            {Default="E_potential_probe_data"}
+ - fileName: Potential data will be saved in the file having the name of 
+             'fileName.txt', or 'fileName.npys' with 'fileType="npy"'.
+             {Default="E_potential_probe"}
+ - delim: Each components of data will be separated with 
+          this delimiter in .txt file.
+          {Default="\t"  (tab)}
+ - fileType: Format of the saved file.
+             "txt" is the delimited text file, and "npy" is the stream of 
+             'binarydata' (.npys).
+             < "txt", "npy" >
+             {Default="txt"}
+ - flushEvery: The rows are kept in the array of 'flushEvery' rows, and 
+               written to the file when it is full.
+               {Default=1000}
+With parallel WARP, only the process of rank 0 saves the file.
+    """
+    assert points is not None and len(points) > 0, ValueError(
+            'Probe points are not defined for data')
+    assert isinstance(dirName, str) is True, ValueError(
+            'Directory name must be given by the string type')
+    assert isinstance(fileName, str) is True, ValueError(
+            'File name must be given by the string type')
+    assert fileType=="txt" or fileType=="npy", ValueError(
+            'File type must be one of "txt" and "npy"')
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    index, weight = probe_weights(points)
+    # Box of the grid points around all probes, and the indices in the box
+    box = [(int(ii.min()), int(ii.max()) + 1) for ii in index]
+    boxIndex = tuple(ii - bb[0] for ii, bb in zip(index, box))
+    nProbes = len(points)
+    stream = None
+    if parallelio.rank() == 0:
+        scheduler.make_dir(dirName)
+        probeFileName = "./{dirName}/{fileName}".format(dirName=dirName, 
+                                                       fileName=fileName)
+        np.savetxt(probeFileName + "_points.txt", 
+                   np.column_stack([np.arange(nProbes), points]), 
+                   fmt=["%d", "%.9f", "%.9f", "%.9f"], delimiter=delim, 
+                   header="probe{de}x(m){de}y(m){de}z(m)".format(de=delim), 
+                   comments="")
+        names = ["ts", "t"] + ["phi_{i}".format(i=i) 
+                               for i in range(nProbes)]
+        header = delim.join(["ts", "t(s)"] + ["{nm}(V)".format(nm=nm) 
+                                              for nm in names[2:]])
+        stream = diagnostics.RowStream(probeFileName, names, header, delim, 
+                                       fileType, flushEvery)
+    row = np.empty(nProbes + 2)
+    def saveprobedata():
+        # 'getphi' is called on all processes
+        pp = phi_box(box)
+        if stream is None:
+            return
+        row[0] = top.it
+        row[1] = top.time
+        # One gather of the 8 grid points of all probes
+        np.sum(pp[boxIndex] * weight, axis=1, out=row[2:])
+        stream.append(row)
+    scheduler.schedule(saveprobedata, tsstart=tsstart, tsend=tsend, 
+                       tsint=tsint)
+    return stream
+
+
+def probe_weights(points):
+    """
+This function returns the indices of the 8 grid points around each point
+of 'points' (n, 3), as the tuple of 3 arrays of (n, 8), and the weights of
+them (n, 8) for the trilinear interpolation.
+    """
+    cornerIndex = []
+    cornerWeight = []
+    for i, ax in enumerate(("x", "y", "z")):
+        nn = getattr(w3d, "n" + ax)
+        dd = getattr(w3d, "d" + ax)
+        mmin = getattr(w3d, ax + "mmin")
+        ff = (points[:, i] - mmin) / dd
+        # The points on the boundaries may be out of the grid by rounding
+        eps = 1e-9 * max(nn, 1)
+        assert np.all((ff >= -eps) & (ff <= nn + eps)), ValueError(
+                'Probe points must be in the grid for {ax}'.format(ax=ax))
+        ff = np.clip(ff, 0., nn)
+        i0 = np.minimum(np.floor(ff).astype(np.intp), max(nn - 1, 0))
+        tt = ff - i0
+        cornerIndex.append((i0, np.minimum(i0 + 1, nn)))
+        cornerWeight.append((1. - tt, tt))
+    index = ([], [], [])
+    weight = []
+    for cx in range(2):
+        for cy in range(2):
+            for cz in range(2):
+                index[0].append(cornerIndex[0][cx])
+                index[1].append(cornerIndex[1][cy])
+                index[2].append(cornerIndex[2][cz])
+                weight.append(cornerWeight[0][cx] * cornerWeight[1][cy] * 
+                              cornerWeight[2][cz])
+    return (tuple(np.array(ii).T for ii in index), np.array(weight).T)
+
+# -------------------------------------------------------------------------- #
+
+
+# -------------------------------------------------------------------------- #
+
+def efield_cut(xx=None, yy=None, zz=None, source="phi", phi=False):
+    """
+This function extracts the electric field (Ex, Ey, Ez) on a line, a plane 
+or the whole grid, reading only the potential around it by 'phi_box'.
+It returns the list of the arrays of Ex, Ey, Ez indexed as [x, y, z] of 
+the directions which are not fixed.
+ - xx, yy, zz: Grid numbers of the fixed directions, or None for the whole 
+               axis.
+ - source: With "phi", E = -grad(phi) is computed from the potential by 
+           the central differences (one-sided at the ends of the grid).
+           With "warp", the self electric field of WARP ('getselfe') is 
+           used.
+           < "phi", "warp" >
+           {Default="phi"}
+ - phi: If this is True, the potential on the same grid points is also 
+        returned as the 4th array.
+        {Default=False}
+    """
+    assert source=="phi" or source=="warp", ValueError(
+            'Source must be one of "phi" and "warp"')
+    index = (xx, yy, zz)
+    if source == "warp":
+        ee = [np.array(getselfe(comp=ax, ix=xx, iy=yy, iz=zz)) 
+              for ax in ("x", "y", "z")]
+        if phi:
+            ee.append(np.array(getphi(ix=xx, iy=yy, iz=zz)))
+        return ee
+    # Only the grid points of the cut and their neighbors for the 
+    # differences are read from WARP
+    slab = []
+    pick = []
+    for ii, ax in zip(index, ("x", "y", "z")):
+        nn = getattr(w3d, "n" + ax)
+        if ii is None:
+            slab.append((0, nn + 1))
+            pick.append(slice(None))
+        else:
+            lo = max(ii - 1, 0)
+            slab.append((lo, min(ii + 1, nn) + 1))
+            pick.append(ii - lo)
+    pp = np.asarray(phi_box(slab), dtype=np.float64)
+    pick = tuple(pick)
+    ee = [-np.gradient(pp, getattr(w3d, "d" + ax), axis=i)[pick] 
+          for i, ax in enumerate(("x", "y", "z"))]
+    if phi:
+        ee.append(pp[pick].copy())
+    return ee
+
+
+def _efield_header(posNames, phi, delim):
+    heads = ["{ax}(m)".format(ax=ax) for ax in posNames]
+    heads += ["Ex(V/m)", "Ey(V/m)", "Ez(V/m)"]
+    if phi:
+        heads.append("phi(V)")
+    return delim.join(heads)
+
+# -------------------------------------------------------------------------- #
+
+
+# -------------------------------------------------------------------------- #
+
+def efield_1d_xyz(direction=None, ts=None, dirName="E_field_1d_data", 
+                  fileName="E_field_data", delim="\t", 
+                  xx=0, yy=0, zz=0, source="phi", phi=False):
+    """ 
+This function exports electric field data 1D of XYZ geomtrey.
+Electric field data includes position and field (Ex, Ey, Ez) 
+Arguments are following;
+ - direction: Exported electric field will be along this direction.
+              < "x", "y", "z" >
+ - ts: All electric field data will be saved when the time-step is 'ts'
+         < e.g. ts=[100, 200] >
+ - dirName: Field data will be saved in the directory having this name.
+            {Default="E_field_1d_data"}
+ - fileName: Field data at each time-step will be saved in the file 
+             having the name of 'fileName_time-step_ts.txt'.
+             {Default="E_field_data"}
+             < e.g. E_field_data_100_ts.txt, at time-step=100 >
+ - delim: Each components of data will be separated with 
+          this delimiter in .txt file.
+          {Default="\t"  (tab)}
+ - xx, yy, zz: Grid numbers of the line for the other two directions.
+               {Default=0}
+ - source: < "phi", "warp" > (see 'efield_cut')
+           {Default="phi"}
+ - phi: If this is True, the potential is also saved in the same file.
+        {Default=False}
+    """
+    assert direction=="x" or direction=="y" or direction=="z", ValueError(
+            'Direction must be one of "x", "y", and "z"')
+    assert ts is not None, ValueError(
+            'Time-step is not defined for data')
+    assert isinstance(ts, list) is True, ValueError(
+            'Time-step must be given by the list type')
+    assert isinstance(dirName, str) is True, ValueError(
+            'Directory name must be given by the string type')
+    assert isinstance(fileName, str) is True, ValueError(
+            'File name must be given by the string type')
+    cut = {"xx": xx, "yy": yy, "zz": zz}
+    cut[direction * 2] = None
+    header = _efield_header([direction], phi, delim)
+    scheduler.make_dir(dirName)
+    def save_1d_efield():
+        ee = efield_cut(source=source, phi=phi, **cut)
+        _submit_phi_file(dirName, fileName, 
+                         header, [grid_axis(direction)], ee, delim)
+    scheduler.schedule(save_1d_efield, ts=ts)
+
+
+def efield_2d_xyz(plane=None, ts=None, dirName="E_field_2d_data", 
+                  fileName="E_field_data", delim="\t", 
+                  xx=0, yy=0, zz=0, source="phi", phi=False):
+    """ 
+This function exports electric field data 2D of XYZ geomtrey.
+Electric field data includes position and field (Ex, Ey, Ez) 
+Arguments are following;
+ - plane: Exported electric field will be on this plane.
+          < "xy", "yz", "zx" >
+ - ts: All electric field data will be saved when the time-step is 'ts'
+         < e.g. ts=[100, 200] >
+ - dirName: Field data will be saved in the directory having this name.
+            {Default="E_field_2d_data"}
+ - fileName: Field data at each time-step will be saved in the file 
+             having the name of 'fileName_time-step_ts.txt'.
+             {Default="E_field_data"}
+ - delim: Each components of data will be separated with 
+          this delimiter in .txt file.
+          {Default="\t"  (tab)}
+ - xx, yy, zz: Grid number of the plane for the normal direction.
+               {Default=0}
+ - source: < "phi", "warp" > (see 'efield_cut')
+           {Default="phi"}
+ - phi: If this is True, the potential is also saved in the same file.
+        {Default=False}
+    """
+    assert plane=="xy" or plane=="yz" or plane=="zx", ValueError(
+            'Plane must be one of "xy", "yz", and "zx"')
+    assert ts is not None, ValueError(
+            'Time-step is not defined for data')
+    assert isinstance(ts, list) is True, ValueError(
+            'Time-step must be given by the list type')
+    assert isinstance(dirName, str) is True, ValueError(
+            'Directory name must be given by the string type')
+    assert isinstance(fileName, str) is True, ValueError(
+            'File name must be given by the string type')
+    cut = {"xx": xx, "yy": yy, "zz": zz}
+    cut[plane[0] * 2] = None
+    cut[plane[1] * 2] = None
+    header = _efield_header([plane[0], plane[1]], phi, delim)
+    scheduler.make_dir(dirName)
+    def save_2d_efield():
+        ee = efield_cut(source=source, phi=phi, **cut)
+        if plane == "zx":
+            ee = [np.ascontiguousarray(col.T) for col in ee]
+        _submit_phi_file(dirName, fileName, 
+                         header, [grid_axis(plane[0]), 
+                                  grid_axis(plane[1])], ee, delim)
+    scheduler.schedule(save_2d_efield, ts=ts)
+
+
+def efield_3d_xyz(ts=None, dirName="E_field_3d_data", 
+                  fileName="E_field_data", delim="\t", 
+                  source="phi", phi=False):
+    """ 
+This function exports electric field data 3D of XYZ geomtrey.
+Electric field data includes position (x,y,z) and field (Ex, Ey, Ez) 
+Arguments are following;
+ - ts: All electric field data will be saved when the time-step is 'ts'
+         < e.g. ts=[100, 200] >
+ - dirName: Field data will be saved in the directory having this name.
+            {Default="E_field_3d_data"}
+ - fileName: Field data at each time-step will be saved in the file 
+             having the name of 'fileName_time-step_ts.txt'.
+             {Default="E_field_data"}
+ - delim: Each components of data will be separated with 
+          this delimiter in .txt file.
+          {Default="\t"  (tab)}
+ - source: < "phi", "warp" > (see 'efield_cut')
+           {Default="phi"}
+ - phi: If this is True, the potential is also saved in the same file.
+        {Default=False}
+    """
+    assert ts is not None, ValueError(
+            'Time-step is not defined for data')
+    assert isinstance(ts, list) is True, ValueError(
+            'Time-step must be given by the list type')
+    assert isinstance(dirName, str) is True, ValueError(
+            'Directory name must be given by the string type')
+    assert isinstance(fileName, str) is True, ValueError(
+            'File name must be given by the string type')
+    header = _efield_header(["x", "y", "z"], phi, delim)
+    scheduler.make_dir(dirName)
+    def save_3d_efield():
+        ee = efield_cut(source=source, phi=phi)
+        _submit_phi_file(dirName, fileName, 
+                         header, [grid_axis("x"), grid_axis("y"), 
+                                  grid_axis("z")], ee, delim)
+    scheduler.schedule(save_3d_efield, ts=ts)
+
+# -------------------------------------------------------------------------- #
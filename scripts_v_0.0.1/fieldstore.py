@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+
+"""
+fieldstore module test version
+
+Created on Thu May 17 2018
+
+@author: K. Yoo, 
+Intense Beam and Accelerator Laboratory(IBAL), 
+Ulsan National Institute of Science and Technology(UNIST),
+Republic of Korea
+"""
+
+# ========================================================================== #
+#                  Module for Saving Field Data in One HDF5 File             #
+# -------------------------------------------------------------------------- #
+#                                                                            #
+# 1. Electric potential data [ 2D, 3D ] of all time-steps in one file        #
+# 2. Reading electric potential data at one time-step or in a sub-region     #
+#                                                                            #
+# ========================================================================== #
+
+"""
+The electric potential data of all time-steps is saved in one HDF5 file
+(h5py is required), along the first (time) axis of a chunked and
+compressed data set.
+The potential data of the next time-step is almost same with the previous
+one, so it can be saved as the difference with the previous one;
+ - delta=True: The bits of each value are saved as XOR with the bits of
+               the previous time-step. This is not lossy, and the many zero
+               bits are compressed well.
+ - quantum: The potential is rounded to integer multiples of 'quantum'
+            (lossy). With 'delta=True', the difference of these integers
+            with the previous time-step is saved.
+Every 'keyInterval' time-steps, the potential is saved without difference,
+so reading one time-step needs at most 'keyInterval' time-steps.
+< e.g. import fieldstore as fs
+       fs.phi_store(ts=list(range(0, 10001, 100)), delta=True)
+       ...
+       store = fs.FieldStore("./E_potential_store/E_potential_data.h5")
+       phi = store.read(5000, region=(slice(0, 10), slice(None), 32)) >
+"""
+
+import atexit
+
+import numpy as np
+
+from warp import *
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+import asyncwriter
+import fielddata
+import parallelio
+import scheduler
+
+
+# -------------------------------------------------------------------------- #
+
+def phi_store(ts=None, plane=None, dirName="E_potential_store",
+              fileName="E_potential_data", xx=0, yy=0, zz=0,
+              compression="gzip", level=4, chunks=None,
+              delta=False, quantum=None, keyInterval=10):
+    """
+This function saves electric potential data 2D or 3D of XYZ geometry at
+all time-steps 'ts' in one HDF5 file 'fileName.h5'.
+Arguments are following;
+ - ts: All electric potential data will be saved when the time-step is 'ts'
+         < e.g. ts=[100, 200] >
+ - plane: Saved electric potential will be on this plane.
+          < "xy", "yz", "zx" >
+          {Default=None  (3D)}
+ - dirName: Potential data will be saved in the directory having this name.
+            {Default="E_potential_store"}
+ - fileName: Potential data will be saved in the file having the name of
+             'fileName.h5'.
+             {Default="E_potential_data"}
+ - xx, yy, zz: Grid number of the plane for the normal direction.
+               {Default=0}
+ - compression: Compression of the data.
+                "lz4" needs the package 'hdf5plugin'.
+                < "gzip", "lzf", "lz4", None >
+                {Default="gzip"}
+ - level: Compression level of "gzip" (0-9).
+          {Default=4}
+ - chunks: Shape of the chunk of one time-step.
+           {Default=None  (up to 64 grid points for each direction)}
+ - delta: If this is True, the difference with the previous time-step is
+          saved.
+          {Default=False}
+ - quantum: If this is given, the potential is rounded to the integer
+            multiples of 'quantum' (V).
+            {Default=None  (not lossy)}
+ - keyInterval: Number of time-steps between the time-steps saved without
+                difference when 'delta=True'.
+                {Default=10}
+It returns the 'FieldStoreWriter' of the file, or None on the processes 
+of parallel WARP other than rank 0.
+    """
+    assert h5py is not None, ImportError(
+            'h5py is required to save data in HDF5 file')
+    assert ts is not None, ValueError(
+            'Time-step is not defined for data')
+    assert isinstance(ts, list) is True, ValueError(
+            'Time-step must be given by the list type')
+    assert plane is None or plane=="xy" or plane=="yz" or plane=="zx", \
+            ValueError('Plane must be one of "xy", "yz", and "zx"')
+    assert isinstance(dirName, str) is True, ValueError(
+            'Directory name must be given by the string type')
+    assert isinstance(fileName, str) is True, ValueError(
+            'File name must be given by the string type')
+    assert keyInterval >= 1, ValueError(
+            'Key interval must be larger than 0')
+    if plane is None:
+        axisNames = ["x", "y", "z"]
+    else:
+        axisNames = [plane[0], plane[1]]
+    axes = [fielddata.grid_axis(ax) for ax in axisNames]
+    scheduler.make_dir(dirName)
+    # The data of 'getphi' is same on all processes of parallel WARP, so
+    # only the process of rank 0 opens and writes the file
+    store = None
+    if parallelio.rank() == 0:
+        store = FieldStoreWriter(
+                "./{dirName}/{fileName}.h5".format(dirName=dirName,
+                                                   fileName=fileName),
+                axisNames, axes, compression=compression, level=level,
+                chunks=chunks, delta=delta, quantum=quantum,
+                keyInterval=keyInterval)
+    def save_store_data():
+        # 'getphi' is called on all processes
+        if plane is None:
+            pp = fielddata.phi_volume()[-1]
+        else:
+            pp = fielddata.phi_plane(plane, xx=xx, yy=yy, zz=zz)[-1]
+        if store is None:
+            return
+        store.submit(top.it, pp)
+    scheduler.schedule(save_store_data, ts=ts)
+    return store
+
+# -------------------------------------------------------------------------- #
+
+
+# -------------------------------------------------------------------------- #
+
+class FieldStoreWriter(object):
+    """
+This class appends the field data of each time-step to the HDF5 file.
+It is made by 'phi_store', and the arguments are same with 'phi_store'.
+The data is appended in the order of 'submit', even when the background
+threads of 'asyncwriter' write them.
+    """
+
+    def __init__(self, fileName, axisNames, axes, compression="gzip",
+                 level=4, chunks=None, delta=False, quantum=None,
+                 keyInterval=10):
+        shape = tuple(len(ax) for ax in axes)
+        if chunks is None:
+            chunks = tuple(min(nn, 64) for nn in shape)
+        self.delta = delta
+        self.quantum = quantum
+        self.keyInterval = keyInterval
+        self.h5File = h5py.File(fileName, "w")
+        self.h5File.attrs["axes"] = ",".join(axisNames)
+        self.h5File.attrs["delta"] = int(delta)
+        self.h5File.attrs["quantum"] = 0. if quantum is None else quantum
+        self.h5File.attrs["keyInterval"] = keyInterval
+        for name, ax in zip(axisNames, axes):
+            self.h5File.create_dataset(name, data=ax)
+        if quantum is not None:
+            dataType = np.int64
+        elif delta:
+            dataType = np.uint64
+        else:
+            dataType = np.float64
+        self.phi = self.h5File.create_dataset(
+                "phi", shape=(0,) + shape, maxshape=(None,) + shape,
+                chunks=(1,) + tuple(chunks), dtype=dataType, shuffle=True,
+                **_compression_args(compression, level))
+        self.ts = self.h5File.create_dataset(
+                "ts", shape=(0,), maxshape=(None,), dtype=np.int64,
+                chunks=(1024,))
+        self.prev = None
+        self.sequence = asyncwriter.WriteSequence()
+        atexit.register(self.close)
+
+    def submit(self, ts, pp):
+        """
+This function appends the field data 'pp' at the time-step 'ts' by 
+'asyncwriter', after the data submitted before it.
+        """
+        self.sequence.submit(self._append, ts, pp)
+
+    def _append(self, ts, pp):
+        nn = self.phi.shape[0]
+        self.phi.resize(nn + 1, axis=0)
+        self.ts.resize(nn + 1, axis=0)
+        self.phi[nn] = self._encode(nn, np.asarray(pp))
+        self.ts[nn] = ts
+        self.h5File.flush()
+
+    def _encode(self, nn, pp):
+        if self.quantum is not None:
+            pp = np.rint(pp / self.quantum).astype(np.int64)
+        elif self.delta:
+            pp = np.ascontiguousarray(pp, dtype=np.float64).view(np.uint64)
+        if not self.delta:
+            return pp
+        prev, self.prev = self.prev, pp
+        if nn % self.keyInterval == 0:
+            return pp
+        if self.quantum is not None:
+            return pp - prev
+        return pp ^ prev
+
+    def close(self):
+        """
+This function writes the remaining data and closes the file.
+        """
+        asyncwriter.flush()
+        if self.h5File.id.valid:
+            self.h5File.close()
+
+
+def _compression_args(compression, level):
+    if compression is None:
+        return {}
+    if compression == "gzip":
+        return {"compression": "gzip", "compression_opts": level}
+    if compression == "lzf":
+        return {"compression": "lzf"}
+    assert compression == "lz4", ValueError(
+            'Compression must be one of "gzip", "lzf", "lz4", and None')
+    import hdf5plugin
+    return dict(hdf5plugin.LZ4())
+
+# -------------------------------------------------------------------------- #
+
+
+# -------------------------------------------------------------------------- #
+
+class FieldStore(object):
+    """
+This class reads the HDF5 file saved by 'phi_store'.
+Only the chunks of the asked time-step and region are read, and for
+'delta=True', also those of the previous time-steps until the last
+time-step saved without difference.
+ - fileName: Name of the file including the path and ".h5".
+< e.g. store = FieldStore("./E_potential_store/E_potential_data.h5")
+       store.ts                  (all saved time-steps)
+       store.axis("x")           (positions of the grid)
+       store.read(500)           (all potential data at time-step 500)
+       store.read(500, region=(slice(10, 20), 5, slice(None))) >
+    """
+
+    def __init__(self, fileName=None):
+        assert h5py is not None, ImportError(
+                'h5py is required to read data in HDF5 file')
+        assert isinstance(fileName, str) is True, ValueError(
+                'File name must be given by the string type')
+        self.h5File = h5py.File(fileName, "r")
+        self.axisNames = self.h5File.attrs["axes"].split(",")
+        self.delta = bool(self.h5File.attrs["delta"])
+        quantum = float(self.h5File.attrs["quantum"])
+        self.quantum = quantum if quantum > 0. else None
+        self.keyInterval = int(self.h5File.attrs["keyInterval"])
+        self.ts = self.h5File["ts"][:]
+        self._index = dict((int(tt), i) for i, tt in enumerate(self.ts))
+
+    def axis(self, name):
+        """
+This function returns the positions of the grid along the axis 'name'.
+        """
+        return self.h5File[name][:]
+
+    def read(self, ts, region=None):
+        """
+This function returns the potential data at the time-step 'ts'.
+'region' is the tuple of the indices or slices for each axis.
+        """
+        assert ts in self._index, ValueError(
+                'Time-step {ts} is not saved'.format(ts=ts))
+        if region is None:
+            region = ()
+        elif not isinstance(region, tuple):
+            region = (region,)
+        nn = self._index[ts]
+        phi = self.h5File["phi"]
+        if not self.delta:
+            pp = phi[(nn,) + region]
+        else:
+            key = nn - nn % self.keyInterval
+            pp = phi[(key,) + region]
+            for i in range(key + 1, nn + 1):
+                if self.quantum is not None:
+                    pp = pp + phi[(i,) + region]
+                else:
+                    pp = pp ^ phi[(i,) + region]
+            if self.quantum is None:
+                pp = np.asarray(pp).view(np.float64)
+        if self.quantum is not None:
+            pp = pp * self.quantum
+        return pp
+
+    def close(self):
+        self.h5File.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+# -------------------------------------------------------------------------- #
@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+
+"""
+iobudget module test version
+
+Created on Thu May 17 2018
+
+@author: K. Yoo, 
+Intense Beam and Accelerator Laboratory(IBAL), 
+Ulsan National Institute of Science and Technology(UNIST),
+Republic of Korea
+"""
+
+# ========================================================================== #
+#                  Module for Keeping the Output in a Budget                 #
+# -------------------------------------------------------------------------- #
+#                                                                            #
+# 1. Time and bytes of the output of each exporter measured at every save    #
+# 2. Interval, fraction of particles and precision adjusted to the budget    #
+# 3. Log of all adjustments                                                  #
+#                                                                            #
+# ========================================================================== #
+
+"""
+The exporters given the same 'IOBudget' by the argument 'budget' (ts_data,
+zcross_data, vtk_data, phi_1d_xyz, phi_2d_xyz, phi_3d_xyz) measure the time
+and the bytes of their output, and the output is reduced when it exceeds
+the budget;
+ - stepFraction: The time of the output is at most this fraction of the
+                 wall time of the simulation.
+ - gbPerHour: The output is at most this GB (1024**3 bytes) per hour of
+              the wall time.
+< e.g. import iobudget as ib
+       budget = ib.IOBudget(stepFraction=0.05)
+       pd.ts_data(part=beam, ts=list(range(0, 10001, 10)), budget=budget)
+       pd.vtk_data(part=beam, tsstart=0, tsend=10000, budget=budget) >
+Every 'window' time-steps, the load (time and bytes of the last 'window'
+time-steps divided by the budget) is checked. When it is larger than 1,
+the output of the exporter having the largest load is reduced by one of
+the following, in this order;
+ - precision: Columns saved as "float32" instead of "float64" (only for
+              the binary files, 'fileType="npy"' and vtk files).
+ - fraction: The fraction of the particles saved is halved, selected by
+             the particle id (pid), so the particles saved are always
+             the part of the particles saved before (particle exporters).
+ - interval: Only every 'interval' time-step of the exporter is saved,
+             and the interval is doubled.
+When the load would stay small after the last reduction is undone, it is
+undone. Each reduction and undoing is written in the log file with the
+time-step, so the saved data can be interpreted.
+With parallel WARP, the time and the bytes of all processes are summed, so
+all processes adjust the output at the same time-steps.
+"""
+
+import collections
+import copy
+import os
+import threading
+import time
+
+import numpy as np
+
+from warp import *
+
+import asyncwriter
+import parallelio
+import scheduler
+import selection
+
+
+LOG_HEADERS = ("ts{de}time(s){de}exporter{de}action{de}interval"
+               "{de}fraction{de}dtype{de}load")
+
+
+# -------------------------------------------------------------------------- #
+
+class IOBudget(object):
+    """
+This class keeps the output of the exporters in the budget.
+At least one of 'stepFraction' and 'gbPerHour' must be given.
+Arguments are following;
+ - stepFraction: Maximum fraction of the wall time spent for the output.
+                 The time of the exporters in the time-step and the time
+                 of writing the files by 'asyncwriter' are included.
+                 < e.g. stepFraction=0.05  (5 %) >
+                 {Default=None}
+ - gbPerHour: Maximum size of the output in GB (1024**3 bytes) per hour
+              of the wall time.
+              {Default=None}
+ - window: Number of time-steps for measuring the load, and between the
+           adjustments. It should be larger than the number of time-steps
+           between the saves of the exporters, and for the exporter saved
+           every 'interval' time-step, it is 'window' times 'interval'.
+           {Default=50}
+ - lowLoad: The last reduction is undone when the load after undoing it is
+            estimated smaller than this.
+            {Default=0.8}
+ - minFraction: Smallest fraction of the particles saved.
+                {Default=1/64}
+ - maxInterval: Largest interval of the time-steps saved.
+                {Default=64}
+ - logFile: All adjustments are written in this file by the process of
+            rank 0.
+            {Default="io_budget_log.txt"}
+ - delim: Each column of the log file will be separated with this
+          delimiter.
+          {Default="\t"  (tab)}
+    """
+
+    def __init__(self, stepFraction=None, gbPerHour=None, window=50,
+                 lowLoad=0.8, minFraction=1./64, maxInterval=64,
+                 logFile="io_budget_log.txt", delim="\t"):
+        assert stepFraction is not None or gbPerHour is not None, \
+                ValueError('Budget is not defined by stepFraction or '
+                           'gbPerHour')
+        assert stepFraction is None or stepFraction > 0., ValueError(
+                'Fraction of step time must be larger than 0')
+        assert gbPerHour is None or gbPerHour > 0., ValueError(
+                'GB per hour must be larger than 0')
+        assert window >= 1, ValueError(
+                'Window must be larger than 0')
+        self.stepFraction = stepFraction
+        self.gbPerHour = gbPerHour
+        self.window = window
+        self.lowLoad = lowLoad
+        self.minFraction = minFraction
+        self.maxInterval = maxInterval
+        self.logFile = logFile
+        self.delim = delim
+        self.controls = []
+        # Controls in the order of the reductions, undone from the last
+        self.history = []
+        self.steps = collections.deque()
+        self.nSteps = 0
+        self.nWait = window
+        self.t0 = time.time()
+        self.lock = threading.Lock()
+        if parallelio.rank() == 0:
+            logDir = os.path.dirname(logFile)
+            if logDir and not os.path.isdir(logDir):
+                os.makedirs(logDir)
+            logWriteFile = open(logFile, "w")
+            logWriteFile.write(LOG_HEADERS.format(de=delim))
+            logWriteFile.close()
+        scheduler.schedule(self.check, tsstart=top.it + 1)
+
+    def register(self, name, dtype="float64", decimate=False,
+                 reduce=False):
+        """
+This function returns the control of the output of the exporter 'name'.
+It is called by the exporters given this budget.
+ - dtype: Data type of the columns saved by the exporter.
+ - decimate: If this is True, the fraction of the particles can be
+             reduced.
+ - reduce: If this is True, the precision can be reduced to "float32".
+        """
+        control = OutputControl(name, self, dtype, decimate, reduce)
+        self.controls.append(control)
+        self.log(control, "start", 0.)
+        return control
+
+    def load(self, seconds, nbytes, wall):
+        """
+This function returns the load of the output of 'seconds' and 'nbytes'
+during the wall time 'wall'; the largest ratio to the budgets.
+        """
+        load = 0.
+        if wall <= 0.:
+            return load
+        if self.stepFraction is not None:
+            load = max(load, seconds / wall / self.stepFraction)
+        if self.gbPerHour is not None:
+            load = max(load, nbytes / 1024.**3 / (wall / 3600.) /
+                       self.gbPerHour)
+        return load
+
+    def check(self):
+        """
+This function adjusts the output of one exporter when the load is out of
+the budget. It is called after every time-step.
+The load of each exporter is measured during the last 'window' times
+'interval' time-steps, so it has the same number of saves after the
+interval is changed.
+        """
+        now = time.time()
+        self.steps.append((top.it, now))
+        if len(self.steps) > self.window * self.maxInterval + 1:
+            self.steps.popleft()
+        self.nSteps += 1
+        if self.nSteps < self.nWait or len(self.controls) == 0:
+            return
+        values = []
+        for control in self.controls:
+            span = min(self.window * control.interval, len(self.steps) - 1)
+            tsFirst, tFirst = self.steps[-1 - span]
+            control.prune(self.steps[0][0])
+            values += [now - tFirst] + list(control.cost(tsFirst))
+        # Time of each process is averaged, and bytes of all are summed
+        nranks = parallelio.nranks()
+        values = parallelio.allreduce(values)
+        walls = values[0::3] / nranks
+        timeRates = values[1::3] / nranks / np.maximum(walls, 1e-9)
+        byteRates = values[2::3] / np.maximum(walls, 1e-9)
+        loads = [(self.load(tr, br, 1.), control) for tr, br, control
+                 in zip(timeRates, byteRates, self.controls)]
+        load = self.load(timeRates.sum(), byteRates.sum(), 1.)
+        if load > 1.:
+            loads.sort(key=lambda lc: -lc[0])
+            for controlLoad, control in loads:
+                action = control.reduce_output()
+                if action is not None:
+                    self.history.append(control)
+                    self.log(control, action, load)
+                    self._wait(control)
+                    return
+            self.log(None, "limit", load)
+            self._wait(None)
+        elif len(self.history) > 0:
+            control = self.history[-1]
+            # Undoing the reduction doubles the load of the exporter
+            controlLoad = [cl for cl, ct in loads if ct is control][0]
+            if load + controlLoad < self.lowLoad:
+                self.history.pop()
+                self.log(control, control.restore_output(), load)
+                self._wait(control)
+
+    def _wait(self, control):
+        # The next adjustment waits until the load of 'control' is
+        # measured with the new interval
+        self.nSteps = 0
+        self.nWait = self.window
+        if control is not None:
+            self.nWait *= control.interval
+
+    def log(self, control, action, load):
+        """
+This function writes the adjustment 'action' of 'control' in the log.
+        """
+        if parallelio.rank() != 0:
+            return
+        de = self.delim
+        if control is None:
+            row = [str(top.it), "{:.3f}".format(time.time() - self.t0),
+                   "all", action, "", "", "", "{:.3f}".format(load)]
+        else:
+            row = [str(top.it), "{:.3f}".format(time.time() - self.t0),
+                   control.name, action, str(control.interval),
+                   repr(control.fraction), control.dtype,
+                   "{:.3f}".format(load)]
+        with self.lock:
+            logWriteFile = open(self.logFile, "a")
+            logWriteFile.write("\n" + de.join(row))
+            logWriteFile.close()
+
+# -------------------------------------------------------------------------- #
+
+
+# -------------------------------------------------------------------------- #
+
+class OutputControl(object):
+    """
+This class is the output of one exporter, adjusted by 'IOBudget'.
+Without the budget ('budget=None'), the output is never adjusted.
+The exporter uses the following;
+ - wrap(action): Saving function called only every 'interval' time-step.
+ - submit(func, *args): 'asyncwriter.submit' measuring the time and the
+                        bytes of writing. 'func' returns the bytes written.
+ - select(sel): 'ParticleSelection' with the fraction of the particles.
+ - keep(pid): Mask of the particles kept with the fraction.
+ - dtype: Data type of the columns.
+    """
+
+    def __init__(self, name, budget=None, dtype="float64", decimate=False,
+                 reduce=False):
+        self.name = name
+        self.budget = budget
+        self.dtype = dtype
+        self.decimate = decimate
+        self.reduce = reduce and dtype == "float64"
+        self.interval = 1
+        self.fraction = 1.
+        self.nCalls = 0
+        # Reductions in the order, undone from the last
+        self.actions = []
+        self.costs = collections.deque()
+        self.lock = threading.Lock()
+        self.selections = {}
+
+    def wrap(self, action):
+        """
+This function returns the saving function 'action' called only every
+'interval' time-step, and measuring its time.
+        """
+        if self.budget is None:
+            return action
+        def budgetaction():
+            self.nCalls += 1
+            if (self.nCalls - 1) % self.interval != 0:
+                return
+            t0 = time.time()
+            try:
+                action()
+            finally:
+                self.add_cost(time.time() - t0, 0)
+        return budgetaction
+
+    def submit(self, func, *args):
+        """
+This function is same with 'asyncwriter.submit', and with the budget,
+the time and the bytes (returned by 'func') of writing are measured.
+        """
+        if self.budget is None:
+            asyncwriter.submit(func, *args)
+            return
+        asyncwriter.submit(self._write, threading.current_thread(),
+                           func, args)
+
+    def _write(self, caller, func, args):
+        t0 = time.time()
+        nbytes = func(*args)
+        # Writing in the time-step is already in the time of 'wrap'
+        seconds = 0.
+        if threading.current_thread() is not caller:
+            seconds = time.time() - t0
+        self.add_cost(seconds, nbytes or 0)
+
+    def add_cost(self, seconds, nbytes):
+        with self.lock:
+            self.costs.append((top.it, seconds, nbytes))
+
+    def cost(self, tsFirst):
+        """
+This function returns the time and the bytes of the output after the
+time-step 'tsFirst'.
+        """
+        with self.lock:
+            costs = [cc for cc in self.costs if cc[0] > tsFirst]
+        return sum(cc[1] for cc in costs), sum(cc[2] for cc in costs)
+
+    def prune(self, tsFirst):
+        with self.lock:
+            while len(self.costs) > 0 and self.costs[0][0] <= tsFirst:
+                self.costs.popleft()
+
+    def select(self, sel):
+        """
+This function returns the 'ParticleSelection' selecting 'fraction' of
+the particles selected by 'sel'.
+        """
+        if self.fraction >= 1.:
+            return sel
+        if self.fraction not in self.selections:
+            newSel = copy.copy(sel)
+            newSel.fraction = self.fraction * (
+                    1. if sel.fraction is None else sel.fraction)
+            self.selections[self.fraction] = newSel
+        return self.selections[self.fraction]
+
+    def keep(self, pid):
+        """
+This function returns the mask of the particles of 'pid' kept with
+'fraction', or None for all particles.
+        """
+        if self.fraction >= 1.:
+            return None
+        return selection.pid_fraction(pid) < self.fraction
+
+    def reduce_output(self):
+        """
+This function reduces the output by one step, and returns the name of
+the reduction, or None when it cannot be reduced more.
+        """
+        if self.reduce and self.dtype == "float64":
+            self.dtype = "float32"
+            action = "precision"
+        elif (self.decimate and
+              self.fraction / 2. >= self.budget.minFraction):
+            self.fraction /= 2.
+            action = "fraction"
+        elif self.interval * 2 <= self.budget.maxInterval:
+            self.interval *= 2
+            action = "interval"
+        else:
+            return None
+        self.actions.append(action)
+        return action
+
+    def restore_output(self):
+        """
+This function undoes the last reduction and returns its name.
+        """
+        action = self.actions.pop()
+        if action == "precision":
+            self.dtype = "float64"
+        elif action == "fraction":
+            self.fraction *= 2.
+        else:
+            self.interval //= 2
+        return "restore " + action
+
+
+def register(budget=None, name=None, dtype="float64", decimate=False,
+             reduce=False):
+    """
+This function returns the control of the output of the exporter 'name'
+of 'budget', or the control never adjusted for 'budget=None'.
+    """
+    if budget is None:
+        return OutputControl(name, None, dtype, decimate, reduce)
+    return budget.register(name, dtype, decimate, reduce)
+
+# -------------------------------------------------------------------------- #
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+"""
+parallelio module test version
+
+Created on Thu May 17 2018
+
+@author: K. Yoo, 
+Intense Beam and Accelerator Laboratory(IBAL), 
+Ulsan National Institute of Science and Technology(UNIST),
+Republic of Korea
+"""
+
+# ========================================================================== #
+#                   Module for Saving Data of Parallel WARP                  #
+# -------------------------------------------------------------------------- #
+#                                                                            #
+# 1. Rank and domain of each process with MPI (mpi4py)                       #
+# 2. Index file of the data files saved by each process                      #
+# 3. Parallel vtk files (.pvtu, .pvtr) for ParaView                          #
+#                                                                            #
+# ========================================================================== #
+
+"""
+With 'parallel=True', the exporters of particledata and fielddata save the
+local data of each process to its own file (shard), without gathering the
+data to one process.
+The shards are tied together by the index file (.json) or the parallel vtk
+file (.pvtu, .pvtr) which is saved by the process of rank 0.
+Only the small information of the shards (number of particles, extent of
+the domain) is gathered.
+Without MPI (mpi4py), the script runs as one process of rank 0.
+< e.g. mpirun -np 4 python warp_script.py >
+"""
+
+import json
+import os
+
+import numpy as np
+
+from warp import *
+
+try:
+    from mpi4py import MPI
+    comm = MPI.COMM_WORLD
+except ImportError:
+    comm = None
+
+
+# VTK type names of the NumPy data types
+VTK_TYPES = {"float32": "Float32", "float64": "Float64",
+             "int32": "Int32", "int64": "Int64",
+             "uint8": "UInt8"}
+
+
+# -------------------------------------------------------------------------- #
+
+def rank():
+    """
+This function returns the rank of this process.
+    """
+    if comm is None:
+        return 0
+    return comm.Get_rank()
+
+
+def nranks():
+    """
+This function returns the number of processes.
+    """
+    if comm is None:
+        return 1
+    return comm.Get_size()
+
+
+def gather(info):
+    """
+This function gathers 'info' of all processes to the process of rank 0.
+It returns the list of 'info' ordered by rank on rank 0, and None on
+the other processes.
+All processes must call this at the same time-step.
+    """
+    if comm is None:
+        return [info]
+    return comm.gather(info, root=0)
+
+
+def allreduce(values):
+    """
+This function returns the sums of the arrays 'values' of all processes
+on all processes.
+All processes must call this at the same time-step.
+    """
+    if comm is None:
+        return np.asarray(values)
+    return comm.allreduce(np.asarray(values), op=MPI.SUM)
+
+
+def shard_name(fileName=None, ext=""):
+    """
+This function returns the name of the file saved by this process.
+< e.g. shard_name("time_particle_data_100_ts", ".txt")
+       = "time_particle_data_100_ts_r0003.txt", at rank 3 >
+    """
+    assert isinstance(fileName, str) is True, ValueError(
+            'File name must be given by string type')
+    return "{fileName}_r{rank:04d}{ext}".format(fileName=fileName,
+                                                rank=rank(), ext=ext)
+
+
+def local_extent():
+    """
+This function returns the grid numbers of the domain of this process
+as the list of ranges of x, y, z (the end is included).
+The neighboring domains share the grid points at their boundary.
+    """
+    fsd = top.fsdecomp
+    extent = []
+    for ax in ("x", "y", "z"):
+        starts = getattr(fsd, "i" + ax)
+        sizes = getattr(fsd, "n" + ax)
+        iproc = getattr(fsd, "i" + ax + "proc")
+        extent.append([int(starts[iproc]),
+                       int(starts[iproc] + sizes[iproc])])
+    return extent
+
+# -------------------------------------------------------------------------- #
+
+
+# -------------------------------------------------------------------------- #
+
+def write_index(indexFileName=None, shards=None, info=None):
+    """
+This function saves the index file (.json) of the shards.
+Arguments are following;
+ - indexFileName: Name of the index file including the path and ".json".
+ - shards: This is the list of the dictionaries of each shard gathered
+           by 'gather'.
+           < e.g. [{"rank": 0, "file": "data_r0000.txt", "n": 100}, ...] >
+ - info: This is the dictionary of other information saved in 
+         the index file.
+         < e.g. {"ts": 100, "columns": ["x", "y", "z"]} >
+    """
+    assert indexFileName is not None, ValueError(
+            'File name is not defined for index')
+    assert shards is not None, ValueError(
+            'Shards are not defined for index')
+    indexDir = os.path.dirname(os.path.abspath(indexFileName))
+    index = dict(info or {})
+    index["nranks"] = len(shards)
+    index["shards"] = []
+    for shard in shards:
+        shard = dict(shard)
+        shard["file"] = _relpath(shard["file"], indexDir)
+        index["shards"].append(shard)
+    indexWriteFile = open(indexFileName, "w")
+    json.dump(index, indexWriteFile, indent=1)
+    indexWriteFile.close()
+
+
+def write_pvtu(pvtuFileName=None, pieceFiles=None, pointData=None,
+               pointsType="float64"):
+    """
+This function saves the parallel vtk file (.pvtu) of the particle data
+saved by 'pointsToVTK' of each process.
+Arguments are following;
+ - pvtuFileName: Name of the file including the path and ".pvtu".
+ - pieceFiles: This is the list of the .vtu files of all processes.
+ - pointData: This is the dictionary of the name and NumPy data type of
+              the data of each particle.
+              < e.g. {"particle": "int64"} >
+ - pointsType: NumPy data type of the positions (x, y, z) of the particles,
+               which must be same with that of the .vtu files.
+               {Default="float64"}
+    """
+    assert pvtuFileName is not None, ValueError(
+            'File name is not defined for data')
+    assert pieceFiles is not None, ValueError(
+            'Pieces are not defined for data')
+    pvtuDir = os.path.dirname(os.path.abspath(pvtuFileName))
+    pvtuLines = ['<?xml version="1.0"?>',
+                 '<VTKFile type="PUnstructuredGrid" version="0.1" '
+                 'byte_order="LittleEndian">',
+                 '  <PUnstructuredGrid GhostLevel="0">']
+    pvtuLines += _pdata_lines("PPointData", pointData)
+    pvtuLines += ['    <PPoints>',
+                  '      <PDataArray type="{tp}" '
+                  'NumberOfComponents="3"/>'.format(
+                          tp=VTK_TYPES[np.dtype(pointsType).name]),
+                  '    </PPoints>']
+    for pieceFile in pieceFiles:
+        pvtuLines.append('    <Piece Source="{src}"/>'.format(
+                src=_relpath(pieceFile, pvtuDir)))
+    pvtuLines += ['  </PUnstructuredGrid>', '</VTKFile>', '']
+    pvtuWriteFile = open(pvtuFileName, "w")
+    pvtuWriteFile.write("\n".join(pvtuLines))
+    pvtuWriteFile.close()
+
+
+def write_pvtr(pvtrFileName=None, wholeExtent=None, pieces=None,
+               pointData=None):
+    """
+This function saves the parallel vtk file (.pvtr) of the field data
+saved by 'gridToVTK' of each process.
+Arguments are following;
+ - pvtrFileName: Name of the file including the path and ".pvtr".
+ - wholeExtent: This is the list of ranges of x, y, z of the whole grid.
+ - pieces: This is the list of (extent, file) of all processes.
+ - pointData: This is the dictionary of the name and NumPy data type of
+              the data on each grid point.
+              < e.g. {"phi": "float64"} >
+    """
+    assert pvtrFileName is not None, ValueError(
+            'File name is not defined for data')
+    assert pieces is not None, ValueError(
+            'Pieces are not defined for data')
+    pvtrDir = os.path.dirname(os.path.abspath(pvtrFileName))
+    pvtrLines = ['<?xml version="1.0"?>',
+                 '<VTKFile type="PRectilinearGrid" version="0.1" '
+                 'byte_order="LittleEndian">',
+                 '  <PRectilinearGrid WholeExtent="{ext}" '
+                 'GhostLevel="0">'.format(ext=_extent(wholeExtent))]
+    pvtrLines += _pdata_lines("PPointData", pointData)
+    pvtrLines += ['    <PCoordinates>'] + \
+                 ['      <PDataArray type="Float64" '
+                  'Name="{ax}_coordinates"/>'.format(ax=ax)
+                  for ax in ("x", "y", "z")] + \
+                 ['    </PCoordinates>']
+    for extent, pieceFile in pieces:
+        pvtrLines.append('    <Piece Extent="{ext}" Source="{src}"/>'.\
+                         format(ext=_extent(extent),
+                                src=_relpath(pieceFile, pvtrDir)))
+    pvtrLines += ['  </PRectilinearGrid>', '</VTKFile>', '']
+    pvtrWriteFile = open(pvtrFileName, "w")
+    pvtrWriteFile.write("\n".join(pvtrLines))
+    pvtrWriteFile.close()
+
+
+def _pdata_lines(tag, pointData):
+    lines = ['    <{tag}>'.format(tag=tag)]
+    for name in sorted(pointData or {}):
+        lines.append('      <PDataArray type="{tp}" Name="{name}"/>'.format(
+                tp=VTK_TYPES[np.dtype(pointData[name]).name], name=name))
+    lines.append('    </{tag}>'.format(tag=tag))
+    return lines
+
+
+def _extent(extent):
+    return " ".join(str(int(i)) for rr in extent for i in rr)
+
+
+def _relpath(fileName, baseDir):
+    return os.path.relpath(os.path.abspath(fileName),
+                           baseDir).replace(os.sep, "/")
+
+# -------------------------------------------------------------------------- #
@@ -18,6 +18,7 @@ Republic of Korea
 # 1. Particle data by ZCrossingParticles in WARP                             #
 # 2. Particle data at specific time-step                                     #
 # 3. Particle data at specific time-step with vtk format for ParaView        #
+# 4. Trajectories of tracked particles at every time-step                    #
 #                                                                            #
 # ========================================================================== #
 
@@ -29,18 +30,44 @@ And, this module must be imported in the scripts.
 """
 
 import os
+import atexit
+import threading
 import numpy as np
 
 from warp import *
 from warp.particles.extpart import ZCrossingParticles
 from pyevtk.hl import pointsToVTK
 
+import asyncwriter
+import binarydata
+import iobudget
+import parallelio
+import runcontainer
+import scheduler
+import selection
+import textwriter
+import vtkseries
+
+
+ZCROSS_COLUMNS = ["pid", "x", "y", "t", "vx", "vy", "vz"]
+ZCROSS_HEADERS = \
+    "pid{de}x(m){de}y(m){de}t(s){de}vx(m/s){de}vy(m/s){de}vz(m/s)"
+ZCROSS_FORMATS = ["%r", "%.9f", "%.9f", "%r", "%r", "%r", "%r"]
+TS_COLUMNS = ["x", "y", "z", "vx", "vy", "vz"]
+TS_HEADERS = \
+    "x(m){de}y(m){de}z(m){de}vx(m/s){de}vy(m/s){de}vz(m/s)"
+TS_FORMATS = ["%.9f", "%.9f", "%.9f", "%r", "%r", "%r"]
+VTK_POINT_DATA = ["vx", "vy", "vz", "pid", "weight", "gamma", "ke"]
+TRAJ_HEADERS = "ts{de}t(s){de}pid{de}" + TS_HEADERS
+TRAJ_FORMATS = ["%d", "%r", "%r"] + TS_FORMATS
       
 # -------------------------------------------------------------------------- #
 
 def zcross_data(
         zPos=None, dirName="zposition_particle_data", 
-        fileName="z_particle_data", delim="\t", ts=None):
+        fileName="z_particle_data", delim="\t", ts=None, 
+        fileType="txt", dtype="float64", 
+        flushEvery=None, flushParticles=None, part=None, budget=None):
     """
 This function exports particle data 'ZCrossingParticles' in WARP.
 Particle data includes position (x,y,z) and velocity (vx, vy, vz)
@@ -58,6 +85,40 @@ Arguments are following;
           this delimiter in .txt file
           {Default="\t"  (tab)}
  - ts: All particle data will be saved when the time-step is 'ts'
+ - fileType: Format of the saved file.
+             "txt" is the delimited text file, and "npy" is the binary 
+             columnar file (pid, x, y, t, vx, vy, vz) of 'binarydata' 
+             which can be opened with 'np.load(mmap_mode="r")'.
+             < "txt", "npy" >
+             {Default="txt"}
+ - dtype: Data type of the columns when 'fileType="npy"'.
+          < "float32", "float64" >
+          {Default="float64"}
+ - flushEvery: If this is given, particle data is saved by streaming;
+               the particle data collected until then is appended to the 
+               file of each z-position every 'flushEvery' time-steps, 
+               and removed from the memory.
+               With 'fileType="npy"', the file is the stream of 
+               'binarydata' having the name of 'fileName_z-position.npys'.
+               The remaining data is saved at 'ts' if it is given, 
+               and at the end of the script.
+               {Default=None  (all data is saved at 'ts' at once)}
+ - flushParticles: If this is given, particle data is saved by streaming 
+                   same as 'flushEvery', whenever the number of particles 
+                   collected at a z-position reaches 'flushParticles'.
+                   {Default=None}
+ - part: If this is given, the particles of this species (or the list of 
+         species) crossing all z-positions are found at once by 
+         'MultiZCrossing', instead of one 'ZCrossingParticles' for each 
+         z-position. It is faster for many z-positions.
+         {Default=None  (ZCrossingParticles of all species)}
+ - budget: The output is adjusted to this 'IOBudget' of the module 
+           'iobudget' by the interval of saving or streaming, the 
+           fraction of the particles and the precision ("float32" of 
+           'fileType="npy"').
+           {Default=None  (no adjustment)}
+With parallel WARP, the particle data is gathered to the process of rank 0,
+and only the process of rank 0 saves the files.
     """
     assert zPos is not None, ValueError(
             'z position is not defined for data')
@@ -67,51 +128,318 @@ Arguments are following;
             'Directory name must be given by the string type')
     assert isinstance(fileName, str) is True, ValueError(
             'File name must be given by the string type')
-    assert ts is not None, ValueError(
+    streaming = flushEvery is not None or flushParticles is not None
+    assert ts is not None or streaming, ValueError(
             'Time-step is not defined for data')
+    assert fileType=="txt" or fileType=="npy", ValueError(
+            'File type must be one of "txt" and "npy"')
     nZPos = len(zPos)
-    zPartData = []
-    for i in range(nZPos):
-        zPartData.append(ZCrossingParticles(zz=zPos[i], laccumulate=1))
-    @callfromafterstep
-    def savezposdata():
-        if top.it == ts:
-            zPartDir = './{dirName}/'.format(dirName=dirName)
-            if not os.path.exists(zPartDir):
-                os.mkdir(zPartDir)
+    if part is None:
+        zPartData = []
+        for i in range(nZPos):
+            zPartData.append(ZCrossingParticles(zz=zPos[i], laccumulate=1))
+    else:
+        detector = MultiZCrossing(part, zPos)
+        zPartData = [detector.plane(i) for i in range(nZPos)]
+    scheduler.make_dir(dirName)
+    zFileNames = ["./{dirName}/{fileName}_{zPos}m".format(
+            dirName=dirName, fileName=fileName, zPos=zPos[i]) 
+            for i in range(nZPos)]
+    # Layout of the files for 'runcontainer'
+    zName = "{dirName}/{fileName}".format(dirName=dirName, fileName=fileName)
+    zLayout = runcontainer.layout(
+            fileType, key="z", header=ZCROSS_HEADERS.format(de=delim), 
+            formats=ZCROSS_FORMATS, delim=delim, dtype=dtype, 
+            stream=streaming)
+    control = iobudget.register(budget, zName, dtype, decimate=True, 
+                                reduce=fileType == "npy")
+    if not streaming:
+        def savezposdata():
+            zType = control.dtype if fileType == "npy" else None
             for i in range(nZPos):
-                zWriteFile = open("./{dirName}/{fileName}_{zPos}m.txt".\
-                                  format(dirName=dirName, fileName=fileName, 
-                                         zPos=zPos[i]), "w")
-                zHeaders = \
-                "pid{de}x(m){de}y(m){de}t(s){de}vx(m/s){de}vy(m/s){de}vz(m/s)".\
-                    format(de=delim)
-                zWriteFile.write(zHeaders)
-                znn = zPartData[i].getn()
-                zid = zPartData[i].getpid()
-                zxx = zPartData[i].getx()
-                zyy = zPartData[i].gety()
-                ztt = zPartData[i].gett()
-                zvx = zPartData[i].getvx()
-                zvy = zPartData[i].getvy()
-                zvz = zPartData[i].getvz()
-                for j in range(znn):
-                    zWriteFile.write("\n")
-                    zWriteFile.write("{pid}{de}".format(
-                            pid=zid[j], de=delim))
-                    zWriteFile.write("{xpos:.9f}{de}".format(
-                            xpos=zxx[j], de=delim))
-                    zWriteFile.write("{ypos:.9f}{de}".format(
-                            ypos=zyy[j], de=delim))
-                    zWriteFile.write("{tof}{de}".format(
-                            tof=ztt[j], de=delim))
-                    zWriteFile.write("{vx}{de}".format(
-                            vx=zvx[j], de=delim))
-                    zWriteFile.write("{vy}{de}".format(
-                            vy=zvy[j], de=delim))
-                    zWriteFile.write("{vz}".format(
-                            vz=zvz[j]))
-                zWriteFile.close()
+                zCols = _zcross_keep(control, _zcross_columns(zPartData[i]))
+                if parallelio.rank() != 0:
+                    continue
+                if runcontainer.active():
+                    control.submit(runcontainer.append, zName, zLayout, 
+                                   top.it, ZCROSS_COLUMNS, zCols, 
+                                   zPos[i], zType)
+                    continue
+                control.submit(_write_zcross_file, zFileNames[i], zCols, 
+                               delim, fileType, control.dtype)
+        scheduler.schedule(control.wrap(savezposdata), ts=ts)
+        return
+    # Order of the flushes appended to each file
+    zSeqs = []
+    for i in range(nZPos):
+        if not runcontainer.active() and parallelio.rank() == 0:
+            _start_zcross_stream(zFileNames[i], delim, fileType)
+        zSeqs.append(asyncwriter.WriteSequence(control.submit))
+    def flushzposdata(flushAll=False):
+        for i in range(nZPos):
+            znn = zPartData[i].getn()
+            if znn == 0:
+                continue
+            if (flushAll or 
+                    (flushEvery is not None and top.it % flushEvery == 0) or
+                    (flushParticles is not None and znn >= flushParticles)):
+                zCols = _zcross_keep(control, _zcross_columns(zPartData[i]))
+                zPartData[i].clear()
+                if parallelio.rank() != 0:
+                    continue
+                if runcontainer.active():
+                    control.submit(runcontainer.append, zName, zLayout, 
+                                   top.it, ZCROSS_COLUMNS, zCols, zPos[i], 
+                                   control.dtype if fileType == "npy" 
+                                   else None)
+                    continue
+                zSeqs[i].submit(_append_zcross_file, zFileNames[i], zCols, 
+                                delim, fileType, control.dtype)
+    # Only the regular flushes are adjusted by the budget
+    if flushParticles is None:
+        scheduler.schedule(control.wrap(flushzposdata), tsstart=flushEvery, 
+                           tsint=flushEvery)
+    else:
+        scheduler.schedule(control.wrap(flushzposdata), tsstart=1)
+    if ts is not None:
+        scheduler.schedule(lambda: flushzposdata(flushAll=True), ts=ts)
+    atexit.register(flushzposdata, flushAll=True)
+
+
+class MultiZCrossing(object):
+    """
+This class finds the particles crossing the z-positions 'zPos' forward 
+(to larger z) during each time-step, for all z-positions at once.
+The position z of each particle at the previous time-step is kept with 
+its particle id (pid), so the particles lost or reordered are followed.
+The z-positions crossed by each particle are found by 'np.searchsorted' 
+on the sorted z-positions, and x, y, t, vx, vy, vz are interpolated 
+linearly to the z-position between the two time-steps.
+The crossings of each z-position are kept in its own columns, so one 
+z-position is read and cleared without the others, and 'plane' returns 
+the object of one z-position having the same functions with 
+'ZCrossingParticles' (getn, getx, ..., clear).
+Arguments are following;
+ - part: This is the particle species, or the list of species.
+ - zPos: This is the list including all z-positions.
+         < e.g. zPos=[100.*mm, 200.*mm] >
+    """
+
+    def __init__(self, part=None, zPos=None):
+        assert part is not None, ValueError(
+                'Particle species is not defined for data')
+        assert zPos is not None and len(zPos) > 0, ValueError(
+                'z position is not defined for data')
+        self.parts = part if isinstance(part, (list, tuple)) else [part]
+        zPos = np.asarray(zPos, dtype=np.float64)
+        self.zOrder = np.argsort(zPos, kind="stable")
+        self.zSorted = zPos[self.zOrder]
+        # Columns of ZCROSS_COLUMNS of each z-position
+        self.data = [np.empty((len(ZCROSS_COLUMNS), 256)) 
+                     for i in range(len(zPos))]
+        self.counts = np.zeros(len(zPos), dtype=np.int64)
+        self.prev = [self._state(sp) for sp in self.parts]
+        scheduler.schedule(self.collect, tsstart=top.it + 1)
+
+    def _state(self, part):
+        state = dict((name, np.asarray(getattr(part, "get" + name)())) 
+                     for name in ["pid", "z", "x", "y", "vx", "vy", "vz"])
+        state["t"] = top.time
+        return state
+
+    def collect(self):
+        """
+This function finds the crossings since the previous call.
+It is called after every time-step.
+        """
+        for i, part in enumerate(self.parts):
+            state = self._state(part)
+            self._cross(self.prev[i], state)
+            self.prev[i] = state
+
+    def _cross(self, prev, cur):
+        pid = cur["pid"]
+        if np.array_equal(pid, prev["pid"]):
+            # Same particles in the same order, as in most time-steps
+            iPrev = iCur = None
+            z0, z1 = prev["z"], cur["z"]
+        else:
+            if len(prev["pid"]) == 0 or len(pid) == 0:
+                return
+            order = np.argsort(prev["pid"], kind="stable")
+            prevPid = prev["pid"][order]
+            pos = np.minimum(np.searchsorted(prevPid, pid), 
+                             len(prevPid) - 1)
+            found = prevPid[pos] == pid
+            iCur = np.flatnonzero(found)
+            iPrev = order[pos[found]]
+            z0, z1 = prev["z"][iPrev], cur["z"][iCur]
+        # z-positions in (z0, z1] are crossed forward
+        lo = np.searchsorted(self.zSorted, z0, "right")
+        hi = np.searchsorted(self.zSorted, z1, "right")
+        nCross = np.maximum(hi - lo, 0)
+        crossing = np.flatnonzero(nCross)
+        if len(crossing) == 0:
+            return
+        nCross = nCross[crossing]
+        rep = np.repeat(crossing, nCross)
+        first = np.repeat(np.cumsum(nCross) - nCross, nCross)
+        kk = lo[rep] + (np.arange(len(rep)) - first)
+        # Crossings in the order of the z-positions, same order of the 
+        # particles for each z-position
+        order = np.argsort(kk, kind="stable")
+        rep, kk = rep[order], kk[order]
+        ff = (self.zSorted[kk] - z0[rep]) / (z1[rep] - z0[rep])
+        if iPrev is not None:
+            jPrev, jCur = iPrev[rep], iCur[rep]
+        else:
+            jPrev = jCur = rep
+        cols = np.empty((len(ZCROSS_COLUMNS), len(rep)))
+        for col, name in zip(cols, ZCROSS_COLUMNS):
+            if name == "pid":
+                col[:] = pid[jCur]
+            elif name == "t":
+                col[:] = prev["t"] + ff * (cur["t"] - prev["t"])
+            else:
+                v0 = prev[name][jPrev]
+                col[:] = v0 + ff * (cur[name][jCur] - v0)
+        # Appended to the columns of each z-position crossed
+        nPlane = np.bincount(kk, minlength=len(self.zSorted))
+        ends = np.cumsum(nPlane)
+        for k in np.flatnonzero(nPlane):
+            i = self.zOrder[k]
+            self._reserve(i, nPlane[k])[:] = \
+                cols[:, ends[k] - nPlane[k]:ends[k]]
+            self.counts[i] += nPlane[k]
+
+    def _reserve(self, i, nn):
+        # Columns of the next 'nn' crossings of the i-th z-position; 
+        # the arrays grow by doubling
+        need = self.counts[i] + nn
+        data = self.data[i]
+        if need > data.shape[1]:
+            size = max(need, 2 * data.shape[1])
+            newData = np.empty((len(ZCROSS_COLUMNS), size))
+            newData[:, :self.counts[i]] = data[:, :self.counts[i]]
+            self.data[i] = data = newData
+        return data[:, self.counts[i]:need]
+
+    def column(self, i, name):
+        """
+This function returns the column 'name' of the crossings of the i-th 
+z-position.
+        """
+        return self.data[i][ZCROSS_COLUMNS.index(name), 
+                            :self.counts[i]].copy()
+
+    def clear(self, i=None):
+        """
+This function removes the crossings of the i-th z-position, or all.
+        """
+        if i is None:
+            self.counts[:] = 0
+            return
+        self.counts[i] = 0
+
+    def plane(self, i):
+        """
+This function returns the object of the i-th z-position having the same 
+functions with 'ZCrossingParticles'.
+        """
+        return _ZCrossingPlane(self, i)
+
+
+class _ZCrossingPlane(object):
+
+    def __init__(self, detector, i):
+        self.detector = detector
+        self.i = i
+
+    def getn(self):
+        return int(self.detector.counts[self.i])
+
+    def getpid(self):
+        return self.detector.column(self.i, "pid")
+
+    def getx(self):
+        return self.detector.column(self.i, "x")
+
+    def gety(self):
+        return self.detector.column(self.i, "y")
+
+    def gett(self):
+        return self.detector.column(self.i, "t")
+
+    def getvx(self):
+        return self.detector.column(self.i, "vx")
+
+    def getvy(self):
+        return self.detector.column(self.i, "vy")
+
+    def getvz(self):
+        return self.detector.column(self.i, "vz")
+
+    def clear(self):
+        self.detector.clear(self.i)
+
+
+def _zcross_columns(zPart):
+    # Copies of the collected data, so they are kept after clearing
+    return [np.array(zPart.getpid()), np.array(zPart.getx()), 
+            np.array(zPart.gety()), np.array(zPart.gett()), 
+            np.array(zPart.getvx()), np.array(zPart.getvy()), 
+            np.array(zPart.getvz())]
+
+
+def _zcross_keep(control, zCols):
+    # Particles kept with the fraction of the budget, by pid (first column)
+    mask = control.keep(zCols[0])
+    if mask is None:
+        return zCols
+    return [col[mask] for col in zCols]
+
+
+def _start_zcross_stream(zFileName, delim, fileType):
+    # Streaming starts with an empty file, having only the headers for .txt
+    if fileType == "npy":
+        open("{zFileName}.npys".format(zFileName=zFileName), "wb").close()
+        return
+    zWriteFile = open("{zFileName}.txt".format(zFileName=zFileName), "w")
+    zWriteFile.write(ZCROSS_HEADERS.format(de=delim))
+    zWriteFile.close()
+
+
+def _append_zcross_file(zFileName, zCols, delim, fileType, dtype):
+    # It returns the bytes appended; called in the order of 'WriteSequence'
+    if fileType == "npy":
+        zFileName = "{zFileName}.npys".format(zFileName=zFileName)
+        nbytes = os.path.getsize(zFileName)
+        binarydata.append_columns(zFileName, ZCROSS_COLUMNS, zCols, dtype)
+        return os.path.getsize(zFileName) - nbytes
+    zFileName = "{zFileName}.txt".format(zFileName=zFileName)
+    nbytes = os.path.getsize(zFileName)
+    zWriteFile = open(zFileName, "a")
+    _write_zcross_rows(zWriteFile, zCols, delim)
+    zWriteFile.close()
+    return os.path.getsize(zFileName) - nbytes
+
+
+def _write_zcross_file(zFileName, zCols, delim, fileType, dtype):
+    # It returns the bytes of the file
+    if fileType == "npy":
+        zFileName = "{zFileName}.npy".format(zFileName=zFileName)
+        binarydata.save_columns(zFileName, ZCROSS_COLUMNS, zCols, dtype)
+        return os.path.getsize(zFileName)
+    zFileName = "{zFileName}.txt".format(zFileName=zFileName)
+    zWriteFile = open(zFileName, "w")
+    zWriteFile.write(ZCROSS_HEADERS.format(de=delim))
+    _write_zcross_rows(zWriteFile, zCols, delim)
+    zWriteFile.close()
+    return os.path.getsize(zFileName)
+
+
+def _write_zcross_rows(zWriteFile, zCols, delim):
+    textwriter.write_rows(zWriteFile, zCols, ZCROSS_FORMATS, delim)
                 
 # -------------------------------------------------------------------------- #
 
@@ -120,7 +448,9 @@ Arguments are following;
 
 def ts_data(
         part=None, ts=None, dirName="timestep_particle_data", 
-        fileName="time_particle_data", delim="\t"):
+        fileName="time_particle_data", delim="\t", 
+        fileType="txt", dtype="float64", parallel=False, select=None, 
+        budget=None):
     """
 This function exports particle data at specific time-step.
 Particle data includes position (x,y,z) and velocity (vx, vy, vz)
@@ -138,6 +468,30 @@ Arguments are following;
  - delim: Each components of particle data will be separated with 
           this delimiter in .txt file
           {Default="\t"  (tab)}
+ - fileType: Format of the saved file.
+             "txt" is the delimited text file, and "npy" is the binary 
+             columnar file (x, y, z, vx, vy, vz) of 'binarydata' 
+             which can be opened with 'np.load(mmap_mode="r")'.
+             < "txt", "npy" >
+             {Default="txt"}
+ - dtype: Data type of the columns when 'fileType="npy"'.
+          < "float32", "float64" >
+          {Default="float64"}
+ - parallel: If this is True, each process of parallel WARP saves only its 
+             own particles in the file having the name of 
+             'fileName_time-step_ts_r(rank).txt', and the process of rank 0 
+             saves the index file 'fileName_time-step_ts.json' of them.
+             < e.g. time_particle_data_100_ts_r0003.txt, at rank=3 >
+             {Default=False}
+ - select: Only the particles selected by this are saved.
+           This is 'ParticleSelection' of the module 'selection'.
+           < e.g. select=ParticleSelection(fraction=0.01) >
+           {Default=None  (all particles)}
+ - budget: The output is adjusted to this 'IOBudget' of the module 
+           'iobudget' by the interval of the time-steps 'ts', the 
+           fraction of the particles and the precision ("float32" of 
+           'fileType="npy"').
+           {Default=None  (no adjustment)}
     """
     assert part is not None, ValueError(
             'Particle species is not defined for data')
@@ -149,43 +503,57 @@ Arguments are following;
             'Directory name must be given by string type')
     assert isinstance(fileName, str) is True, ValueError(
             'File name must be given by string type')
-    nTs = len(ts)
-    @callfromafterstep
+    assert fileType=="txt" or fileType=="npy", ValueError(
+            'File type must be one of "txt" and "npy"')
+    scheduler.make_dir(dirName)
+    gather = 0 if parallel else 1
+    if select is None:
+        select = selection.ParticleSelection()
+    # Layout of the files for 'runcontainer'
+    tsName = "{dirName}/{fileName}".format(dirName=dirName, 
+                                           fileName=fileName)
+    tsLayout = runcontainer.layout(
+            fileType, header=TS_HEADERS.format(de=delim), 
+            formats=TS_FORMATS, delim=delim, dtype=dtype)
+    control = iobudget.register(budget, tsName, dtype, decimate=True, 
+                                reduce=fileType == "npy")
     def savetsdata():
-        for i in range(nTs):
-            if top.it == ts[i]:
-                tsPartDir = './{dirName}/'.format(dirName=dirName)
-                if not os.path.exists(tsPartDir):
-                    os.mkdir(tsPartDir)
-                tsWriteFile = open("./{dirName}/{fileName}_{ts}_ts.txt".
-                         format(dirName=dirName, fileName=fileName, 
-                                ts=ts[i]), "w")
-                tsHeaders = \
-                "x(m){de}y(m){de}z(m){de}vx(m/s){de}vy(m/s){de}vz(m/s)".\
-                    format(de=delim)
-                tsWriteFile.write(tsHeaders)
-                tsn = part.getn()
-                tsx = part.getx()
-                tsy = part.gety()
-                tsz = part.getz()
-                tsvx = part.getvx()
-                tsvy = part.getvy()
-                tsvz = part.getvz()
-                for j in range(tsn):
-                    tsWriteFile.write("\n")
-                    tsWriteFile.write("{xpos:.9f}{de}".format(
-                            xpos=tsx[j], de=delim))
-                    tsWriteFile.write("{ypos:.9f}{de}".format(
-                            ypos=tsy[j], de=delim))
-                    tsWriteFile.write("{zpos:.9f}{de}".format(
-                            zpos=tsz[j], de=delim))
-                    tsWriteFile.write("{vx}{de}".format(
-                            vx=tsvx[j], de=delim))
-                    tsWriteFile.write("{vy}{de}".format(
-                            vy=tsvy[j], de=delim))
-                    tsWriteFile.write("{vz}".format(
-                            vz=tsvz[j]))
-                tsWriteFile.close()
+        tsCols = control.select(select).select(part, TS_COLUMNS, 
+                                               gather=gather)
+        if runcontainer.active():
+            control.submit(runcontainer.append, tsName, tsLayout, top.it, 
+                           TS_COLUMNS, tsCols, None, 
+                           control.dtype if fileType == "npy" else None, 
+                           not parallel)
+            return
+        tsFileName = "./{dirName}/{fileName}_{ts}_ts".format(
+                dirName=dirName, fileName=fileName, ts=top.it)
+        if parallel:
+            shardName = parallelio.shard_name(tsFileName)
+            shards = parallelio.gather({
+                    "rank": parallelio.rank(), "n": len(tsCols[0]), 
+                    "file": "{sn}.{ft}".format(sn=shardName, ft=fileType)})
+            if shards is not None:
+                control.submit(parallelio.write_index, 
+                               tsFileName + ".json", shards, 
+                               {"ts": top.it, "columns": TS_COLUMNS, 
+                                "fileType": fileType})
+            tsFileName = shardName
+        control.submit(_write_ts_file, tsFileName, 
+                       tsCols, delim, fileType, control.dtype)
+    scheduler.schedule(control.wrap(savetsdata), ts=ts)
+
+
+def _write_ts_file(tsFileName, tsCols, delim, fileType, dtype):
+    # It returns the bytes of the file
+    tsFileName = "{tsFileName}.{ft}".format(tsFileName=tsFileName, 
+                                            ft=fileType)
+    if fileType == "npy":
+        binarydata.save_columns(tsFileName, TS_COLUMNS, tsCols, dtype)
+    else:
+        textwriter.write_text(tsFileName, TS_HEADERS.format(de=delim), 
+                              tsCols, TS_FORMATS, delim)
+    return os.path.getsize(tsFileName)
                 
 # -------------------------------------------------------------------------- #
 
@@ -194,11 +562,16 @@ Arguments are following;
 
 def vtk_data(part=None, tsstart=None, tsend=None, tsint=1, 
                   dirName="vtk_particle_data", 
-                  fileName="vtk_particle_data"):
+                  fileName="vtk_particle_data", parallel=False, 
+                  select=None, pointData=None, nBuffers=2, budget=None):
     """
 This function exports particle data at specific time-step with vtk format 
 for ParaView.
-Particle data includes position (x,y,z)
+Particle data includes position (x,y,z), and velocity (vx, vy, vz), 
+particle id (pid), weight, Lorentz factor (gamma) and kinetic energy (ke) 
+of each particle.
+The .pvd file of all time-steps is also saved, so all vtk files are opened 
+in ParaView as one time series.
 Arguments are following;
  - part: This is the particle species.
  - tsstart: This is time-step to want to start collecting particle data. 
@@ -208,9 +581,33 @@ Arguments are following;
  - dirName: Partilce data will be saved in the directory having this name 
             {Default="vtk_particle_data"}
  - fileName: Partilce data at each time-step will be saved in the file 
-             having the name of 'fileName_time-step.vtu'
+             having the name of 'fileName_time-step_ts.vtu', and the time 
+             series in the file 'fileName.pvd'.
              {Default="vtk_particle_data"}
-             < e.g. vtk_particle_data_100.vtu, at time-step=100 >
+             < e.g. vtk_particle_data_100_ts.vtu, at time-step=100 >
+ - parallel: If this is True, each process of parallel WARP saves only its 
+             own particles in the file having the name of 
+             'fileName_time-step_ts_r(rank).vtu', and the process of rank 0 
+             saves the parallel vtk file 'fileName_time-step_ts.pvtu' 
+             which is listed in the .pvd file.
+             {Default=False}
+ - select: Only the particles selected by this are saved.
+           This is 'ParticleSelection' of the module 'selection'.
+           < e.g. select=ParticleSelection(bbox={"z": [0.1, 0.2]}) >
+           {Default=None  (all particles)}
+ - pointData: This is the list of the data of each particle to be saved.
+              "weight" is the number of real particles (sw*w), and "ke" is 
+              the kinetic energy in eV.
+              < e.g. pointData=["vz", "ke"] >
+              {Default=None  (all of VTK_POINT_DATA)}
+ - nBuffers: Number of the sets of arrays reused at each time-step.
+             With 'asyncwriter', the next time-step waits until the vtk 
+             file using the same set is written.
+             {Default=2}
+ - budget: The output is adjusted to this 'IOBudget' of the module 
+           'iobudget' by the interval of the time-steps, the fraction 
+           of the particles and the precision ("float32" except pid).
+           {Default=None  (no adjustment)}
     """
     assert part is not None, ValueError(
             'Particle species is not defined for data')
@@ -222,22 +619,395 @@ Arguments are following;
             'Directory name must be given by string type')
     assert isinstance(fileName, str) is True, ValueError(
             'File name must be given by string type')
-    @callfromafterstep
+    if pointData is None:
+        pointData = VTK_POINT_DATA
+    for name in pointData:
+        assert name in VTK_POINT_DATA, ValueError(
+                'Point data must be given by {names}'.format(
+                        names=", ".join(VTK_POINT_DATA)))
+    assert nBuffers >= 1, ValueError(
+            'Number of buffers must be larger than 0')
+    scheduler.make_dir(dirName)
+    gather = 0 if parallel else 1
+    if select is None:
+        select = selection.ParticleSelection()
+    # Arrays read from the species, and computed from them
+    energy = "gamma" in pointData or "ke" in pointData
+    readNames = ["x", "y", "z"]
+    for name in ["vx", "vy", "vz"]:
+        if name in pointData or energy:
+            readNames.append(name)
+    if "pid" in pointData:
+        readNames.append("pid")
+    if "weight" in pointData:
+        readNames.append("w")
+    buffers = _PointBuffers(readNames + ["gamma", "ke"], nBuffers)
+    pvd = vtkseries.PVDCollection("./{dirName}/{fileName}.pvd".format(
+            dirName=dirName, fileName=fileName))
+    vtkName = "{dirName}/{fileName}".format(dirName=dirName, 
+                                            fileName=fileName)
+    control = iobudget.register(budget, vtkName, decimate=True, reduce=True)
     def vtkdata():
-        if tsstart <= top.it <= tsend:
-            if top.it % tsint == 0:
-                vtkPartDir = './{dirName}/'.format(dirName=dirName)
-                if not os.path.exists(vtkPartDir):
-                    os.mkdir(vtkPartDir)
-                nnn = part.getn()
-                xxx = part.getx()
-                yyy = part.gety()
-                zzz = part.getz()
-                val = [1 for i in range(nnn)]
-                npval = np.array(val)
-                pointsToVTK("./{dirName}/{fileName}_{ts}_ts".\
-                            format(dirName=dirName, fileName=fileName, 
-                                   ts=top.it), 
-                            xxx, yyy, zzz,data={"particle" : npval})
+        nb = buffers.acquire()
+        try:
+            cols = control.select(select).select(
+                    part, readNames, gather=gather, 
+                    out=lambda nn: buffers.arrays(nb, nn, readNames))
+            cols = dict(zip(readNames, cols))
+            if energy:
+                cols["gamma"], cols["ke"] = buffers.arrays(
+                        nb, len(cols["x"]), ["gamma", "ke"])
+                _vtk_energy(part, cols)
+            if "weight" in pointData:
+                cols["weight"] = cols["w"]
+                cols["weight"] *= part.sw
+            if control.dtype == "float32":
+                for name in ["x", "y", "z"] + list(pointData):
+                    if name not in binarydata.FULL_PRECISION_COLUMNS:
+                        cols[name] = cols[name].astype(np.float32)
+            vtkPointData = dict((name, cols[name]) for name in pointData)
+            if runcontainer.active():
+                control.submit(_append_vtk_points, vtkName, top.it, 
+                               ["x", "y", "z"] + list(pointData), 
+                               [cols[name] for name in 
+                                ["x", "y", "z"] + list(pointData)], 
+                               not parallel, buffers, nb)
+                return
+            vtkFileName = "./{dirName}/{fileName}_{ts}_ts".format(
+                    dirName=dirName, fileName=fileName, ts=top.it)
+            if parallel:
+                shardName = parallelio.shard_name(vtkFileName)
+                shards = parallelio.gather(shardName + ".vtu")
+                if shards is not None:
+                    control.submit(
+                            _write_vtk_pvtu, vtkFileName + ".pvtu", shards, 
+                            dict((name, cols[name].dtype) 
+                                 for name in pointData), 
+                            cols["x"].dtype, pvd, top.it)
+                vtkFileName = shardName
+            control.submit(_write_vtk_points, vtkFileName, 
+                           [cols["x"], cols["y"], cols["z"]], vtkPointData, 
+                           None if parallel else pvd, top.it, buffers, nb)
+        except Exception:
+            # The buffers are released by the writing only when it is 
+            # submitted
+            buffers.release(nb)
+            raise
+    scheduler.schedule(control.wrap(vtkdata), tsstart=tsstart, tsend=tsend, 
+                       tsint=tsint)
+
+
+def _vtk_energy(part, cols):
+    # Lorentz factor and kinetic energy (eV) computed in the arrays of
+    # 'cols', without temporary arrays.
+    # gamma - 1 = b2 / (s * (1 + s)), with b2 = (v/c)**2, s = sqrt(1 - b2),
+    # is used to keep the precision for the slow particles.
+    gam, ke = cols["gamma"], cols["ke"]
+    np.multiply(cols["vx"], cols["vx"], out=gam)
+    np.multiply(cols["vy"], cols["vy"], out=ke)
+    gam += ke
+    np.multiply(cols["vz"], cols["vz"], out=ke)
+    gam += ke
+    gam *= 1. / clight**2
+    np.subtract(1., gam, out=ke)
+    np.sqrt(ke, out=ke)
+    gam /= ke
+    ke += 1.
+    gam /= ke
+    np.multiply(gam, part.mass * clight**2 / echarge, out=ke)
+    gam += 1.
+
+
+def _write_vtk_points(vtkFileName, xyz, pointData, pvd, ts, buffers, nb):
+    # It returns the bytes of the file
+    try:
+        vtkFile = pointsToVTK(vtkFileName, xyz[0], xyz[1], xyz[2], 
+                              pointData)
+        if pvd is not None:
+            pvd.add(ts, vtkFile)
+    finally:
+        buffers.release(nb)
+    return os.path.getsize(vtkFile)
+
+
+def _append_vtk_points(vtkName, ts, names, arrays, shared, buffers, nb):
+    try:
+        return runcontainer.append(vtkName, runcontainer.layout("vtu"), ts, 
+                                   names, arrays, None, None, shared)
+    finally:
+        buffers.release(nb)
+
+
+def _write_vtk_pvtu(pvtuFileName, shards, pieceTypes, pointsType, pvd, ts):
+    parallelio.write_pvtu(pvtuFileName, shards, pieceTypes, pointsType)
+    pvd.add(ts, pvtuFileName)
+    return os.path.getsize(pvtuFileName)
+
+
+class _PointBuffers(object):
+    # Arrays of the particle data reused at every time-step.
+    # 'nBuffers' sets of them are used in turn, and a set is filled again
+    # only after the vtk file of it is written, so the background threads
+    # of 'asyncwriter' never see the arrays changed.
+
+    def __init__(self, names, nBuffers=2):
+        self.sets = [dict((name, np.empty(0)) for name in names) 
+                     for i in range(nBuffers)]
+        self.free = [threading.Event() for i in range(nBuffers)]
+        for free in self.free:
+            free.set()
+        self.nNext = 0
+
+    def acquire(self):
+        nb = self.nNext
+        self.nNext = (nb + 1) % len(self.sets)
+        self.free[nb].wait()
+        self.free[nb].clear()
+        return nb
+
+    def arrays(self, nb, nn, names):
+        # The arrays grow by 1/8 more than needed, so they are not made
+        # again at each time-step while the number of particles grows
+        bufs = self.sets[nb]
+        arrays = []
+        for name in names:
+            if len(bufs[name]) < nn:
+                bufs[name] = np.empty(nn + nn // 8, dtype=np.float64)
+            arrays.append(bufs[name][:nn])
+        return arrays
+
+    def release(self, nb):
+        self.free[nb].set()
                             
 # -------------------------------------------------------------------------- #
+
+
+# -------------------------------------------------------------------------- #
+
+def trajectory_data(
+        part=None, pids=None, select=None, tsstart=1, tsend=None, tsint=1, 
+        nSteps=100, dirName="trajectory_particle_data", 
+        fileName="trajectory_particle_data", delim="\t", fileType="npy", 
+        dtype="float64", budget=None):
+    """
+This function exports the trajectories of the tracked particles.
+Only the tracked particles are saved at every time-step, instead of 
+all particles of the species as 'ts_data'.
+With parallel WARP, only the process of rank 0 saves the file.
+Particle data includes position (x,y,z) and velocity (vx, vy, vz)
+Arguments are following;
+ - part: This is the particle species.
+ - pids: This is the list of particle ids (pid) tracked.
+         < e.g. pids=[1, 5, 100] >
+         {Default=None}
+ - select: If 'pids' is not given, the particles selected by this when 
+           this function is called are tracked.
+           This is 'ParticleSelection' of the module 'selection'.
+           < e.g. select=ParticleSelection(fraction=0.001) >
+           {Default=None}
+ - tsstart: This is time-step to want to start collecting particle data. 
+            {Default=1}
+ - tsend: This is time-step to want to end collecting particle data. 
+          {Default=None  (until the end of the script)}
+ - tsint: This is the interval of time-step to collect particle data. 
+          {Default=1}
+ - nSteps: Particle data of 'nSteps' time-steps is kept in the memory, 
+           and appended to the file at once.
+           {Default=100}
+ - dirName: Partilce data will be saved in the directory having this name 
+            {Default="trajectory_particle_data"}
+ - fileName: Partilce data will be saved in the file having the name of 
+             'fileName.npys' (or .txt)
+             {Default="trajectory_particle_data"}
+ - delim: Each components of particle data will be separated with 
+          this delimiter in .txt file
+          {Default="\t"  (tab)}
+ - fileType: Format of the saved file.
+             "npy" is the stream of 'binarydata' having one record for 
+             each 'nSteps' time-steps; ts, t (nSteps), pid (tracked 
+             particles) and x, y, z, vx, vy, vz (tracked particles x 
+             nSteps), which are joined by 'binarydata.stream_array'.
+             The particles not in the species (lost, or not injected yet)
+             are NaN.
+             "txt" is the delimited text file of ts, t, pid, x, y, z, vx, 
+             vy, vz of the particles in the species at each time-step.
+             < "txt", "npy" >
+             {Default="npy"}
+ - dtype: Data type of x, y, z, vx, vy, vz when 'fileType="npy"'.
+          < "float32", "float64" >
+          {Default="float64"}
+ - budget: The output is adjusted to this 'IOBudget' of the module 
+           'iobudget' by the interval of the time-steps and the precision 
+           ("float32" of 'fileType="npy"').
+           {Default=None  (no adjustment)}
+    """
+    assert part is not None, ValueError(
+            'Particle species is not defined for data')
+    assert pids is not None or select is not None, ValueError(
+            'Particle ids or selection must be given for tracking')
+    assert isinstance(dirName, str) is True, ValueError(
+            'Directory name must be given by string type')
+    assert isinstance(fileName, str) is True, ValueError(
+            'File name must be given by string type')
+    assert fileType=="txt" or fileType=="npy", ValueError(
+            'File type must be one of "txt" and "npy"')
+    tracker = TrajectoryTracker(part, pids, select, nSteps)
+    scheduler.make_dir(dirName)
+    trajFileName = "./{dirName}/{fileName}.{ft}".format(
+            dirName=dirName, fileName=fileName, 
+            ft="npys" if fileType == "npy" else "txt")
+    # Layout of the file for 'runcontainer'
+    trajName = "{dirName}/{fileName}".format(dirName=dirName, 
+                                             fileName=fileName)
+    trajLayout = runcontainer.layout(
+            fileType, header=TRAJ_HEADERS.format(de=delim), 
+            formats=TRAJ_FORMATS, delim=delim, dtype=dtype, stream=True)
+    control = iobudget.register(budget, trajName, dtype, 
+                                reduce=fileType == "npy")
+    # Order of the chunks appended to the file
+    trajSeq = asyncwriter.WriteSequence(control.submit)
+    if not runcontainer.active() and parallelio.rank() == 0:
+        if fileType == "npy":
+            open(trajFileName, "wb").close()
+        else:
+            textwriter.write_text(trajFileName, 
+                                  TRAJ_HEADERS.format(de=delim), [], [])
+    def flushtrajdata():
+        if tracker.nData == 0:
+            return
+        names, arrays = _trajectory_arrays(tracker.chunk(), fileType, 
+                                           control.dtype)
+        if parallelio.rank() != 0:
+            return
+        if runcontainer.active():
+            control.submit(runcontainer.append, trajName, trajLayout, 
+                           top.it, names, arrays)
+            return
+        trajSeq.submit(_append_trajectory_file, trajFileName, names, arrays, 
+                       delim, fileType)
+    def trajdata():
+        tracker.collect()
+        if tracker.nData == tracker.nSteps:
+            flushtrajdata()
+    scheduler.schedule(control.wrap(trajdata), tsstart=tsstart, tsend=tsend, 
+                       tsint=tsint)
+    if tsend is not None:
+        scheduler.schedule(flushtrajdata, ts=tsend)
+    atexit.register(flushtrajdata)
+    return tracker
+
+
+class TrajectoryTracker(object):
+    """
+This class collects the trajectories of the tracked particles.
+The index of each tracked particle in the arrays of the species is found 
+once, and found again only for the particles lost or reordered since 
+the previous time-step, by 'np.searchsorted' on the sorted particle ids.
+x, y, z, vx, vy, vz of the tracked particles are copied to the arrays 
+preallocated for 'nSteps' time-steps.
+Arguments are following;
+ - part: This is the particle species.
+ - pids: This is the list of particle ids (pid) tracked.
+ - select: If 'pids' is not given, the particles selected by this 
+           'ParticleSelection' are tracked.
+ - nSteps: Number of the time-steps kept in the arrays.
+           {Default=100}
+    """
+
+    def __init__(self, part=None, pids=None, select=None, nSteps=100):
+        assert part is not None, ValueError(
+                'Particle species is not defined for data')
+        assert nSteps >= 1, ValueError(
+                'Number of time-steps must be larger than 0')
+        self.part = part
+        if pids is None:
+            pids = select.select(part, ["pid"])[0]
+        self.pids = np.unique(np.asarray(pids, dtype=np.float64))
+        self.nTracked = len(self.pids)
+        self.nSteps = nSteps
+        # Index of each tracked particle in the species, -1 if not found
+        self.index = np.full(self.nTracked, -1, dtype=np.intp)
+        self.found = np.zeros(0, dtype=np.intp)
+        self.prevPid = None
+        self.data = np.full((len(TS_COLUMNS), self.nTracked, nSteps), 
+                            np.nan)
+        self.ts = np.zeros(nSteps, dtype=np.int64)
+        self.time = np.zeros(nSteps)
+        self.nData = 0
+
+    def _update(self, pid):
+        if self.prevPid is not None and np.array_equal(pid, self.prevPid):
+            # Same particles in the same order, as in most time-steps
+            return
+        nn = len(pid)
+        index = self.index
+        valid = (index >= 0) & (index < nn)
+        valid[valid] = pid[index[valid]] == self.pids[valid]
+        moved = np.flatnonzero(~valid)
+        if len(moved) > 0 and nn > 0:
+            movedPid = self.pids[moved]
+            pos = np.minimum(np.searchsorted(movedPid, pid), len(moved) - 1)
+            hit = np.flatnonzero(movedPid[pos] == pid)
+            index[moved] = -1
+            index[moved[pos[hit]]] = hit
+        elif len(moved) > 0:
+            index[moved] = -1
+        self.found = np.flatnonzero(index >= 0)
+        self.prevPid = pid
+
+    def collect(self):
+        """
+This function copies the data of the tracked particles at the current 
+time-step to the arrays.
+        """
+        self._update(np.asarray(self.part.getpid()))
+        nd = self.nData
+        iFound = self.index[self.found]
+        for k, name in enumerate(TS_COLUMNS):
+            arr = np.asarray(getattr(self.part, "get" + name)())
+            self.data[k, self.found, nd] = arr[iFound]
+        self.ts[nd] = top.it
+        self.time[nd] = top.time
+        self.nData += 1
+
+    def chunk(self):
+        """
+This function returns the copies of ts, t, pid and the arrays of the 
+collected time-steps, and clears the arrays.
+        """
+        nd = self.nData
+        cols = [self.data[k, :, :nd].copy() for k in range(len(TS_COLUMNS))]
+        chunk = [self.ts[:nd].copy(), self.time[:nd].copy(), 
+                 self.pids.copy()] + cols
+        self.data[:, :, :nd] = np.nan
+        self.nData = 0
+        return chunk
+
+
+def _trajectory_arrays(chunk, fileType, dtype):
+    # Arrays of a record of the stream, or the columns of the text rows
+    names = ["ts", "t", "pid"] + TS_COLUMNS
+    ts, tt, pids = chunk[:3]
+    cols = chunk[3:]
+    if fileType == "npy":
+        return names, [ts, tt, pids] + [col.astype(dtype) for col in cols]
+    # Rows of the particles found, in the order of the time-steps
+    rows = np.flatnonzero(np.isfinite(cols[0].T.ravel()))
+    nTracked = len(pids)
+    return names, [np.repeat(ts, nTracked)[rows], 
+                   np.repeat(tt, nTracked)[rows], 
+                   np.tile(pids, len(ts))[rows]] + \
+                  [col.T.ravel()[rows] for col in cols]
+
+
+def _append_trajectory_file(trajFileName, names, arrays, delim, fileType):
+    # It returns the bytes appended; called in the order of 'WriteSequence'
+    nbytes = os.path.getsize(trajFileName)
+    if fileType == "npy":
+        binarydata.append_arrays(trajFileName, names, arrays)
+    else:
+        textwriter.write_text(trajFileName, None, arrays, TRAJ_FORMATS, 
+                              delim, mode="a")
+    return os.path.getsize(trajFileName) - nbytes
+
+# -------------------------------------------------------------------------- #
@@ -0,0 +1,579 @@
+# -*- coding: utf-8 -*-
+
+"""
+runcontainer module test version
+
+Created on Thu May 17 2018
+
+@author: K. Yoo, 
+Intense Beam and Accelerator Laboratory(IBAL), 
+Ulsan National Institute of Science and Technology(UNIST),
+Republic of Korea
+"""
+
+# ========================================================================== #
+#                Module for Saving All Data of a Run in Segments             #
+# -------------------------------------------------------------------------- #
+#                                                                            #
+# 1. Data of all exporters appended to a few large segment files             #
+# 2. Index of the records for reading one time-step or z-position at once    #
+# 3. Extracting the records to the files saved by each exporter              #
+#                                                                            #
+# ========================================================================== #
+
+"""
+A long run saving data at many time-steps makes thousands of small files,
+and making them on a parallel file system costs more than writing the data.
+After 'enable', the exporters of particledata and fielddata (ts_data,
+zcross_data, trajectory_data, vtk_data, phi_1d_xyz, phi_2d_xyz,
+phi_3d_xyz, phi_3d_vtk and efield_1d_xyz, ...) append their data to one
+container instead of saving their own files;
+ - fileName_r(rank)_(segment).seg: Records of the data appended one after
+   another in .npy format. The next segment is started when the segment
+   exceeds 'segmentBytes'.
+ - fileName_r(rank).idx: Index having one line (JSON) for each record;
+   the name of the data, time-step, z-position, segment and byte offset.
+Each data is named as 'dirName/fileName' of the exporter, same as 'dataset'.
+< e.g. import runcontainer as rc
+       rc.enable(dirName="run_container")
+       pd.ts_data(part=beam, ts=list(range(0, 10001, 10)))
+       ...
+       run = rc.RunContainer("./run_container")
+       xx = run.read("timestep_particle_data/time_particle_data", ts=500)["x"]
+       rc.extract("./run_container", outDir="./") >
+'extract' saves the records in the same files as the exporters save them
+without the container (.txt, .npy, .npys, .vtu, .vtr and .pvd), and it is
+also run from the command line.
+< e.g. python runcontainer.py ./run_container --ts 100,200 >
+Only 'enable' needs WARP, so the container is read without WARP.
+"""
+
+import argparse
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+try:
+    from pyevtk.hl import gridToVTK, pointsToVTK
+except ImportError:
+    gridToVTK = pointsToVTK = None
+
+import asyncwriter
+import binarydata
+import textwriter
+import vtkseries
+
+
+# Size of one segment file in bytes
+SEGMENT_BYTES = 1024**3
+
+_INDEX_PATTERN = re.compile(r"^(?P<base>.+)_r(?P<rank>\d+)\.idx$")
+
+
+# -------------------------------------------------------------------------- #
+
+def layout(fileType="txt", key="ts", **info):
+    """
+This function returns the layout of the files saved by an exporter,
+which is used by 'extract' to save the records in the same files.
+Arguments are following;
+ - fileType: Format of the files of the exporter.
+             < "txt", "npy", "vtu", "vtr" >
+             {Default="txt"}
+ - key: The files are named by the time-step ("ts"), or by the
+        z-position ("z").
+        {Default="ts"}
+ - info: Other information of the files;
+         header, formats, delim: Header, formats of the columns and
+                                 delimiter of "txt" (see 'textwriter').
+         dtype: Data type of the columns of "npy".
+         grid: Number of the axes of the grid saved before the columns
+               (field data), which are extracted as the position of every
+               grid point.
+         stream: If this is True, the records of one z-position, or
+                 of all time-steps for 'key="ts"', are joined in one
+                 file. Otherwise, only the last record is saved in the
+                 file.
+    """
+    assert fileType in ("txt", "npy", "vtu", "vtr"), ValueError(
+            'File type must be one of "txt", "npy", "vtu", and "vtr"')
+    assert key=="ts" or key=="z", ValueError(
+            'Key must be one of "ts" and "z"')
+    info = dict(info)
+    info["fileType"] = fileType
+    info["key"] = key
+    return info
+
+
+class ContainerWriter(object):
+    """
+This class appends the records to the segment files and the index file
+of one process. It is made by 'enable'.
+Arguments are following;
+ - dirName: Directory of the container.
+ - fileName: Name of the segment and index files.
+ - rank: Rank of the process.
+ - segmentBytes: Size of one segment file in bytes.
+    """
+
+    def __init__(self, dirName, fileName, rank=0,
+                 segmentBytes=SEGMENT_BYTES):
+        assert segmentBytes > 0, ValueError(
+                'Segment size must be larger than 0')
+        if not os.path.isdir(dirName):
+            os.makedirs(dirName)
+        self.baseName = os.path.join(
+                dirName, "{fileName}_r{rank:04d}".format(fileName=fileName,
+                                                         rank=rank))
+        self.rank = rank
+        self.segmentBytes = segmentBytes
+        self.layouts = {}
+        self.nSeg = 0
+        self.segFile = None
+        self.indexFile = open(self.baseName + ".idx", "w")
+        self.lock = threading.Lock()
+
+    def append(self, name, info, ts, names, arrays, z=None, dtype=None):
+        """
+This function appends the arrays as one record, and returns the bytes
+of the record.
+The record is written in the segment before its line of the index, so
+the index never has the record not written yet.
+        """
+        record = binarydata.array_record(names, arrays, dtype)
+        entry = {"name": name, "ts": int(ts)}
+        if z is not None:
+            entry["z"] = z.item() if isinstance(z, np.generic) else z
+        with self.lock:
+            if (self.segFile is None or
+                    self.segFile.tell() >= self.segmentBytes):
+                self._next_segment()
+            entry["seg"] = self.nSeg - 1
+            entry["offset"] = self.segFile.tell()
+            np.save(self.segFile, record)
+            self.segFile.flush()
+            nbytes = self.segFile.tell() - entry["offset"]
+            if name not in self.layouts:
+                self.layouts[name] = info
+                self.indexFile.write(json.dumps({"name": name,
+                                                 "layout": info}) + "\n")
+            self.indexFile.write(json.dumps(entry) + "\n")
+            self.indexFile.flush()
+        return nbytes
+
+    def _next_segment(self):
+        if self.segFile is not None:
+            self.segFile.close()
+        self.segFile = open(_segment_name(self.baseName, self.nSeg), "wb")
+        self.nSeg += 1
+
+    def close(self):
+        with self.lock:
+            if self.segFile is not None:
+                self.segFile.close()
+                self.segFile = None
+            self.indexFile.close()
+
+
+def _segment_name(baseName, nSeg):
+    return "{baseName}_{seg:04d}.seg".format(baseName=baseName, seg=nSeg)
+
+# -------------------------------------------------------------------------- #
+
+
+# -------------------------------------------------------------------------- #
+
+_container = None
+
+
+def enable(dirName="run_container", fileName="run",
+           segmentBytes=SEGMENT_BYTES):
+    """
+This function starts saving the data of all exporters in the container.
+Arguments are following;
+ - dirName: The container will be saved in the directory having this name.
+            {Default="run_container"}
+ - fileName: Segment and index files will be saved in the files having
+             the name of 'fileName_r(rank)_(segment).seg' and
+             'fileName_r(rank).idx'.
+             {Default="run"}
+ - segmentBytes: Size of one segment file in bytes.
+                 {Default=SEGMENT_BYTES  (1 GB)}
+Each process of parallel WARP saves its own segment and index files.
+    """
+    global _container
+    # WARP is needed only for the rank of the process
+    import parallelio
+    disable()
+    _container = ContainerWriter(dirName, fileName, parallelio.rank(),
+                                 segmentBytes)
+    return _container
+
+
+def disable():
+    """
+This function writes all queued data and closes the container.
+The exporters save their own files again.
+    """
+    global _container
+    if _container is not None:
+        asyncwriter.flush()
+        container, _container = _container, None
+        container.close()
+
+
+def active():
+    """
+This function returns True after 'enable'.
+    """
+    return _container is not None
+
+
+def append(name, info, ts, names, arrays, z=None, dtype=None, shared=True):
+    """
+This function appends the data of an exporter to the container, and
+returns the bytes appended.
+Exporters pass it to 'asyncwriter.submit'.
+Arguments are following;
+ - name: Name of the data, 'dirName/fileName' of the exporter.
+ - info: Layout of the files of the exporter made by 'layout'.
+ - ts: Time-step of the data.
+ - names: This is the list of the names of the arrays.
+ - arrays: This is the list of the arrays.
+ - z: z-position of the data for 'key="z"'.
+ - dtype: Data type of the columns ("float32", "float64").
+          {Default=None  (data types of the arrays)}
+ - shared: If this is True, the data is same on all processes and only
+           the process of rank 0 appends it.
+           {Default=True}
+    """
+    container = _container
+    assert container is not None, ValueError(
+            'Container is not enabled')
+    if shared and container.rank != 0:
+        return 0
+    return container.append(name, info, ts, names, arrays, z, dtype)
+
+# -------------------------------------------------------------------------- #
+
+
+# -------------------------------------------------------------------------- #
+
+class RunContainer(object):
+    """
+This class reads the container saved after 'enable'.
+Only the index files are read here. Each record is found from the index
+at once, and its arrays are memory-mapped from the segment file.
+Arguments are following;
+ - dirName: Directory of the container.
+            {Default="run_container"}
+ - fileName: Name of the segment and index files.
+             {Default="run"}
+< e.g. run.names                          (names of all data)
+       run.steps(name), run.zpos(name)     (saved time-steps, z-positions)
+       run.read(name, ts=500)["x"]
+       run.read("zposition_particle_data/z_particle_data", z=0.5)["vz"] >
+    """
+
+    def __init__(self, dirName="run_container", fileName="run"):
+        assert os.path.isdir(dirName), ValueError(
+                'Directory {dirName} does not exist'.format(dirName=dirName))
+        self.dirName = dirName
+        self.layouts = {}
+        self.byTs = {}
+        self.byZ = {}
+        for fn in sorted(os.listdir(dirName)):
+            match = _INDEX_PATTERN.match(fn)
+            if match is None or match.group("base") != fileName:
+                continue
+            self._read_index(os.path.join(dirName, fn),
+                             int(match.group("rank")))
+        for entries in list(self.byTs.values()) + list(self.byZ.values()):
+            entries.sort(key=lambda en: (en["ts"], en["rank"], en["seq"]))
+
+    def _read_index(self, indexFileName, rank):
+        baseName = indexFileName[:-len(".idx")]
+        indexFile = open(indexFileName, "r")
+        for seq, line in enumerate(indexFile):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # The last line of the run stopped while writing it
+                continue
+            if "layout" in entry:
+                self.layouts[entry["name"]] = entry["layout"]
+                continue
+            entry["rank"] = rank
+            entry["seq"] = seq
+            entry["file"] = _segment_name(baseName, entry["seg"])
+            self.byTs.setdefault((entry["name"], entry["ts"]),
+                                 []).append(entry)
+            if "z" in entry:
+                self.byZ.setdefault((entry["name"], entry["z"]),
+                                    []).append(entry)
+        indexFile.close()
+
+    @property
+    def names(self):
+        return sorted(self.layouts)
+
+    def steps(self, name):
+        """
+This function returns the sorted time-steps of the data 'name'.
+        """
+        return sorted(set(ts for nm, ts in self.byTs if nm == name))
+
+    def zpos(self, name):
+        """
+This function returns the sorted z-positions of the data 'name'.
+        """
+        return sorted(set(zz for nm, zz in self.byZ if nm == name))
+
+    def entries(self, name=None, ts=None, z=None):
+        """
+This function returns the index entries of the records of the data
+'name' at the time-step 'ts' and (or) at the z-position 'z'.
+There is one entry for each process, or for each flush of streaming.
+        """
+        assert name in self.layouts, ValueError(
+                'Data {name} is not saved in {dirName}'.format(
+                        name=name, dirName=self.dirName))
+        assert ts is not None or z is not None, ValueError(
+                'Time-step or z-position must be given')
+        if z is not None:
+            entries = self.byZ.get((name, z), [])
+            if ts is not None:
+                entries = [en for en in entries if en["ts"] == ts]
+        else:
+            entries = self.byTs.get((name, ts), [])
+        return entries
+
+    def records(self, name=None, ts=None, z=None):
+        """
+This function returns the list of the records of 'entries'.
+The arrays of each record are accessed by their names.
+        """
+        return [binarydata.load_record(en["file"], en["offset"])[0]
+                for en in self.entries(name, ts, z)]
+
+    def read(self, name=None, ts=None, z=None):
+        """
+This function returns the dictionary of the arrays of the data 'name'
+at the time-step 'ts' and (or) at the z-position 'z'.
+The columns of several records (processes, or flushes of streaming) are
+joined in one array.
+        """
+        records = self.records(name, ts, z)
+        assert len(records) > 0, ValueError(
+                '{name} is not saved at {key}'.format(
+                        name=name, key="ts={ts}".format(ts=ts)
+                        if z is None else "z={z}".format(z=z)))
+        names = records[0].dtype.names
+        if len(records) == 1:
+            return dict((nm, records[0][nm]) for nm in names)
+        return dict((nm, np.concatenate([np.ravel(rec[nm])
+                                         for rec in records]))
+                    for nm in names)
+
+    def __repr__(self):
+        return "<RunContainer {dirName} ({nn} data)>".format(
+                dirName=self.dirName, nn=len(self.layouts))
+
+# -------------------------------------------------------------------------- #
+
+
+# -------------------------------------------------------------------------- #
+
+def extract(dirName="run_container", fileName="run", outDir="./",
+            names=None, ts=None, z=None):
+    """
+This function saves the records of the container in the same files as
+the exporters save them without the container.
+Arguments are following;
+ - dirName, fileName: Directory and name of the container.
+                      {Default="run_container", "run"}
+ - outDir: The files are saved in the directory 'outDir/dirName' of each
+           exporter.
+           {Default="./"}
+ - names: This is the list of the names of the data to be saved.
+          {Default=None  (all data)}
+ - ts: This is the list of the time-steps to be saved.
+       The data joined in one file ('stream' of 'key="ts"') is always
+       saved with all time-steps.
+       {Default=None  (all time-steps)}
+ - z: This is the list of the z-positions to be saved.
+      {Default=None  (all z-positions)}
+The data of all processes of parallel WARP is saved in one file.
+It returns the list of the saved files.
+    """
+    run = RunContainer(dirName, fileName)
+    if names is None:
+        names = run.names
+    saved = []
+    for name in names:
+        info = run.layouts[name]
+        baseName = os.path.join(outDir, name)
+        if not os.path.isdir(os.path.dirname(baseName)):
+            os.makedirs(os.path.dirname(baseName))
+        if info["key"] == "z":
+            for zz in run.zpos(name):
+                if z is None or zz in z:
+                    saved.append(_extract_z(run, name, info, baseName, zz))
+            continue
+        if info.get("stream", False):
+            # All time-steps are in one file
+            saved.append(_extract_stream(run, name, info, baseName))
+            continue
+        pvd = None
+        if info["fileType"] in ("vtu", "vtr"):
+            pvd = vtkseries.PVDCollection(baseName + ".pvd")
+        for tt in run.steps(name):
+            if ts is None or tt in ts:
+                saved.append(_extract_ts(run, name, info, baseName, tt,
+                                         pvd))
+    return saved
+
+
+def _extract_ts(run, name, info, baseName, ts, pvd):
+    records = run.records(name, ts=ts)
+    tsFileName = "{baseName}_{ts}_ts".format(baseName=baseName, ts=ts)
+    if info["fileType"] == "vtr":
+        axes, pointData, start = _join_pieces(records)
+        vtkFile = gridToVTK(tsFileName, axes[0], axes[1], axes[2],
+                            pointData=pointData, start=start)
+        pvd.add(ts, vtkFile)
+        return vtkFile
+    names = records[0].dtype.names
+    cols = [np.concatenate([np.ravel(rec[nm]) for rec in records])
+            if len(records) > 1 else np.array(records[0][nm])
+            for nm in names]
+    if info["fileType"] == "vtu":
+        pointData = dict((nm, np.ascontiguousarray(col))
+                         for nm, col in zip(names, cols)
+                         if nm not in ("x", "y", "z"))
+        vtkFile = pointsToVTK(tsFileName, cols[0], cols[1], cols[2],
+                              pointData)
+        pvd.add(ts, vtkFile)
+        return vtkFile
+    return _extract_columns(info, tsFileName, names, cols)
+
+
+def _extract_z(run, name, info, baseName, zz):
+    entries = run.entries(name, z=zz)
+    if not info.get("stream", False):
+        # Each record has all particles until then, same as the file
+        # saved again at each time-step
+        entries = [en for en in entries if en["ts"] == entries[-1]["ts"]]
+    records = [binarydata.load_record(en["file"], en["offset"])[0]
+               for en in entries]
+    zFileName = "{baseName}_{zPos}m".format(baseName=baseName, zPos=zz)
+    names = records[0].dtype.names
+    if not info.get("stream", False) or info["fileType"] == "txt":
+        cols = [np.concatenate([np.ravel(rec[nm]) for rec in records])
+                for nm in names]
+        return _extract_columns(info, zFileName, names, cols)
+    zFileName += ".npys"
+    open(zFileName, "wb").close()
+    for rec in records:
+        binarydata.append_columns(zFileName, names,
+                                  [rec[nm] for nm in names], info["dtype"])
+    return zFileName
+
+
+def _extract_stream(run, name, info, baseName):
+    records = [rec for tt in run.steps(name)
+               for rec in run.records(name, ts=tt)]
+    names = records[0].dtype.names
+    if info["fileType"] == "txt":
+        cols = [np.concatenate([np.ravel(rec[nm]) for rec in records])
+                for nm in names]
+        return _extract_columns(info, baseName, names, cols)
+    streamFileName = baseName + ".npys"
+    open(streamFileName, "wb").close()
+    for rec in records:
+        binarydata.append_arrays(streamFileName, names,
+                                 [rec[nm] for nm in names])
+    return streamFileName
+
+
+def _extract_columns(info, outFileName, names, cols):
+    if info["fileType"] == "npy":
+        binarydata.save_columns(outFileName + ".npy", names, cols,
+                                info["dtype"])
+        return outFileName + ".npy"
+    grid = info.get("grid", 0)
+    if grid > 0:
+        # Positions of every grid point, same as fielddata
+        pos = np.meshgrid(*cols[:grid], indexing="ij")
+        cols = [np.ravel(col) for col in list(pos) + cols[grid:]]
+    textwriter.write_text(outFileName + ".txt", info["header"], cols,
+                          info["formats"], info["delim"])
+    return outFileName + ".txt"
+
+
+def _join_pieces(records):
+    # Grid pieces of the processes put in the whole grid by their start
+    starts = [np.array(rec["start"], dtype=int) for rec in records]
+    shapes = [np.array(rec["phi"].shape) for rec in records]
+    lo = np.min(starts, axis=0)
+    hi = np.max([st + sh for st, sh in zip(starts, shapes)], axis=0)
+    axes = [np.zeros(hi[i] - lo[i]) for i in range(3)]
+    names = [nm for nm in records[0].dtype.names
+             if nm not in ("x", "y", "z", "start")]
+    pointData = dict((nm, np.zeros(tuple(hi - lo))) for nm in names)
+    for rec, st, sh in zip(records, starts, shapes):
+        sub = tuple(slice(st[i] - lo[i], st[i] - lo[i] + sh[i])
+                    for i in range(3))
+        for i, ax in enumerate(("x", "y", "z")):
+            axes[i][sub[i]] = rec[ax]
+        for nm in names:
+            pointData[nm][sub] = rec[nm]
+    return axes, pointData, tuple(int(ll) for ll in lo)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description="Extract the records of a run container to the "
+                        "files of the exporters")
+    parser.add_argument("dirName", help="directory of the container")
+    parser.add_argument("--fileName", default="run",
+                        help="name of the container files {Default: run}")
+    parser.add_argument("--outDir", default="./",
+                        help="directory of the extracted files "
+                             "{Default: ./}")
+    parser.add_argument("--names", default=None,
+                        help="names of the data separated by comma")
+    parser.add_argument("--ts", default=None,
+                        help="time-steps separated by comma")
+    parser.add_argument("--z", default=None,
+                        help="z-positions separated by comma")
+    parser.add_argument("--list", action="store_true",
+                        help="only list the saved data")
+    args = parser.parse_args(argv)
+    if args.list:
+        run = RunContainer(args.dirName, args.fileName)
+        for name in run.names:
+            info = run.layouts[name]
+            keys = run.zpos(name) if info["key"] == "z" else run.steps(name)
+            print("{name} ({ft}, {nn} {key})".format(
+                    name=name, ft=info["fileType"], nn=len(keys),
+                    key=info["key"]))
+        return
+    saved = extract(
+            args.dirName, args.fileName, args.outDir,
+            None if args.names is None else args.names.split(","),
+            None if args.ts is None else
+            [int(tt) for tt in args.ts.split(",")],
+            None if args.z is None else
+            [float(zz) for zz in args.z.split(",")])
+    print("{nn} files are saved in {outDir}".format(nn=len(saved),
+                                                     outDir=args.outDir))
+
+
+if __name__ == "__main__":
+    main()
+
+# -------------------------------------------------------------------------- #
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+"""
+scheduler module test version
+
+Created on Thu May 17 2018
+
+@author: K. Yoo, 
+Intense Beam and Accelerator Laboratory(IBAL), 
+Ulsan National Institute of Science and Technology(UNIST),
+Republic of Korea
+"""
+
+# ========================================================================== #
+#                    Module for Scheduling the Data Output                   #
+# -------------------------------------------------------------------------- #
+#                                                                            #
+# 1. Single 'callfromafterstep' function for all exporters                 #
+#                                                                            #
+# ========================================================================== #
+
+"""
+All exporters of particledata and fielddata register their saving
+functions with 'schedule' of this module instead of 'callfromafterstep'.
+Only one function is called by WARP after each time-step, and it finds the
+saving functions of the time-step 'top.it' directly;
+ - Time-steps given by the list are kept in a dictionary.
+ - Time-steps given by 'tsstart', 'tsend' and 'tsint' are kept in a heap
+   with the next time-step of each function.
+So the cost of the time-steps without output does not depend on the number
+of exporters and time-steps.
+"""
+
+import heapq
+import os
+
+from warp import *
+
+
+# Saving functions at the time-steps given by the list; {ts: [(order, fn)]}
+_tsActions = {}
+# Saving functions at every 'tsint'; [(next ts, order, fn, tsend, tsint)]
+_intActions = []
+_nActions = 0
+_installed = False
+
+
+# -------------------------------------------------------------------------- #
+
+def make_dir(dirName=None):
+    """
+This function makes the directory 'dirName' if it does not exist.
+Exporters call this once when they are registered.
+    """
+    assert isinstance(dirName, str) is True, ValueError(
+            'Directory name must be given by string type')
+    saveDir = './{dirName}/'.format(dirName=dirName)
+    if not os.path.exists(saveDir):
+        os.makedirs(saveDir)
+
+
+def schedule(action=None, ts=None, tsstart=None, tsend=None, tsint=1):
+    """
+This function registers the saving function 'action' called after the
+time-steps given by one of the following;
+ - ts: The list of time-steps, or one time-step.
+       < e.g. ts=[100, 200] >
+ - tsstart, tsend, tsint: Every time-step which is a multiple of 'tsint'
+                          from 'tsstart' to 'tsend'.
+                          Without 'tsend', it continues until the end of
+                          the simulation.
+                          {Default tsint=1}
+'action' is called without arguments, and 'top.it' is the time-step.
+    """
+    assert action is not None, ValueError(
+            'Function is not defined for schedule')
+    assert ts is not None or tsstart is not None, ValueError(
+            'Time-step is not defined for schedule')
+    assert tsint >= 1, ValueError(
+            'Interval of time-step must be larger than 0')
+    global _nActions
+    _install()
+    order = _nActions
+    _nActions += 1
+    if ts is not None:
+        if not isinstance(ts, (list, tuple, range)):
+            ts = [ts]
+        for tt in set(ts):
+            _tsActions.setdefault(tt, []).append((order, action))
+    else:
+        first = _next_ts(max(tsstart, top.it + 1), tsint)
+        if tsend is None or first <= tsend:
+            heapq.heappush(_intActions, (first, order, action, tsend, tsint))
+    return action
+
+
+def _next_ts(it, tsint):
+    # The first multiple of 'tsint' which is not smaller than 'it'
+    return -(-it // tsint) * tsint
+
+
+def _install():
+    global _installed
+    if not _installed:
+        callfromafterstep(_dispatch)
+        _installed = True
+
+
+def _dispatch():
+    it = top.it
+    actions = list(_tsActions.get(it, ()))
+    while _intActions and _intActions[0][0] <= it:
+        nextTs, order, action, tsend, tsint = heapq.heappop(_intActions)
+        if nextTs == it:
+            actions.append((order, action))
+        nextTs = _next_ts(it + 1, tsint)
+        if tsend is None or nextTs <= tsend:
+            heapq.heappush(_intActions, (nextTs, order, action, tsend, tsint))
+    if len(actions) > 1:
+        actions.sort(key=lambda oa: oa[0])
+    for order, action in actions:
+        action()
+
+# -------------------------------------------------------------------------- #
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+"""
+selection module test version
+
+Created on Thu May 17 2018
+
+@author: K. Yoo, 
+Intense Beam and Accelerator Laboratory(IBAL), 
+Ulsan National Institute of Science and Technology(UNIST),
+Republic of Korea
+"""
+
+# ========================================================================== #
+#                    Module for Selecting Particles to Save                  #
+# -------------------------------------------------------------------------- #
+#                                                                            #
+# 1. Stride, random fraction, bounding box and pid list of particles         #
+#                                                                            #
+# ========================================================================== #
+
+"""
+The exporters of particledata save only the particles selected by
+'ParticleSelection' given by the argument 'select'.
+< e.g. import selection as sl
+       sel = sl.ParticleSelection(fraction=0.01,
+                                  bbox={"z": [0.1, 0.2], "vz": [0., 1e7]})
+       pd.ts_data(part=beam, ts=[100, 200], select=sel) >
+The selection is one mask of NumPy made from the arrays of the species,
+and only the selected particles are copied and saved.
+"""
+
+import numpy as np
+
+
+# Names of the arrays of the species which can be used in 'bbox'
+BBOX_NAMES = ("x", "y", "z", "vx", "vy", "vz", "ux", "uy", "uz", "w")
+
+
+# -------------------------------------------------------------------------- #
+
+class ParticleSelection(object):
+    """
+This class selects the particles of a species.
+The particles satisfying all given conditions are selected.
+Arguments are following;
+ - stride: Every 'stride' particle is selected, starting from the
+           particle of 'seed % stride'.
+           {Default=None}
+ - fraction: The fraction of particles (0-1) selected randomly.
+             The same particles are selected at every time-step, since
+             it is decided by the particle id (pid) and 'seed'.
+             {Default=None}
+ - seed: Seed of 'stride' and 'fraction'.
+         {Default=0}
+ - bbox: This is the dictionary of the ranges of the positions and
+         velocities (the ends are included).
+         < e.g. bbox={"x": [-1.*mm, 1.*mm], "z": [0.1, 0.2]} >
+         {Default=None}
+ - pids: This is the list of particle ids (pid) selected.
+         {Default=None}
+    """
+
+    def __init__(self, stride=None, fraction=None, seed=0, bbox=None,
+                 pids=None):
+        assert stride is None or stride >= 1, ValueError(
+                'Stride must be larger than 0')
+        assert fraction is None or 0. <= fraction <= 1., ValueError(
+                'Fraction must be between 0 and 1')
+        if bbox is not None:
+            for name in bbox:
+                assert name in BBOX_NAMES, ValueError(
+                        'Box must be given by {names}'.format(
+                                names=", ".join(BBOX_NAMES)))
+        self.stride = stride
+        self.fraction = fraction
+        self.seed = seed
+        self.bbox = bbox
+        self.pids = None if pids is None else np.unique(np.asarray(pids))
+
+    def select(self, part, names, gather=1, out=None):
+        """
+This function returns the list of the arrays 'names' of the selected
+particles of the species 'part'.
+< e.g. xx, vz = sel.select(beam, ["x", "vz"]) >
+Each array of the species is read only once.
+'out' is the function returning the list of the arrays for 'names' having
+the given length, and the selected particles are copied into them instead
+of the new arrays.
+        """
+        arrays = {}
+        def get(name):
+            if name not in arrays:
+                arrays[name] = getattr(part, "get" + name)(gather=gather)
+            return arrays[name]
+        nn = len(get(names[0]))
+        mask = self.mask(get, nn)
+        if out is None:
+            if mask is None:
+                return [np.array(get(name)) for name in names]
+            index = np.flatnonzero(mask)
+            return [np.asarray(get(name))[index] for name in names]
+        if mask is None:
+            outArrays = out(nn)
+            for name, arr in zip(names, outArrays):
+                arr[...] = get(name)
+            return outArrays
+        index = np.flatnonzero(mask)
+        outArrays = out(len(index))
+        for name, arr in zip(names, outArrays):
+            np.take(np.asarray(get(name)), index, out=arr)
+        return outArrays
+
+    def mask(self, get, nn):
+        """
+This function returns the mask of the selected particles among 'nn'
+particles, or None when all particles are selected.
+'get' is the function returning the array of the given name.
+        """
+        mask = None
+        if self.bbox is not None:
+            for name in sorted(self.bbox):
+                lo, hi = self.bbox[name]
+                arr = np.asarray(get(name))
+                mask = _and(mask, (arr >= lo) & (arr <= hi))
+        if self.pids is not None:
+            mask = _and(mask, np.isin(np.asarray(get("pid")), self.pids))
+        if self.fraction is not None:
+            mask = _and(mask, pid_fraction(get("pid"), self.seed)
+                        < self.fraction)
+        if self.stride is not None:
+            strideMask = np.zeros(nn, dtype=bool)
+            strideMask[self.seed % self.stride::self.stride] = True
+            mask = _and(mask, strideMask)
+        return mask
+
+
+def pid_fraction(pid, seed=0):
+    """
+This function returns the number between 0 and 1 for each particle id,
+which is random but same for the same 'pid' and 'seed'.
+    """
+    key = np.asarray(pid).astype(np.uint64)
+    key = (key + np.uint64(seed)) * np.uint64(0x9E3779B97F4A7C15)
+    key ^= key >> np.uint64(29)
+    key *= np.uint64(0xBF58476D1CE4E5B9)
+    key ^= key >> np.uint64(32)
+    return (key >> np.uint64(11)) * (1. / 2**53)
+
+
+def _and(mask, newMask):
+    if mask is None:
+        return newMask
+    return mask & newMask
+
+# -------------------------------------------------------------------------- #
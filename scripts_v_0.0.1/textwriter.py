@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+"""
+textwriter module test version
+
+Created on Thu May 17 2018
+
+@author: K. Yoo, 
+Intense Beam and Accelerator Laboratory(IBAL), 
+Ulsan National Institute of Science and Technology(UNIST),
+Republic of Korea
+"""
+
+# ========================================================================== #
+#                    Module for Writing Delimited Text Files                 #
+# -------------------------------------------------------------------------- #
+#                                                                            #
+# 1. Columns written by blocks of rows with one formatting of each block     #
+#                                                                            #
+# ========================================================================== #
+
+"""
+All .txt files of particledata, fielddata and diagnostics are written by
+this module.
+The layout of the files is same as before; the header line, and each row
+starting with a new line ("\\n") without the new line at the end of the
+file.
+The rows are not formatted one value at a time; the format of one row is
+repeated for a block of rows, and all values of the block are formatted
+by one '%' operation and written at once.
+< e.g. textwriter.write_text("data.txt", "x(m)\\tvx(m/s)", [xx, vx],
+                             ["%.9f", "%r"], "\\t") >
+The formats are those of the '%' operator of Python;
+ - "%.9f": 9 digits after the decimal point, same as "{:.9f}".
+ - "%r": The shortest representation of the number, same as "{}".
+"""
+
+import numpy as np
+
+
+# Number of rows formatted at once
+BLOCK_ROWS = 16384
+
+
+# -------------------------------------------------------------------------- #
+
+def write_rows(textFile=None, columns=None, formats=None, delim="\t"):
+    """
+This function writes the rows of the columns to the opened file.
+Each row starts with a new line ("\\n").
+Arguments are following;
+ - textFile: This is the file opened for writing.
+ - columns: This is the list of the arrays of the same length.
+ - formats: This is the list of the formats of each column.
+            < e.g. formats=["%.9f", "%.9f", "%r"] >
+ - delim: The values of each row will be separated with this delimiter.
+          {Default="\\t"  (tab)}
+    """
+    assert textFile is not None, ValueError(
+            'File is not defined for data')
+    assert columns is not None, ValueError(
+            'Columns are not defined for data')
+    assert formats is not None and len(formats) == len(columns), ValueError(
+            'Number of formats must be same with number of columns')
+    if len(columns) == 0:
+        return
+    rowFmt = "\n" + delim.replace("%", "%%").join(formats)
+    nn = len(columns[0])
+    for start in range(0, nn, BLOCK_ROWS):
+        stop = min(start + BLOCK_ROWS, nn)
+        # Values of the block in the order of the rows, as Python numbers
+        block = np.empty((stop - start, len(columns)))
+        for i, col in enumerate(columns):
+            block[:, i] = col[start:stop]
+        textFile.write((rowFmt * (stop - start)) %
+                       tuple(block.ravel().tolist()))
+
+
+def write_text(fileName=None, header=None, columns=None, formats=None,
+               delim="\t", mode="w"):
+    """
+This function writes the header and the rows of the columns to the file
+'fileName'.
+With 'mode="a"', the rows are appended to the file without the header.
+The other arguments are same with 'write_rows'.
+< e.g. write_text("data.txt", "x(m)\\ty(m)", [xx, yy], ["%.9f", "%.9f"]) >
+    """
+    assert fileName is not None, ValueError(
+            'File name is not defined for data')
+    assert mode=="w" or mode=="a", ValueError(
+            'Mode must be one of "w" and "a"')
+    textFile = open(fileName, mode)
+    if mode == "w" and header is not None:
+        textFile.write(header)
+    write_rows(textFile, columns, formats, delim)
+    textFile.close()
+
+# -------------------------------------------------------------------------- #
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+"""
+vtkseries module test version
+
+Created on Thu May 17 2018
+
+@author: K. Yoo, 
+Intense Beam and Accelerator Laboratory(IBAL), 
+Ulsan National Institute of Science and Technology(UNIST),
+Republic of Korea
+"""
+
+# ========================================================================== #
+#                    Module for VTK Time Series of ParaView                  #
+# -------------------------------------------------------------------------- #
+#                                                                            #
+# 1. ParaView data collection file (.pvd) of the vtk files                   #
+#                                                                            #
+# ========================================================================== #
+
+"""
+The .pvd file lists the vtk files saved at each time-step, so all of them
+are opened in ParaView as one time series.
+The file is rewritten whenever a vtk file is added, so it is always
+valid even if the simulation stops.
+"""
+
+import os
+import threading
+
+
+# -------------------------------------------------------------------------- #
+
+class PVDCollection(object):
+    """
+This class keeps the .pvd file of the vtk files of one exporter.
+Arguments are following;
+ - fileName: Name of the .pvd file including the path and ".pvd".
+             < e.g. "./vtk_particle_data/vtk_particle_data.pvd" >
+    """
+
+    def __init__(self, fileName=None):
+        assert isinstance(fileName, str) is True, ValueError(
+                'File name must be given by string type')
+        self.fileName = fileName
+        self.pvdDir = os.path.dirname(os.path.abspath(fileName))
+        self.datasets = {}
+        self.lock = threading.Lock()
+
+    def add(self, ts, dataFileName, part=0):
+        """
+This function adds the vtk file 'dataFileName' at the time-step 'ts'
+and rewrites the .pvd file.
+'part' is the number of the piece when one time-step has several files.
+        """
+        relName = os.path.relpath(os.path.abspath(dataFileName),
+                                  self.pvdDir)
+        with self.lock:
+            self.datasets[(ts, part)] = relName.replace(os.sep, "/")
+            self._write()
+
+    def _write(self):
+        pvdLines = ['<?xml version="1.0"?>',
+                    '<VTKFile type="Collection" version="0.1" '
+                    'byte_order="LittleEndian">',
+                    '  <Collection>']
+        for (ts, part) in sorted(self.datasets):
+            pvdLines.append(
+                    '    <DataSet timestep="{ts}" group="" part="{part}" '
+                    'file="{fn}"/>'.format(ts=ts, part=part,
+                                           fn=self.datasets[(ts, part)]))
+        pvdLines += ['  </Collection>', '</VTKFile>', '']
+        # Replace the file at once so ParaView never reads a partial file
+        tmpName = self.fileName + ".tmp"
+        pvdWriteFile = open(tmpName, "w")
+        pvdWriteFile.write("\n".join(pvdLines))
+        pvdWriteFile.close()
+        os.rename(tmpName, self.fileName)
+
+# -------------------------------------------------------------------------- #
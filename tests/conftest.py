@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+"""
+Common fixtures of the tests
+
+The tests run the exporters with the fake warp module in
+'benchmarks/fakewarp', so WARP is not needed.
+< e.g. python -m pytest -q tests >
+"""
+
+import atexit
+import os
+import random
+import sys
+import threading
+import time
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+SCRIPTS_DIR = os.path.join(ROOT_DIR, "scripts_v_0.0.1")
+sys.path[:0] = [os.path.join(ROOT_DIR, "benchmarks", "fakewarp"),
+                SCRIPTS_DIR]
+
+# Modules whose functions registered with 'atexit' are kept by 'warprun'
+SCRIPT_MODULES = set(os.path.splitext(fn)[0]
+                     for fn in os.listdir(SCRIPTS_DIR) if fn.endswith(".py"))
+
+import numpy as np
+
+import warp
+import asyncwriter
+import fielddata
+import runcontainer
+import scheduler
+
+
+@pytest.fixture
+def warprun(tmp_path, monkeypatch):
+    """
+This fixture starts a new run of the fake warp in a temporary directory.
+The functions registered with 'atexit' by the exporters are kept, and
+called by the returned function 'finish' (or after the test) instead of
+at the exit of the tests. Those of the other packages (e.g. h5py) are
+registered as usual.
+    """
+    exitFuncs = []
+    atexitRegister = atexit.register
+    def register(func, *args, **kwargs):
+        if getattr(func, "__module__", None) not in SCRIPT_MODULES:
+            return atexitRegister(func, *args, **kwargs)
+        exitFuncs.append((func, args, kwargs))
+        return func
+    monkeypatch.setattr(atexit, "register", register)
+    monkeypatch.chdir(tmp_path)
+    warp.setup(8, 8, 8)
+    scheduler._tsActions.clear()
+    del scheduler._intActions[:]
+    scheduler._installed = False
+    def finish():
+        while exitFuncs:
+            func, args, kwargs = exitFuncs.pop()
+            func(*args, **kwargs)
+        asyncwriter.disable()
+        runcontainer.disable()
+    yield finish
+    finish()
+
+
+@pytest.fixture
+def slow():
+    """
+This fixture returns the function making 'func' wait for a random time
+before it is called, so the background threads of 'asyncwriter' finish
+the writes in random order.
+    """
+    rand = random.Random(0)
+    lock = threading.Lock()
+    def slowdown(func):
+        def slowfunc(*args, **kwargs):
+            with lock:
+                delay = rand.uniform(0., 0.01)
+            time.sleep(delay)
+            return func(*args, **kwargs)
+        return slowfunc
+    return slowdown
+
+
+@pytest.fixture
+def phicalls(monkeypatch):
+    """
+This fixture makes 'getphi' of fielddata accept only one grid number or
+None for each axis, same as WARP, and returns the list of (ix, iy, iz)
+of its calls.
+    """
+    calls = []
+    getphi = fielddata.getphi
+    def strictphi(ix=None, iy=None, iz=None, **kw):
+        for ii in (ix, iy, iz):
+            assert ii is None or isinstance(ii, (int, np.integer)), ii
+        calls.append((ix, iy, iz))
+        return getphi(ix=ix, iy=iy, iz=iz, **kw)
+    monkeypatch.setattr(fielddata, "getphi", strictphi)
+    return calls
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+"""
+Exporters of parallel WARP run by 'test_mpi.py'
+< e.g. mpirun -np 2 python mpi_exporters.py ./run >
+The fake warp has the whole grid and all particles on every process, so
+the domain of each process is set here by the z-direction.
+"""
+
+import json
+import os
+import re
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+sys.path[:0] = [os.path.join(ROOT_DIR, "benchmarks", "fakewarp"),
+                os.path.join(ROOT_DIR, "scripts_v_0.0.1")]
+
+import numpy as np
+
+import warp
+import asyncwriter
+import binarydata
+import dataset
+import diagnostics
+import fielddata as fd
+import fieldstore as fs
+import iobudget
+import parallelio
+import particledata as pd
+
+NZ = 8
+
+_POINTS_TYPE = re.compile(r'<P?Points>\s*<P?DataArray[^>]* type="(\w+)"')
+
+
+def main(runDir):
+    rank, nranks = parallelio.rank(), parallelio.nranks()
+    os.chdir(runDir)
+    warp.setup(8, 8, NZ)
+    fsd = warp.top.fsdecomp
+    fsd.iz = np.arange(nranks) * (NZ // nranks)
+    fsd.nz = np.full(nranks, NZ // nranks)
+    fsd.izproc = rank
+    extent = parallelio.local_extent()
+    getphi = fd.getphi
+    def localphi(local=0, **kw):
+        pp = getphi(**kw)
+        if local:
+            pp = pp[..., extent[2][0]:extent[2][1] + 1]
+        return pp
+    fd.getphi = localphi
+    submitted = []
+    submit = asyncwriter.submit
+    def recordsubmit(func, *args):
+        submitted.append(getattr(func, "__name__", ""))
+        submit(func, *args)
+    asyncwriter.submit = recordsubmit
+    part = warp.Species(npart=2000, seed=1 + rank)
+    pd.ts_data(part=part, ts=[2], parallel=True)
+    pd.vtk_data(part=part, tsstart=2, tsend=2, parallel=True)
+    # Positions in float32 by the budget
+    budget = iobudget.IOBudget(stepFraction=1.)
+    pd.vtk_data(part=part, tsstart=2, tsend=2, parallel=True, 
+                dirName="vtk32_data", budget=budget)
+    assert budget.controls[-1].reduce_output() == "precision"
+    pd.zcross_data(zPos=[0.5], ts=[4])
+    fd.phi_1d_xyz(direction="z", ts=[2])
+    fd.phi_3d_vtk(ts=[2], parallel=True)
+    pd.trajectory_data(part=part, pids=[3., 50.], nSteps=3, 
+                       fileType="txt")
+    moments = diagnostics.moment_data(part=part, tsstart=1, flushEvery=3)
+    diagnostics.histogram_data(part=part, hists=[("x", "y")], 
+                               ranges={"x": (-1., 1.), "y": (-1., 1.)}, 
+                               bins=4, window=2, weighted=False)
+    store = fs.phi_store(ts=[2, 4], plane="zx")
+    probe = fd.phi_probe(points=[[0., 0., 0.5]], tsstart=1, flushEvery=2)
+    warp.step(4)
+    asyncwriter.flush()
+    # Files of the whole data are saved only by the process of rank 0
+    shared = ["_write_zcross_file", "_write_phi_file", "write_index",
+              "_write_vtk_pvtu", "_write_phi_pvtr"]
+    if rank != 0:
+        assert not [fn for fn in submitted if fn in shared], submitted
+        assert probe is None
+        assert store is None
+        assert moments is None
+    parallelio.comm.Barrier()
+    if rank != 0:
+        return
+    index = json.load(open(
+            "timestep_particle_data/time_particle_data_2_ts.json"))
+    assert index["nranks"] == nranks
+    assert [sh["rank"] for sh in index["shards"]] == list(range(nranks))
+    assert all(sh["n"] == 2000 for sh in index["shards"])
+    for sh in index["shards"]:
+        assert os.path.exists(os.path.join("timestep_particle_data",
+                                           sh["file"]))
+    for dirName, vtkType in [("vtk_particle_data", "Float64"), 
+                             ("vtk32_data", "Float32")]:
+        pvtuFileName = "{dirName}/vtk_particle_data_2_ts.pvtu".format(
+                dirName=dirName)
+        pvtu = open(pvtuFileName).read()
+        assert pvtu.count("<Piece ") == nranks
+        # Type of the positions same with that of the pieces
+        assert _POINTS_TYPE.findall(pvtu) == [vtkType], pvtu
+        for src in re.findall(r'<Piece Source="([^"]+)"', pvtu):
+            with open(os.path.join(dirName, src), "rb") as ff:
+                vtu = ff.read(4096).decode("latin-1")
+            assert _POINTS_TYPE.findall(vtu) == [vtkType], src
+    pvtr = open("E_potential_3d_vtk_data/E_potential_data_2_ts.pvtr").read()
+    assert pvtr.count("<Piece ") == nranks
+    for i in range(nranks):
+        assert 'Extent="0 8 0 8 {lo} {hi}"'.format(
+                lo=i * NZ // nranks, hi=(i + 1) * NZ // nranks) in pvtr
+    assert os.path.exists("zposition_particle_data/z_particle_data_0.5m.txt")
+    assert os.path.exists("E_potential_1d_data/E_potential_data_2_ts.txt")
+    names, cols = dataset.read_text(
+            "trajectory_particle_data/trajectory_particle_data.txt")
+    # One chunk of 3 time-steps, saved once
+    assert list(cols[names.index("ts")]) == [1, 1, 2, 2, 3, 3]
+    assert probe is not None
+    moments.flush()
+    asyncwriter.flush()
+    names, cols = dataset.read_text("beam_moment_data/beam_moment_data.txt")
+    assert list(cols[names.index("ts")]) == [1, 2, 3, 4]
+    blocks = binarydata.load_stream(
+            "phase_space_data/phase_space_data_x-y.npys")
+    assert [int(block["ts"]) for block in blocks] == [2, 4]
+    assert all(block["counts"].sum() == 2 * 2000 for block in blocks)
+    store.close()
+    with fs.FieldStore("E_potential_store/E_potential_data.h5") as fstore:
+        assert list(fstore.ts) == [2, 4]
+    print("OK {nranks}".format(nranks=nranks))
+
+
+if __name__ == "__main__":
+    try:
+        main(sys.argv[1])
+    except Exception:
+        # The other processes would wait at the barrier
+        import traceback
+        traceback.print_exc()
+        sys.stdout.flush()
+        parallelio.comm.Abort(1)
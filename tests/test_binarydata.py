@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+import warp
+import binarydata as bd
+import particledata as pd
+
+NAMES = ["pid", "x", "y", "t", "vx", "vy", "vz"]
+
+
+def _columns(nn, seed=0):
+    rand = np.random.RandomState(seed)
+    cols = [np.arange(1., nn + 1.) + 2.**40] + \
+        [rand.normal(0., 1., nn) for name in NAMES[1:]]
+    return cols
+
+
+@pytest.mark.parametrize("dtype", ["float64", "float32"])
+@pytest.mark.parametrize("mmap", [True, False])
+def test_columns_round_trip(tmp_path, dtype, mmap):
+    fileName = str(tmp_path / "data.npy")
+    cols = _columns(1000)
+    bd.save_columns(fileName, NAMES, cols, dtype=dtype)
+    data = bd.load_columns(fileName, mmap=mmap)
+    assert isinstance(data, np.memmap) == mmap
+    assert list(data.dtype.names) == NAMES
+    # 'pid' is not rounded with "float32"
+    assert data.dtype["pid"].base == np.float64
+    assert data.dtype["x"].base == np.dtype(dtype)
+    assert np.array_equal(data["pid"], cols[0])
+    for name, col in zip(NAMES[1:], cols[1:]):
+        assert np.array_equal(data[name], col.astype(dtype))
+    # Same file is read by NumPy alone
+    assert np.array_equal(np.load(fileName)["vz"], data["vz"])
+
+
+def test_empty_columns(tmp_path):
+    fileName = str(tmp_path / "empty.npy")
+    bd.save_columns(fileName, NAMES, [np.zeros(0)] * len(NAMES))
+    data = bd.load_columns(fileName)
+    assert list(data.dtype.names) == NAMES and len(data["x"]) == 0
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_stream_round_trip(tmp_path, mmap):
+    fileName = str(tmp_path / "data.npys")
+    parts = [_columns(nn, seed) for seed, nn in enumerate([5, 0, 300, 17])]
+    for cols in parts:
+        bd.append_columns(fileName, NAMES, cols, dtype="float32")
+    blocks = bd.load_stream(fileName, mmap=mmap)
+    assert len(blocks) == len(parts)
+    assert all(isinstance(block, np.memmap) == mmap for block in blocks)
+    assert [len(block["x"]) for block in blocks] == [5, 0, 300, 17]
+    for k, name in enumerate(NAMES):
+        joined = np.concatenate([cols[k] for cols in parts])
+        if name != "pid":
+            joined = joined.astype(np.float32)
+        assert np.array_equal(bd.stream_column(blocks, name), joined)
+    assert len(bd.stream_column([], "x")) == 0
+
+
+def test_record_offsets(tmp_path):
+    fileName = str(tmp_path / "data.npys")
+    bd.append_columns(fileName, ["a"], [np.arange(3.)])
+    bd.append_columns(fileName, ["a", "b"], [np.arange(2.), np.ones(2)])
+    first, offset = bd.load_record(fileName, 0)
+    second, end = bd.load_record(fileName, offset)
+    assert list(first["a"]) == [0., 1., 2.]
+    assert list(second.dtype.names) == ["a", "b"]
+    assert end == len(open(fileName, "rb").read())
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_array_stream_round_trip(tmp_path, mmap):
+    fileName = str(tmp_path / "traj.npys")
+    pids = np.array([3., 8.])
+    chunks = [np.arange(6.).reshape(2, 3), np.arange(4.).reshape(2, 2)]
+    for i, xx in enumerate(chunks):
+        ts = np.arange(xx.shape[1], dtype=np.int64) + 10 * i
+        bd.append_arrays(fileName, ["ts", "pid", "x"], 
+                         [ts, pids, xx.astype(np.float32)])
+    blocks = bd.load_stream(fileName, mmap=mmap)
+    assert [list(block.dtype.names) for block in blocks] == \
+        [["ts", "pid", "x"]] * 2
+    assert blocks[0].dtype["ts"] == np.dtype(("<i8", (3,)))
+    assert blocks[0].dtype["x"] == np.dtype(("<f4", (2, 3)))
+    assert blocks[1].dtype["x"] == np.dtype(("<f4", (2, 2)))
+    assert list(bd.stream_array(blocks, "ts")) == [0, 1, 2, 10, 11]
+    assert np.array_equal(bd.stream_array(blocks, "x"), 
+                          np.concatenate(chunks, axis=1))
+
+
+def test_array_record_dtype():
+    record = bd.array_record(["pid", "x"], [np.arange(3.) + 2.**40, 
+                                            np.arange(6.).reshape(2, 3)], 
+                             dtype="float32")
+    # 'pid' is not rounded
+    assert record.dtype["pid"] == np.dtype(("<f8", (3,)))
+    assert record.dtype["x"] == np.dtype(("<f4", (2, 3)))
+    assert record["pid"][2] == 2.**40 + 2.
+
+
+def test_exporter_snapshot(warprun):
+    part = warp.Species(npart=1000)
+    pd.ts_data(part=part, ts=[2], fileType="npy", dtype="float32")
+    warp.step(2)
+    warprun()
+    data = bd.load_columns(
+            "timestep_particle_data/time_particle_data_2_ts.npy")
+    assert np.array_equal(data["z"], part.z.astype(np.float32))
+    assert list(data.dtype.names) == pd.TS_COLUMNS
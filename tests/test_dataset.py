@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+import pytest
+
+import warp
+import binarydata
+import dataset
+import fielddata as fd
+import particledata as pd
+
+TS_TXT = "timestep_particle_data/time_particle_data_{ts}_ts.txt"
+
+
+def _save_run(warprun):
+    part = warp.Species(npart=500)
+    pd.ts_data(part=part, ts=[2, 4])
+    pd.ts_data(part=part, ts=[3], dirName="ts_npy", fileType="npy")
+    pd.ts_data(part=part, ts=[4], dirName="ts_parallel", parallel=True)
+    pd.zcross_data(zPos=[0.25, 0.5], ts=[5])
+    pd.zcross_data(zPos=[0.3], flushEvery=2, dirName="zs_npy", 
+                   fileType="npy", part=part)
+    fd.phi_2d_xyz(plane="xy", ts=[3])
+    fd.efield_1d_xyz(direction="z", ts=[4])
+    warp.step(5)
+    warprun()
+
+
+def test_series_of_run(warprun):
+    _save_run(warprun)
+    run = dataset.Run("./")
+    assert run.names == ["E_field_1d_data/E_field_data", 
+                         "E_potential_2d_data/E_potential_data", 
+                         "timestep_particle_data/time_particle_data", 
+                         "ts_npy/time_particle_data", 
+                         "ts_parallel/time_particle_data", 
+                         "zposition_particle_data/z_particle_data", 
+                         "zs_npy/z_particle_data"]
+    particles = run["timestep_particle_data/time_particle_data"]
+    assert particles.kind == "particles" and particles.keys == [2, 4]
+    assert 4 in particles and 3 not in particles
+    assert run.phi.name == "E_potential_2d_data/E_potential_data"
+    assert run.efield.keys == [4]
+    assert [sr.kind for sr in run.find("zcross")] == ["zcross", "zcross"]
+    # More than one series of the kind
+    with pytest.raises(AssertionError):
+        run.particles
+    with pytest.raises(AssertionError):
+        run["no_data/no_file"]
+
+
+def test_frames_same_as_files(warprun):
+    _save_run(warprun)
+    run = dataset.Run("./")
+    for ts in [2, 4]:
+        frame = run["timestep_particle_data/time_particle_data"][ts]
+        names, cols = dataset.read_text(TS_TXT.format(ts=ts))
+        assert frame.columns == names
+        assert len(frame) == len(cols[0])
+        for name, col in zip(names, cols):
+            assert np.array_equal(frame[name], col)
+    # .npy is memory-mapped
+    frame = run["ts_npy/time_particle_data"][3]
+    assert isinstance(frame["x"], np.memmap)
+    data = binarydata.load_columns(
+            "ts_npy/time_particle_data_3_ts.npy", mmap=False)
+    assert np.array_equal(frame.vz, data["vz"])
+    # Shards of the .json index
+    frame = run["ts_parallel/time_particle_data"][4]
+    assert frame.fileName.endswith(".json")
+    names, cols = dataset.read_text(
+            "ts_parallel/time_particle_data_4_ts_r0000.txt")
+    assert np.array_equal(frame.z, cols[names.index("z")])
+    # z-positions with the rounding of the file names
+    zcross = run["zposition_particle_data/z_particle_data"]
+    assert zcross.keys == [0.25, 0.5]
+    names, cols = dataset.read_text(
+            "zposition_particle_data/z_particle_data_0.5m.txt")
+    assert np.array_equal(zcross[0.5 + 1e-13].pid, cols[0])
+    blocks = binarydata.load_stream("zs_npy/z_particle_data_0.3m.npys")
+    assert np.array_equal(run["zs_npy/z_particle_data"][0.3].t, 
+                          binarydata.stream_column(blocks, "t"))
+    # Field data on the grid
+    frame = run.phi[3]
+    names, cols = dataset.read_text(run.phi.files[3])
+    assert np.array_equal(frame.phi, cols[names.index("phi")])
+
+
+def _count_text_reads(monkeypatch):
+    reads = []
+    readText = dataset.read_text
+    def counted(fileName=None):
+        reads.append(os.path.basename(fileName))
+        return readText(fileName)
+    monkeypatch.setattr(dataset, "read_text", counted)
+    return reads
+
+
+def test_cache_reused(warprun, monkeypatch):
+    _save_run(warprun)
+    reads = _count_text_reads(monkeypatch)
+    first = dataset.Run("./")["timestep_particle_data/time_particle_data"]
+    xx = np.array(first[2].x)
+    cacheName = "timestep_particle_data/{cache}/{fn}.npy".format(
+            cache=dataset.CACHE_DIR, fn=os.path.basename(TS_TXT.format(ts=2)))
+    assert os.path.exists(cacheName)
+    assert reads == ["time_particle_data_2_ts.txt"]
+    # Cache is not a series of the run
+    second = dataset.Run("./")
+    assert len(second.names) == 7
+    frame = second["timestep_particle_data/time_particle_data"][2]
+    assert isinstance(frame.x, np.memmap)
+    assert np.array_equal(frame.x, xx)
+    assert len(reads) == 1
+
+
+def test_cache_invalidated(warprun, monkeypatch):
+    _save_run(warprun)
+    fileName = TS_TXT.format(ts=2)
+    name = "timestep_particle_data/time_particle_data"
+    dataset.Run("./")[name][2].x
+    cacheName = os.path.join(os.path.dirname(fileName), dataset.CACHE_DIR, 
+                             os.path.basename(fileName) + ".npy")
+    mtime = os.path.getmtime(cacheName) - 10.
+    os.utime(cacheName, (mtime, mtime))
+    # The .txt file saved again after the cache
+    names, cols = dataset.read_text(fileName)
+    header = open(fileName).readline()
+    with open(fileName, "w") as ff:
+        ff.write(header)
+        np.savetxt(ff, np.column_stack(cols)[:10] * 2., delimiter="\t")
+    reads = _count_text_reads(monkeypatch)
+    frame = dataset.Run("./")[name][2]
+    assert np.array_equal(frame.x, 2. * cols[names.index("x")][:10])
+    assert reads == ["time_particle_data_2_ts.txt"]
+    # Cache made again from the new file
+    frame = dataset.Run("./")[name][2]
+    assert len(frame) == 10 and len(reads) == 1
+
+
+def test_without_cache(warprun, monkeypatch):
+    _save_run(warprun)
+    reads = _count_text_reads(monkeypatch)
+    name = "timestep_particle_data/time_particle_data"
+    for i in range(2):
+        run = dataset.Run("./", cache=False)
+        assert len(run[name][4].vx) == 500
+    assert len(reads) == 2
+    assert not os.path.exists("timestep_particle_data/" + dataset.CACHE_DIR)
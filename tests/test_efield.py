@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+import warp
+import fielddata as fd
+
+
+def _full_field():
+    pp = np.asarray(warp.getphi(), dtype=np.float64)
+    return [-np.gradient(pp, dd, axis=i) 
+            for i, dd in enumerate((warp.w3d.dx, warp.w3d.dy, warp.w3d.dz))]
+
+
+def test_cut_values(warprun):
+    warp.step(3)
+    ee = _full_field()
+    pp = warp.getphi()
+    for cut in [dict(xx=3, yy=0), dict(yy=8, zz=4), dict(xx=0, zz=8), 
+                dict(yy=5), dict(zz=0), dict()]:
+        index = tuple(cut.get(ax * 2) for ax in "xyz")
+        pick = tuple(slice(None) if ii is None else ii for ii in index)
+        got = fd.efield_cut(phi=True, **cut)
+        for gg, full in zip(got, ee + [pp]):
+            assert np.allclose(gg, full[pick], rtol=1e-12, atol=0.)
+
+
+def test_cut_reads_slab(warprun, phicalls):
+    fd.efield_cut(xx=3, yy=0)
+    fd.efield_cut(xx=0, yy=8, zz=4)
+    fd.efield_cut(yy=4)
+    # Planes and lines around the cut; the whole grid for the thick slab
+    assert phicalls == [(None, 0, None), (None, 1, None), 
+                        (0, 7, None), (0, 8, None), 
+                        (1, 7, None), (1, 8, None), 
+                        (None, None, None)]
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+import warp
+import iobudget
+import selection
+
+
+def test_control_without_budget():
+    control = iobudget.register(None, "data", decimate=True, reduce=True)
+    action = lambda: None
+    sel = selection.ParticleSelection()
+    assert control.wrap(action) is action
+    assert control.select(sel) is sel
+    assert control.keep(np.arange(10.)) is None
+
+
+def test_wrap_interval(warprun):
+    budget = iobudget.IOBudget(stepFraction=1.)
+    control = budget.register("data")
+    calls = []
+    action = control.wrap(lambda: calls.append(warp.top.it))
+    control.interval = 3
+    for it in range(1, 8):
+        warp.top.it = it
+        action()
+    # Every 3rd call, and its time is measured
+    assert calls == [1, 4, 7]
+    assert len(control.costs) == 3
+
+
+def test_reduce_and_restore(warprun):
+    budget = iobudget.IOBudget(stepFraction=1., minFraction=0.25,
+                               maxInterval=4)
+    control = budget.register("data", decimate=True, reduce=True)
+    actions = []
+    while True:
+        action = control.reduce_output()
+        if action is None:
+            break
+        actions.append(action)
+    assert actions == ["precision", "fraction", "fraction", "interval",
+                       "interval"]
+    assert (control.dtype, control.fraction, control.interval) == \
+        ("float32", 0.25, 4)
+    restored = [control.restore_output() for action in actions]
+    assert restored == ["restore " + action for action in actions[::-1]]
+    assert (control.dtype, control.fraction, control.interval) == \
+        ("float64", 1., 1)
+
+
+def test_float32_exporter_keeps_precision(warprun):
+    budget = iobudget.IOBudget(stepFraction=1., maxInterval=2)
+    control = budget.register("data", dtype="float32", reduce=True)
+    assert control.reduce_output() == "interval"
+    assert control.reduce_output() is None
+
+
+def test_select_and_keep(warprun):
+    budget = iobudget.IOBudget(stepFraction=1.)
+    control = budget.register("data", decimate=True)
+    sel = selection.ParticleSelection(fraction=0.5, seed=3)
+    control.fraction = 0.25
+    newSel = control.select(sel)
+    assert newSel is not sel and newSel.fraction == 0.125
+    assert newSel.seed == 3 and sel.fraction == 0.5
+    assert control.select(sel) is newSel
+    pid = np.arange(1., 20001.)
+    mask = control.keep(pid)
+    assert abs(mask.mean() - 0.25) < 0.02
+    # Same particles are kept at every time-step
+    assert np.array_equal(mask, control.keep(pid))
+
+
+def test_cost_and_prune(warprun):
+    budget = iobudget.IOBudget(gbPerHour=1.)
+    control = budget.register("data")
+    for it, seconds, nbytes in [(1, 0.1, 10), (2, 0.2, 20), (3, 0.4, 40)]:
+        warp.top.it = it
+        control.add_cost(seconds, nbytes)
+    seconds, nbytes = control.cost(1)
+    assert np.isclose(seconds, 0.6) and nbytes == 60
+    control.prune(2)
+    assert [cc[0] for cc in control.costs] == [3]
+
+
+def test_budget_reduces_heavy_output(warprun):
+    budget = iobudget.IOBudget(stepFraction=1e-6, window=2)
+    light = budget.register("light", decimate=True)
+    heavy = budget.register("heavy", decimate=True)
+    for it in range(1, 4):
+        warp.step(1)
+        light.add_cost(1e-6, 0)
+        heavy.add_cost(1e-3, 0)
+    assert heavy.fraction == 0.5 and light.fraction == 1.
+    log = open("io_budget_log.txt").read().split("\n")
+    assert log[-1].split("\t")[2:4] == ["heavy", "fraction"]
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+import warnings
+
+import numpy as np
+
+import warp
+import diagnostics
+
+
+def _average(qq, ww):
+    return np.sum(qq * ww) / np.sum(ww)
+
+
+def _reference(part, xx, yy, zz, vx, vy, vz, ww):
+    # Moments of 'beam_moments' computed directly; the angles only of the 
+    # particles moving in z
+    ww = ww * part.sw
+    moving = vz != 0.
+    xa, ya, wa = xx[moving], yy[moving], ww[moving]
+    xp, yp = vx[moving] / vz[moving], vy[moving] / vz[moving]
+    ke = diagnostics.kinetic_energy(part, vx, vy, vz)
+    def rms(qq, ww):
+        return np.sqrt(_average((qq - _average(qq, ww))**2, ww))
+    def emit(qq, pp, ww):
+        dq, dp = qq - _average(qq, ww), pp - _average(pp, ww)
+        return np.sqrt(_average(dq * dq, ww) * _average(dp * dp, ww) - 
+                       _average(dq * dp, ww)**2)
+    return [len(ww), np.sum(ww), _average(xx, ww), _average(yy, ww), 
+            _average(zz, ww), _average(vz, ww), rms(xx, ww), rms(yy, ww), 
+            rms(zz, ww), rms(xp, wa), rms(yp, wa), emit(xa, xp, wa), 
+            emit(ya, yp, wa), _average(ke, ww), rms(ke, ww)]
+
+
+def _columns(part):
+    return [np.array(getattr(part, name)) 
+            for name in ["x", "y", "z", "vx", "vy", "vz", "w"]]
+
+
+def test_moments_values(warprun):
+    part = warp.Species(npart=1000)
+    cols = _columns(part)
+    cols[-1] = np.random.RandomState(2).uniform(0.5, 2., 1000)
+    row = diagnostics.beam_moments(part, *cols)
+    assert np.allclose(row, _reference(part, *cols), rtol=1e-9, atol=0.)
+
+
+def test_moments_particle_at_rest(warprun):
+    part = warp.Species(npart=1000)
+    cols = _columns(part)
+    cols[5][7] = 0.
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        row = diagnostics.beam_moments(part, *cols)
+    assert np.all(np.isfinite(row))
+    assert np.allclose(row, _reference(part, *cols), rtol=1e-9, atol=0.)
+    # Only the particle at rest is not used for the angles
+    assert row[0] == 1000
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _mpirun():
+    try:
+        import mpi4py
+    except ImportError:
+        return None
+    for name in ("mpirun", "mpiexec"):
+        for path in os.environ.get("PATH", "").split(os.pathsep):
+            if os.access(os.path.join(path, name), os.X_OK):
+                return os.path.join(path, name)
+    return None
+
+
+@pytest.mark.skipif(_mpirun() is None, reason="mpi4py and mpirun are needed")
+def test_parallel_exporters(tmp_path):
+    env = dict(os.environ)
+    # Open MPI runs 2 processes on 1 core, and as root in containers
+    env.setdefault("OMPI_MCA_rmaps_base_oversubscribe", "1")
+    env.setdefault("OMPI_ALLOW_RUN_AS_ROOT", "1")
+    env.setdefault("OMPI_ALLOW_RUN_AS_ROOT_CONFIRM", "1")
+    proc = subprocess.run(
+            [_mpirun(), "-np", "2", sys.executable,
+             os.path.join(TESTS_DIR, "mpi_exporters.py"), str(tmp_path)],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env,
+            timeout=120)
+    output = proc.stdout.decode()
+    assert proc.returncode == 0, output
+    assert "OK 2" in output
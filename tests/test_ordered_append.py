@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import warp
+import asyncwriter
+import binarydata
+import dataset
+import particledata as pd
+
+
+def test_write_sequence_order(slow):
+    written = []
+    sequence = asyncwriter.WriteSequence()
+    asyncwriter.enable(nWorkers=4)
+    try:
+        for i in range(40):
+            sequence.submit(slow(written.append), i)
+        asyncwriter.flush()
+    finally:
+        asyncwriter.disable()
+    assert written == list(range(40))
+
+
+def test_write_sequence_after_error():
+    written = []
+    sequence = asyncwriter.WriteSequence()
+    writer = asyncwriter.enable(nWorkers=2)
+    def fail():
+        raise IOError("disk full")
+    sequence.submit(fail)
+    while writer.error is None:
+        time.sleep(0.001)
+    # The error is raised by the next submit, and its order is released
+    with pytest.raises(IOError):
+        sequence.submit(written.append, 1)
+    sequence.submit(written.append, 2)
+    flusher = threading.Thread(target=writer.flush)
+    flusher.daemon = True
+    flusher.start()
+    flusher.join(5.)
+    if flusher.is_alive():
+        # The writer waiting for the lost order is left to the exit
+        asyncwriter._writer = None
+    else:
+        asyncwriter.disable()
+    assert not flusher.is_alive()
+    assert written == [2]
+
+
+def test_zcross_stream_order(warprun, monkeypatch, slow):
+    monkeypatch.setattr(binarydata, "append_columns",
+                        slow(binarydata.append_columns))
+    part = warp.Species(npart=5000)
+    asyncwriter.enable(nWorkers=4)
+    pd.zcross_data(zPos=[0.5], flushEvery=1, fileType="npy", part=part)
+    warp.step(30)
+    warprun()
+    blocks = binarydata.load_stream(
+            "zposition_particle_data/z_particle_data_0.5m.npys")
+    # Crossing times of each flush are between two time-steps
+    tMin = [np.min(block["t"]) for block in blocks]
+    tMax = [np.max(block["t"]) for block in blocks]
+    assert len(blocks) > 10
+    assert np.all(np.array(tMax[:-1]) <= np.array(tMin[1:]))
+
+
+def test_field_store_order(warprun, monkeypatch, slow):
+    import fieldstore as fs
+    monkeypatch.setattr(fs.FieldStoreWriter, "_encode",
+                        slow(fs.FieldStoreWriter._encode))
+    asyncwriter.enable(nWorkers=4)
+    fs.phi_store(ts=list(range(1, 21)), plane="zx", delta=True)
+    warp.step(20)
+    warprun()
+    store = fs.FieldStore("./E_potential_store/E_potential_data.h5")
+    assert list(store.ts) == list(range(1, 21))
+    assert np.array_equal(store.read(20), warp.getphi(iy=0).T)
+
+
+def test_moment_stream_order(warprun, monkeypatch, slow):
+    import diagnostics
+    monkeypatch.setattr(diagnostics.RowStream, "_write",
+                        slow(diagnostics.RowStream._write))
+    part = warp.Species(npart=1000)
+    asyncwriter.enable(nWorkers=4)
+    diagnostics.moment_data(part=part, flushEvery=2)
+    warp.step(40)
+    warprun()
+    names, cols = dataset.read_text("beam_moment_data/beam_moment_data.txt")
+    assert list(cols[names.index("ts")]) == list(range(1, 41))
+
+
+def test_probe_stream_order(warprun, monkeypatch, slow):
+    import diagnostics
+    import fielddata as fd
+    monkeypatch.setattr(diagnostics.RowStream, "_write",
+                        slow(diagnostics.RowStream._write))
+    asyncwriter.enable(nWorkers=4)
+    fd.phi_probe(points=[[0., 0., 0.5]], fileType="npy", flushEvery=3)
+    warp.step(40)
+    warprun()
+    blocks = binarydata.load_stream(
+            "E_potential_probe_data/E_potential_probe.npys")
+    assert list(binarydata.stream_column(blocks, "ts")) == \
+        list(range(1, 41))
+
+
+def test_histogram_stream_order(warprun, monkeypatch, slow):
+    import diagnostics
+    monkeypatch.setattr(diagnostics, "_append_hist",
+                        slow(diagnostics._append_hist))
+    part = warp.Species(npart=1000)
+    asyncwriter.enable(nWorkers=4)
+    diagnostics.histogram_data(part=part, hists=[("x", "xp")], window=2,
+                               ranges={"x": [-0.01, 0.01],
+                                       "xp": [-0.01, 0.01]})
+    warp.step(40)
+    warprun()
+    blocks = binarydata.load_stream(
+            "phase_space_data/phase_space_data_x-xp.npys")
+    assert list(binarydata.stream_column(blocks, "ts")) == \
+        list(range(2, 41, 2))
+
+
+def test_trajectory_stream_order(warprun, monkeypatch, slow):
+    monkeypatch.setattr(pd, "_append_trajectory_file",
+                        slow(pd._append_trajectory_file))
+    asyncwriter.enable(nWorkers=4)
+    part = warp.Species(npart=1000)
+    pd.trajectory_data(part=part, pids=[3., 50., 700.], nSteps=2)
+    pd.trajectory_data(part=part, pids=[3., 50.], nSteps=3, 
+                       dirName="traj_txt", fileType="txt")
+    warp.step(40)
+    warprun()
+    blocks = binarydata.load_stream(
+            "trajectory_particle_data/trajectory_particle_data.npys")
+    assert list(binarydata.stream_array(blocks, "ts")) == \
+        list(range(1, 41))
+    names, cols = dataset.read_text(
+            "traj_txt/trajectory_particle_data.txt")
+    ts = cols[names.index("ts")]
+    assert np.all(np.diff(ts) >= 0) and len(np.unique(ts)) == 40
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+import warp
+import dataset
+import fielddata as fd
+
+
+def _corner(ax, high):
+    # Boundary of the grid, out of the grid by the rounding for 'high'
+    if high:
+        return getattr(warp.w3d, ax + "mmax") * (1. + 1e-15) + 1e-18
+    return getattr(warp.w3d, ax + "mmin")
+
+
+def test_probe_values(warprun):
+    w3d = warp.w3d
+    points = [[_corner("x", True), _corner("y", True), _corner("z", True)],
+              [w3d.xmmin + 2 * w3d.dx, w3d.ymmin + 3 * w3d.dy,
+               w3d.zmmin + 4 * w3d.dz],
+              [w3d.xmmin + 2.5 * w3d.dx, w3d.ymmin + 3 * w3d.dy,
+               w3d.zmmin + 4 * w3d.dz]]
+    fd.phi_probe(points=points, tsstart=1, tsend=1)
+    warp.step(1)
+    phi = np.array(warp.getphi())
+    warprun()
+    names, cols = dataset.read_text(
+            "E_potential_probe_data/E_potential_probe.txt")
+    values = [cols[names.index("phi_{i}".format(i=i))][0] for i in range(3)]
+    assert np.isclose(values[0], phi[-1, -1, -1], rtol=1e-9)
+    assert np.isclose(values[1], phi[2, 3, 4], rtol=1e-9)
+    assert np.isclose(values[2], 0.5 * (phi[2, 3, 4] + phi[3, 3, 4]),
+                      rtol=1e-9)
+
+
+def test_probe_reads_box(warprun, phicalls):
+    w3d = warp.w3d
+    calls = phicalls
+    fd.phi_probe(points=[[0., 0., 0.5], [w3d.dx, 0., 0.5]], tsstart=1,
+                 tsend=3)
+    warp.step(3)
+    # Lines along x at the 2 x 2 grid points of y and z around the probes
+    assert len(calls) == 3 * 4
+    assert len(set(calls)) == 4
+    assert all(ix is None and iy is not None and iz is not None 
+               for ix, iy, iz in calls)
+
+
+def test_phi_box(warprun, phicalls):
+    warp.step(2)
+    phi = np.array(warp.getphi())
+    calls = phicalls
+    for box, nCalls in [([(0, 9), (0, 9), (0, 9)], 1), 
+                        ([(2, 4), (0, 9), (5, 7)], 4), 
+                        ([(3, 4), (1, 3), (0, 9)], 2), 
+                        ([(1, 3), (2, 4), (7, 9)], 4), 
+                        ([(1, 6), (0, 9), (2, 8)], 1)]:
+        del calls[:]
+        pp = fd.phi_box(box)
+        assert len(calls) == nCalls
+        assert np.array_equal(pp, phi[tuple(slice(lo, hi) 
+                                            for lo, hi in box)])
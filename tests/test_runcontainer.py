@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import warp
+import fielddata as fd
+import particledata as pd
+import runcontainer
+import scheduler
+
+
+def _exporters():
+    part = warp.Species(npart=5000)
+    pd.ts_data(part=part, ts=[2, 4])
+    pd.ts_data(part=part, ts=[3], dirName="ts_npy", fileType="npy", 
+               dtype="float32")
+    pd.zcross_data(zPos=[0.25, 0.5], ts=[3, 5])
+    pd.zcross_data(zPos=[0.25], flushEvery=2, dirName="zs_txt")
+    pd.zcross_data(zPos=[0.5], flushEvery=2, dirName="zs_npy", 
+                   fileType="npy", part=part)
+    pd.vtk_data(part=part, tsstart=2, tsend=4, tsint=2)
+    pd.trajectory_data(part=part, pids=[3., 50., 700.], nSteps=2)
+    pd.trajectory_data(part=part, pids=[8., 90.], nSteps=4, 
+                       dirName="traj_txt", fileType="txt")
+    fd.phi_1d_xyz(direction="z", ts=[3])
+    fd.phi_2d_xyz(plane="zx", ts=[3])
+    fd.phi_3d_xyz(ts=[3, 5])
+    fd.efield_2d_xyz(plane="xy", ts=[4], phi=True)
+    fd.phi_3d_vtk(ts=[4], rho=True)
+
+
+def _files(dirName):
+    files = {}
+    for root, dirs, fileNames in os.walk(dirName):
+        for fn in fileNames:
+            fullName = os.path.join(root, fn)
+            with open(fullName, "rb") as ff:
+                files[os.path.relpath(fullName, dirName)] = ff.read()
+    return files
+
+
+def test_extract_same_as_direct(warprun, tmp_path):
+    # Files saved by the exporters
+    os.mkdir("direct")
+    os.chdir("direct")
+    _exporters()
+    warp.step(6)
+    warprun()
+    # Same run saved in the container, and extracted
+    os.chdir(str(tmp_path))
+    os.mkdir("container")
+    os.chdir("container")
+    warp.setup(8, 8, 8)
+    scheduler._tsActions.clear()
+    del scheduler._intActions[:]
+    scheduler._installed = False
+    runcontainer.enable(segmentBytes=200000)
+    _exporters()
+    warp.step(6)
+    warprun()
+    runcontainer.extract("run_container", outDir="../extracted")
+    direct = _files(str(tmp_path / "direct"))
+    extracted = _files(str(tmp_path / "extracted"))
+    assert sorted(extracted) == sorted(direct)
+    for name in sorted(direct):
+        assert extracted[name] == direct[name], name
+    # More than one segment file
+    segs = [fn for fn in os.listdir("run_container") if fn.endswith(".seg")]
+    assert len(segs) > 1
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+import warp
+import scheduler
+
+
+def _recorder(calls, name):
+    def action():
+        calls.append((warp.top.it, name))
+    return action
+
+
+def test_time_steps_and_intervals(warprun):
+    calls = []
+    scheduler.schedule(_recorder(calls, "ts"), ts=[3, 1, 3, 7])
+    scheduler.schedule(_recorder(calls, "one"), ts=5)
+    scheduler.schedule(_recorder(calls, "int"), tsstart=2, tsend=9, tsint=3)
+    warp.step(10)
+    assert [it for it, nm in calls if nm == "ts"] == [1, 3, 7]
+    assert [it for it, nm in calls if nm == "one"] == [5]
+    # Multiples of 'tsint' from 'tsstart' to 'tsend'
+    assert [it for it, nm in calls if nm == "int"] == [3, 6, 9]
+
+
+def test_order_of_registration(warprun):
+    calls = []
+    scheduler.schedule(_recorder(calls, "a"), tsstart=1, tsint=2)
+    scheduler.schedule(_recorder(calls, "b"), ts=[2, 4])
+    scheduler.schedule(_recorder(calls, "c"), tsstart=1)
+    warp.step(4)
+    # Same time-step in the order of 'schedule', not of 'ts' and 'tsint'
+    assert calls == [(1, "c"), (2, "a"), (2, "b"), (2, "c"),
+                     (3, "c"), (4, "a"), (4, "b"), (4, "c")]
+
+
+def test_schedule_during_run(warprun):
+    calls = []
+    warp.step(5)
+    # Time-steps before the current one are skipped
+    scheduler.schedule(_recorder(calls, "late"), tsstart=1, tsint=4)
+    scheduler.schedule(_recorder(calls, "past"), ts=[3])
+    scheduler.schedule(_recorder(calls, "end"), tsstart=6, tsend=5)
+    warp.step(5)
+    assert calls == [(8, "late")]
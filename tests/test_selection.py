@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+import warp
+import selection as sl
+
+NAMES = ["x", "vz", "pid"]
+
+
+def _arrays(part):
+    return dict((name, np.array(getattr(part, name))) 
+                for name in ["x", "y", "z", "vx", "vy", "vz", "pid", "w"])
+
+
+def _check(sel, part, mask):
+    arrays = _arrays(part)
+    got = sel.select(part, NAMES)
+    for name, arr in zip(NAMES, got):
+        assert np.array_equal(arr, arrays[name][mask])
+
+
+def test_all_particles(warprun):
+    part = warp.Species(npart=500)
+    sel = sl.ParticleSelection()
+    assert sel.mask(lambda name: getattr(part, name), 500) is None
+    xx, = sel.select(part, ["x"])
+    assert np.array_equal(xx, part.x)
+    # A copy, not the array of the species
+    xx[0] += 1.
+    assert xx[0] != part.x[0]
+
+
+def test_stride(warprun):
+    part = warp.Species(npart=500)
+    mask = np.zeros(500, dtype=bool)
+    mask[2::7] = True
+    _check(sl.ParticleSelection(stride=7, seed=9), part, mask)
+    _check(sl.ParticleSelection(stride=1), part, np.ones(500, dtype=bool))
+
+
+def test_bbox(warprun):
+    part = warp.Species(npart=2000)
+    arrays = _arrays(part)
+    # The ends of the ranges are included
+    xLo, xHi = np.sort(arrays["x"])[[300, 1500]]
+    bbox = {"x": [xLo, xHi], "vz": [1e7, 2e7]}
+    mask = ((arrays["x"] >= xLo) & (arrays["x"] <= xHi) & 
+            (arrays["vz"] >= 1e7))
+    _check(sl.ParticleSelection(bbox=bbox), part, mask)
+    assert mask.sum() > 100
+
+
+def test_pids(warprun):
+    part = warp.Species(npart=500)
+    sel = sl.ParticleSelection(pids=[40, 3, 3, 77, 9999])
+    _check(sel, part, np.isin(part.pid, [3, 40, 77]))
+    # Same pids after the particles are reordered
+    order = np.random.RandomState(1).permutation(500)
+    for name in ["x", "vz", "pid"]:
+        setattr(part, name, getattr(part, name)[order])
+    assert sorted(sel.select(part, ["pid"])[0]) == [3., 40., 77.]
+
+
+def test_fraction_same_particles(warprun):
+    part = warp.Species(npart=20000)
+    sel = sl.ParticleSelection(fraction=0.1, seed=5)
+    pid0 = sel.select(part, ["pid"])[0]
+    assert abs(len(pid0) / 20000. - 0.1) < 0.01
+    # Same particles after time-steps, reordering and loss
+    warp.step(3)
+    keep = np.random.RandomState(2).permutation(20000)[:15000]
+    for name in ["x", "vz", "pid"]:
+        setattr(part, name, getattr(part, name)[keep])
+    pid1 = sel.select(part, ["pid"])[0]
+    assert np.array_equal(np.sort(pid1), 
+                          np.intersect1d(pid0, part.pid))
+    # Other particles with another seed
+    pid2 = sl.ParticleSelection(fraction=0.1, seed=6).select(
+            part, ["pid"])[0]
+    assert len(np.intersect1d(pid1, pid2)) < 0.2 * len(pid1)
+
+
+def test_pid_fraction():
+    pid = np.arange(1., 100001.)
+    ff = sl.pid_fraction(pid, seed=3)
+    assert np.all((ff >= 0.) & (ff < 1.))
+    assert np.array_equal(ff, sl.pid_fraction(pid.copy(), seed=3))
+    assert np.array_equal(ff[::-1], sl.pid_fraction(pid[::-1], seed=3))
+    counts = np.histogram(ff, bins=10, range=(0., 1.))[0]
+    assert np.all(np.abs(counts - 10000) < 500)
+
+
+def test_conditions_combined(warprun):
+    part = warp.Species(npart=3000)
+    arrays = _arrays(part)
+    sel = sl.ParticleSelection(stride=2, fraction=0.5, seed=1, 
+                               bbox={"x": [-1., 0.]})
+    mask = np.zeros(3000, dtype=bool)
+    mask[1::2] = True
+    mask &= sl.pid_fraction(arrays["pid"], 1) < 0.5
+    mask &= (arrays["x"] >= -1.) & (arrays["x"] <= 0.)
+    _check(sel, part, mask)
+
+
+@pytest.mark.parametrize("kw", [dict(), dict(stride=3), 
+                                dict(bbox={"vz": [1e7, 2e7]})])
+def test_out_arrays(warprun, kw):
+    part = warp.Species(npart=1000)
+    sel = sl.ParticleSelection(**kw)
+    expected = sel.select(part, NAMES)
+    sizes = []
+    buffers = [np.full(2000, np.nan) for name in NAMES]
+    def out(nn):
+        sizes.append(nn)
+        return [buf[:nn] for buf in buffers]
+    got = sel.select(part, NAMES, out=out)
+    assert sizes == [len(expected[0])]
+    for gg, ee, buf in zip(got, expected, buffers):
+        # Copied into the given arrays
+        assert gg.base is buf
+        assert np.array_equal(gg, ee)
+
+
+def test_arrays_read_once(warprun):
+    part = warp.Species(npart=100)
+    calls = []
+    getx = part.getx
+    def countx(**kw):
+        calls.append("x")
+        return getx(**kw)
+    part.getx = countx
+    sel = sl.ParticleSelection(bbox={"x": [-1., 1.]})
+    sel.select(part, ["x", "vz", "x"])
+    assert calls == ["x"]
+
+
+def test_invalid_arguments():
+    for kw in [dict(stride=0), dict(fraction=1.5), 
+               dict(bbox={"pid": [0, 1]})]:
+        with pytest.raises(AssertionError):
+            sl.ParticleSelection(**kw)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+import numpy as np
+import pytest
+
+import warp
+import asyncwriter
+import particledata as pd
+import runcontainer
+
+
+def _run_steps(nSteps, errors):
+    # The time-steps run in a thread, so a blocked step fails the test
+    def steps():
+        for i in range(nSteps):
+            try:
+                warp.step(1)
+            except IOError as err:
+                errors.append((warp.top.it, err))
+    stepper = threading.Thread(target=steps)
+    stepper.daemon = True
+    stepper.start()
+    stepper.join(10.)
+    return not stepper.is_alive()
+
+
+@pytest.mark.parametrize("nWorkers", [0, 2])
+def test_buffers_released_after_error(warprun, monkeypatch, nWorkers):
+    pointsToVTK = pd.pointsToVTK
+    def failing(fileName, *args, **kwargs):
+        if fileName.endswith("_2_ts"):
+            raise IOError("disk full")
+        return pointsToVTK(fileName, *args, **kwargs)
+    monkeypatch.setattr(pd, "pointsToVTK", failing)
+    if nWorkers > 0:
+        asyncwriter.enable(nWorkers=nWorkers)
+    part = warp.Species(npart=1000)
+    pd.vtk_data(part=part, tsstart=1, tsend=8, nBuffers=2)
+    errors = []
+    assert _run_steps(8, errors)
+    # The error is raised once, by the writing or by the next submit
+    assert len(errors) == 1 and errors[0][0] >= 2
+    asyncwriter.flush()
+    for ts in range(3, 9):
+        if ts != errors[0][0]:
+            fileName = "vtk_particle_data/vtk_particle_data_{ts}_ts.vtu"
+            assert open(fileName.format(ts=ts), "rb").read(5) == b"<?xml"
+
+
+def _energy_reference(part, vx, vy, vz):
+    # Direct gamma and kinetic energy (eV); the energy of the slow 
+    # particles by the series of gamma - 1 in b2 = (v/c)**2
+    b2 = (vx * vx + vy * vy + vz * vz) / warp.clight**2
+    gam = 1. / np.sqrt(1. - b2)
+    series = b2 * (0.5 + b2 * (3. / 8. + b2 * (5. / 16. + b2 * 35. / 128.)))
+    gm1 = np.where(b2 < 1e-4, series, gam - 1.)
+    return gam, gm1 * part.mass * warp.clight**2 / warp.echarge
+
+
+def test_energy_values(warprun):
+    part = warp.Species(npart=1000)
+    # From slow particles to gamma ~ 7
+    speed = np.logspace(-6., np.log10(0.99), 1000) * warp.clight
+    angle = np.random.RandomState(4).uniform(0., 0.3, 1000)
+    vx, vy, vz = (speed * np.sin(angle), speed * 0., 
+                  speed * np.cos(angle))
+    cols = {"vx": vx, "vy": vy, "vz": vz, 
+            "gamma": np.empty(1000), "ke": np.empty(1000)}
+    pd._vtk_energy(part, cols)
+    gam, ke = _energy_reference(part, vx, vy, vz)
+    assert np.allclose(cols["gamma"], gam, rtol=1e-12, atol=0.)
+    assert np.allclose(cols["ke"], ke, rtol=1e-9, atol=0.)
+    # Velocities are not changed
+    assert np.array_equal(cols["vz"], speed * np.cos(angle))
+
+
+def test_energy_of_exporter(warprun):
+    part = warp.Species(npart=1000)
+    runcontainer.enable()
+    pd.vtk_data(part=part, tsstart=2, tsend=2, 
+                pointData=["gamma", "ke", "pid"])
+    warp.step(2)
+    warprun()
+    data = runcontainer.RunContainer("run_container").read(
+            "vtk_particle_data/vtk_particle_data", ts=2)
+    order = np.argsort(data["pid"])
+    gam, ke = _energy_reference(part, part.vx, part.vy, part.vz)
+    assert np.array_equal(data["pid"][order], part.pid)
+    assert np.allclose(data["gamma"][order], gam, rtol=1e-12, atol=0.)
+    assert np.allclose(data["ke"][order], ke, rtol=1e-9, atol=0.)
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+import warp
+import particledata as pd
+
+NAMES = ["pid", "x", "y", "t", "vx", "vy", "vz"]
+STATE = ["x", "y", "z", "vx", "vy", "vz"]
+
+
+def _state(part):
+    return dict((int(pid), dict([(name, getattr(part, name)[i])
+                                  for name in STATE] +
+                                 [("t", warp.top.time)]))
+                for i, pid in enumerate(part.pid))
+
+
+def _reference(prev, cur, zPos):
+    # Crossings of each z-position found particle by particle
+    rows = [[] for zz in zPos]
+    for pid in sorted(set(prev) & set(cur)):
+        p0, p1 = prev[pid], cur[pid]
+        for i, zz in enumerate(zPos):
+            if p0["z"] < zz <= p1["z"]:
+                ff = (zz - p0["z"]) / (p1["z"] - p0["z"])
+                rows[i].append([pid] + [p0[nm] + ff * (p1[nm] - p0[nm])
+                                        for nm in NAMES[1:]])
+    return rows
+
+
+def _shuffle(part, rand, nLost):
+    # Particles lost and the others reordered, same as WARP
+    keep = rand.permutation(len(part.pid))[nLost:]
+    for name in STATE + ["pid", "w", "zold"]:
+        setattr(part, name, getattr(part, name)[keep])
+
+
+def _sorted_rows(rows):
+    rows = np.array(rows).reshape(-1, len(NAMES))
+    return rows[np.lexsort(rows.T[::-1])]
+
+
+def test_planes_match_reference(warprun):
+    part = warp.Species(npart=3000)
+    # Particles move ~0.001 m per step; some cross several planes at once
+    part.vz *= 20.
+    zPos = [0.5, 0.1, 0.5005, 0.9, 0.3]
+    detector = pd.MultiZCrossing(part, zPos)
+    planes = [detector.plane(i) for i in range(len(zPos))]
+    rand = np.random.RandomState(3)
+    expected = [[] for zz in zPos]
+    for step in range(30):
+        prev = _state(part)
+        warp.step(1)
+        cur = _state(part)
+        for i, rows in enumerate(_reference(prev, cur, zPos)):
+            expected[i] += rows
+        if step % 7 == 3:
+            _shuffle(part, rand, 50)
+        if step == 15:
+            # One plane flushed in the middle; the others are kept
+            expected[2] = []
+            planes[2].clear()
+    for i, plane in enumerate(planes):
+        got = [getattr(plane, "get" + name)() for name in NAMES]
+        assert plane.getn() == len(expected[i]) > 0
+        assert np.allclose(_sorted_rows(np.column_stack(got)),
+                           _sorted_rows(expected[i]), rtol=1e-12, atol=0.)
+
+
+def test_clear_all(warprun):
+    part = warp.Species(npart=1000)
+    detector = pd.MultiZCrossing(part, [0.2, 0.4])
+    warp.step(5)
+    assert detector.counts.sum() > 0
+    detector.clear()
+    assert [detector.plane(i).getn() for i in range(2)] == [0, 0]
+    assert len(detector.plane(0).getx()) == 0